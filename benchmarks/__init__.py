@@ -0,0 +1 @@
+# Benchmarks of JSJack. They run offline against local stand-ins of the web, the DNS and RDAP.
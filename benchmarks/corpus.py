@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+HTML corpus for the micro-benchmarks: a directory of pages (.html or .html.gz) and an index.json
+with the URL of each page.
+
+Record real pages (needs network access):
+
+    python -m benchmarks.corpus record urls.txt benchmarks/corpus
+
+Or generate synthetic pages of several sizes, shaped like the pages of real sites:
+
+    python -m benchmarks.corpus generate benchmarks/corpus --pages 20
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+
+INDEX_FILE = "index.json"
+
+# Number of elements of the generated pages, by size
+SIZES = {
+    "small": {"links": 40, "scripts": 8, "iframes": 1, "images": 10, "paragraphs": 10},
+    "medium": {"links": 300, "scripts": 30, "iframes": 3, "images": 60, "paragraphs": 80},
+    "large": {"links": 2000, "scripts": 120, "iframes": 10, "images": 300, "paragraphs": 600},
+}
+
+THIRD_PARTY_HOSTS = (
+    [f"static.benchcdn{i}.com" for i in range(40)] +
+    [f"cdn{i}.benchcdn{i}.net" for i in range(10)] +
+    [f"static.benchdead{i}.com" for i in range(5)] +
+    [f"js.benchcname{i}.com" for i in range(5)]
+)
+
+def generate_page(host: str, size: str, rnd: random.Random) -> str:
+    counts = SIZES[size]
+    head = [f"<title>{host} {size}</title>", '<meta charset="utf-8">', '<link rel="stylesheet" href="/css/site.css">']
+    for i in range(counts["scripts"]):
+        kind = rnd.random()
+        if kind < 0.3:
+            head.append(f'<script src="/js/app{i}.js"></script>')
+        elif kind < 0.5:
+            head.append(f'<script>window.dataLayer = window.dataLayer || []; dataLayer.push({{"id": {i}}});</script>')
+        else:
+            head.append(f'<script async src="https://{rnd.choice(THIRD_PARTY_HOSTS)}/lib{i}.js?v={rnd.randrange(100)}"></script>')
+
+    body = ['<nav><ul>']
+    for i in range(counts["links"]):
+        kind = rnd.random()
+        if kind < 0.5:
+            href = f"/section{rnd.randrange(20)}/page{i}.html"
+        elif kind < 0.7:
+            href = f"https://{host}/article/{rnd.randrange(10 ** 6)}?ref=nav&amp;utm_source=home"
+        elif kind < 0.8:
+            href = f"https://www.external{rnd.randrange(200)}.org/"
+        elif kind < 0.87:
+            href = f"#section{i}"
+        elif kind < 0.92:
+            href = f"/downloads/file{i}.{rnd.choice(('pdf', 'zip', 'exe', 'jpg', 'docx'))}"
+        elif kind < 0.96:
+            href = f"mailto:contact{i}@{host}"
+        else:
+            href = "javascript:void(0)"
+        body.append(f'<li class="item item-{i % 7}"><a href="{href}" title="Link {i}">Link number {i}</a></li>')
+    body.append('</ul></nav><main>')
+    for i in range(counts["paragraphs"]):
+        body.append(f'<div class="row"><p>Paragraph {i}. ' + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * rnd.randrange(2, 8) + '</p></div>')
+        if i < counts["images"]:
+            body.append(f'<img src="https://{rnd.choice(THIRD_PARTY_HOSTS)}/img/{i}.png" alt="image {i}">')
+        if i < counts["iframes"]:
+            body.append(f'<iframe src="https://{rnd.choice(THIRD_PARTY_HOSTS)}/embed/{i}" width="560" height="315"></iframe>')
+    body.append('<svg><a href="https://www.external1.org/logo"><circle r="5"/></a></svg></main>')
+    return f"<!DOCTYPE html><html><head>{''.join(head)}</head><body>{''.join(body)}</body></html>"
+
+def generate(directory: str, pages: int = 10, seed: int = 1) -> dict:
+    """
+    Write `pages` synthetic pages of each size to directory.
+    :return: The index of the corpus (file name -> URL).
+    """
+    os.makedirs(directory, exist_ok=True)
+    rnd = random.Random(seed)
+    index = {}
+    for size in SIZES:
+        for i in range(pages):
+            host = f"www.benchsite{i}.com"
+            file_name = f"{size}-{i}.html"
+            with open(os.path.join(directory, file_name), "w") as f:
+                f.write(generate_page(host, size, rnd))
+            index[file_name] = f"https://{host}/{size}/{i}.html"
+    with open(os.path.join(directory, INDEX_FILE), "w") as f:
+        json.dump(index, f, indent=2)
+    return index
+
+def record(urls: list, directory: str, timeout: float = 15) -> dict:
+    """
+    Download the pages and add them (gzipped) to the corpus in directory.
+    :return: The index of the corpus (file name -> URL).
+    """
+    import requests
+
+    os.makedirs(directory, exist_ok=True)
+    index = load_index(directory)
+    for url in urls:
+        try:
+            response = requests.get(url, timeout=timeout)
+        except requests.RequestException as e:
+            print(f"Skipping {url}: {e}")
+            continue
+        if "html" not in response.headers.get("Content-Type", ""):
+            print(f"Skipping {url}: not an HTML page")
+            continue
+        file_name = f"page-{len(index)}.html.gz"
+        with gzip.open(os.path.join(directory, file_name), "wb") as f:
+            f.write(response.content)
+        index[file_name] = response.url
+    with open(os.path.join(directory, INDEX_FILE), "w") as f:
+        json.dump(index, f, indent=2)
+    return index
+
+def load_index(directory: str) -> dict:
+    index_path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path) as f:
+        return json.load(f)
+
+def load(directory: str) -> list:
+    """
+    Read the corpus.
+    :return: A list of (url, body) sorted by file name.
+    """
+    pages = []
+    for file_name, url in sorted(load_index(directory).items()):
+        opener = gzip.open if file_name.endswith(".gz") else open
+        with opener(os.path.join(directory, file_name), "rb") as f:
+            pages.append((url, f.read()))
+    return pages
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the HTML corpus of the micro-benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    generate_parser = subparsers.add_parser("generate", help="Generate synthetic pages")
+    generate_parser.add_argument("directory")
+    generate_parser.add_argument("--pages", type=int, default=10, help="Pages of each size")
+    generate_parser.add_argument("--seed", type=int, default=1)
+    record_parser = subparsers.add_parser("record", help="Download real pages")
+    record_parser.add_argument("urls", help="File with one URL per line")
+    record_parser.add_argument("directory")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        index = generate(args.directory, args.pages, args.seed)
+    else:
+        with open(args.urls) as f:
+            index = record([line.strip() for line in f if line.strip()], args.directory)
+    print(f"{len(index)} pages in {args.directory}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark: run jsjack.py against a local synthetic web, DNS server and RDAP server.
+
+    python -m benchmarks.e2e --sites 20 --pages 50 --output results.json
+
+The results are written as JSON so they can be compared between commits.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.stubs import SiteGraph, VerificationLog, start_dns, start_rdap, start_sites
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def run(args) -> dict:
+    graph = SiteGraph(
+        sites=args.sites, pages=args.pages, fanout=args.fanout, third_party=args.third_party,
+        cdns=args.cdns, dead=args.dead, cnames=args.cnames,
+        dead_seeds=args.dead_seeds, cname_seeds=args.cname_seeds, slow_sites=args.slow_sites
+    )
+    log = VerificationLog()
+    dns_server, resolver, dns_port = start_dns(log, delay=args.dns_delay)
+    sites_server, sites_port = start_sites(graph, dead_delay=args.dead_delay, slow_delay=args.slow_delay)
+    rdap_server, rdap_port = start_rdap(log)
+
+    workdir = tempfile.mkdtemp(prefix="jsjack-bench-")
+    os.makedirs(os.path.join(workdir, "output"))
+    seeds_file = os.path.join(workdir, "seeds.txt")
+    with open(seeds_file, "w") as f:
+        f.write("\n".join(graph.seeds()) + "\n")
+    stats_file = os.path.join(workdir, "stats.json")
+
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+        "SCRAPY_SETTINGS_MODULE": "subdomain_takeover.settings",
+        # The site server works as a proxy, so the crawled hosts do not need to resolve
+        "http_proxy": f"http://127.0.0.1:{sites_port}",
+        "no_proxy": "127.0.0.1,localhost",
+    })
+    command = [
+        sys.executable, os.path.join(ROOT, "jsjack.py"),
+        "-u", seeds_file,
+        "-d", f"127.0.0.1:{dns_port}",
+        "-L", args.logging_level,
+        "-E", str(args.depth),
+        "-P", str(args.max_pages),
+        "-s", "DOWNLOAD_DELAY=0",
+        "-s", "HTTPCACHE_ENABLED=False",
+        "-s", f"CONCURRENT_REQUESTS={args.concurrency}",
+        "-s", f"RDAP_URL=http://127.0.0.1:{rdap_port}",
+        "-s", "WHOIS_FALLBACK=False",
+        "-s", f"STATS_FILE={stats_file}",
+    ] + [arg for setting in args.set for arg in ("-s", setting)]
+
+    launched = datetime.now(timezone.utc)
+    started = time.monotonic()
+    with open(os.path.join(workdir, "jsjack.log"), "w") as log_file:
+        process = subprocess.run(command, cwd=workdir, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    elapsed = time.monotonic() - started
+
+    dns_server.stop()
+    sites_server.shutdown()
+    rdap_server.shutdown()
+
+    stats = {}
+    if os.path.exists(stats_file):
+        with open(stats_file) as f:
+            stats = json.load(f)
+    pages = stats.get("response_received_count", 0)
+    # Time from the launch of jsjack.py until the spider opens (set by Scrapy when the crawl starts)
+    startup = None
+    if stats.get("start_time"):
+        startup = (datetime.fromisoformat(stats["start_time"]) - launched).total_seconds()
+    latencies = log.latencies()
+    # Prefer the latencies measured by jsjack.py itself, the stubs only see the queries from outside
+    latency_p50 = stats.get("metrics/verification/p50", percentile(latencies, 50))
+    latency_p99 = stats.get("metrics/verification/p99", percentile(latencies, 99))
+    return {
+        "returncode": process.returncode,
+        "workdir": workdir,
+        "elapsed_secs": elapsed,
+        "startup_secs": startup,
+        "pages": pages,
+        "pages_per_sec": pages / elapsed if elapsed else None,
+        "items": stats.get("item_scraped_count", 0),
+        "verifications": len(latencies),
+        "verifications_per_sec": len(latencies) / elapsed if elapsed else None,
+        "verification_latency_p50": latency_p50,
+        "verification_latency_p99": latency_p99,
+        "dns_queries": resolver.queries,
+        "rdap_queries": rdap_server.requests,
+        "pages_not_modified": sites_server.not_modified,
+        "reactor_stalls": stats.get("reactor_stalls", 0),
+        "requests_deferred": stats.get("deadlines/requests_deferred", 0),
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        "metrics": {name: value for name, value in stats.items() if name.startswith("metrics/")},
+        "parameters": vars(args),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of jsjack.py")
+    parser.add_argument('--sites', type=int, default=20, help='Number of sites (seeds)')
+    parser.add_argument('--pages', type=int, default=50, help='Pages of each site')
+    parser.add_argument('--fanout', type=int, default=5, help='Links to other pages in each page')
+    parser.add_argument('--third-party', type=int, default=4, help='Third-party scripts embedded in each page')
+    parser.add_argument('--cdns', type=int, default=50, help='Registered third-party domains')
+    parser.add_argument('--dead', type=int, default=10, help='Unregistered third-party domains')
+    parser.add_argument('--cnames', type=int, default=10, help='Third-party hosts with a CNAME to an unregistered domain')
+    parser.add_argument('--dead-seeds', type=int, default=0, help='Seeds that do not resolve anymore')
+    parser.add_argument('--cname-seeds', type=int, default=0, help='Seeds with a CNAME to an unregistered domain')
+    parser.add_argument('--dead-delay', type=float, default=10, help='Seconds the site server holds the requests to hosts that do not resolve')
+    parser.add_argument('--slow-sites', type=int, default=0, help='Sites answering every page after --slow-delay seconds')
+    parser.add_argument('--slow-delay', type=float, default=5, help='Seconds the slow sites take to answer')
+    parser.add_argument('--depth', type=int, default=2, help='Maximum crawling depth')
+    parser.add_argument('--max-pages', type=int, default=15, help='Maximum pages per site')
+    parser.add_argument('--concurrency', type=int, default=32, help='CONCURRENT_REQUESTS')
+    parser.add_argument('--dns-delay', type=float, default=0, help='Seconds the DNS server waits before answering')
+    parser.add_argument('-s', '--set', action='append', default=[], metavar='NAME=VALUE', help='Extra Scrapy setting for jsjack.py')
+    parser.add_argument('-L', '--logging-level', default='INFO', help='Logging level of jsjack.py')
+    parser.add_argument('-o', '--output', help='Write the results to this JSON file instead of stdout')
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark of the representation of the findings: JsLink items against compact Finding records.
+
+    python -m benchmarks.findings --findings 1000000 --output results.json
+
+The findings are generated like those of a crawl: the same third-party hosts and scripts are embedded
+by many pages, and every string is a new object, as when it is extracted from a page.
+"""
+import argparse
+import gc
+import json
+import pickle
+import random
+import sys
+import time
+import tracemalloc
+
+from subdomain_takeover.items import Finding, JsLink, LinkType
+
+LINK_TYPES = [LinkType.JAVASCRIPT] * 6 + [LinkType.IFRAME] * 2 + [LinkType.FRAME, LinkType.IMAGE]
+
+def generate_items(count: int, pages_per_site: int, scripts: int, hosts: int, seed: int = 1):
+    """
+    Yield count JsLink items, 20 per page.
+    """
+    rnd = random.Random(seed)
+    parent_url = parent_host = None
+    for i in range(count):
+        if i % 20 == 0:
+            page = i // 20
+            parent_host = f"www.site{page // pages_per_site}.com"
+            # The items of a page share the URL of the response
+            parent_url = f"https://{parent_host}/section/page{page}.html"
+        script = rnd.randrange(scripts)
+        host = script % hosts
+        item = JsLink()
+        item['parent_url'] = parent_url
+        item['parent_domain'] = f"{parent_host}"
+        item['hijackable_domain'] = f"static.thirdparty{host}.com"
+        item['script_domain_fld'] = f"thirdparty{host}.com"
+        item['embedded_url'] = f"https://static.thirdparty{host}.com/js/lib{script}.js"
+        item['hijackable'] = host % 50 == 0
+        item['cname_hijackable'] = False
+        item['type'] = LINK_TYPES[script % len(LINK_TYPES)]
+        yield item
+
+def measure(build, count: int) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    findings = build()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    batch = findings[:500]
+    result = {
+        'mb': round(current / 1024 ** 2, 1),
+        'peak_mb': round(peak / 1024 ** 2, 1),
+        'bytes_per_finding': round(current / count, 1),
+        'build_secs': round(elapsed, 2),
+        'pickled_bytes_per_500': len(pickle.dumps(batch, protocol=pickle.HIGHEST_PROTOCOL)),
+    }
+    del findings, batch
+    gc.collect()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory of JsLink items against Finding records")
+    parser.add_argument('--findings', type=int, default=1000000, help='Number of findings')
+    parser.add_argument('--pages-per-site', type=int, default=50, help='Pages crawled on each site (20 findings per page)')
+    parser.add_argument('--scripts', type=int, default=50000, help='Distinct embedded URLs')
+    parser.add_argument('--hosts', type=int, default=5000, help='Distinct embedded hosts')
+    parser.add_argument('-o', '--output', help='Write the results to this JSON file instead of stdout')
+    args = parser.parse_args()
+
+    def items():
+        return generate_items(args.findings, args.pages_per_site, args.scripts, args.hosts)
+
+    jslink = measure(lambda: list(items()), args.findings)
+    finding = measure(lambda: [Finding.from_jslink(item) for item in items()], args.findings)
+
+    # Conversion rates, without tracing
+    sample = list(generate_items(min(args.findings, 100000), args.pages_per_site, args.scripts, args.hosts))
+    started = time.perf_counter()
+    compact = [Finding.from_jslink(item) for item in sample]
+    from_jslink_secs = time.perf_counter() - started
+    started = time.perf_counter()
+    for record in compact:
+        record.to_jslink()
+    to_jslink_secs = time.perf_counter() - started
+
+    results = {
+        'findings': args.findings,
+        'jslink': jslink,
+        'finding': finding,
+        'memory_reduction': round(jslink['mb'] / finding['mb'], 2) if finding['mb'] else None,
+        'from_jslink_per_sec': round(len(sample) / from_jslink_secs),
+        'to_jslink_per_sec': round(len(sample) / to_jslink_secs),
+        'parameters': vars(args),
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks of the per-page CPU path of the spider over an HTML corpus (see benchmarks/corpus.py),
+with the DNS and RDAP lookups stubbed:
+
+    python -m benchmarks.micro --corpus benchmarks/corpus --save-baseline baseline.json
+    python -m benchmarks.micro --corpus benchmarks/corpus --baseline baseline.json
+
+Every benchmark reports pages/s (best of --repeat passes over the corpus) and the KB allocated
+per page (mean peak of traced memory). With --baseline, the results are compared with a previous run.
+Without --corpus, a synthetic corpus is generated in a temporary directory.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from urllib.parse import urlparse
+
+from dnslib import DNSRecord
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import HtmlResponse
+from scrapy.settings import Settings
+
+from benchmarks import corpus
+from benchmarks.stubs import ScriptedResolver, VerificationLog, is_dead
+
+def stub_network(hijacker):
+    """
+    Answer the DNS and RDAP lookups of the hijacker locally, like the stub servers of the e2e benchmark.
+    The DNS answers are cached, as DomainHijacker does.
+    """
+    resolver = ScriptedResolver(VerificationLog())
+    answers = {}
+
+    def query_dns(name: str) -> DNSRecord:
+        answer = answers.get(name)
+        if answer is None:
+            answer = answers[name] = resolver.resolve(DNSRecord.question(name), None)
+        return answer
+
+    hijacker._query_dns = query_dns
+    hijacker.whois_rdap.is_registered = lambda fld: not is_dead(fld)
+
+def create_spider(workdir: str):
+    from subdomain_takeover.spiders.takeover import TakeoverSpider
+
+    settings = Settings()
+    settings.setmodule('subdomain_takeover.settings')
+    settings.set('RDAP_URL', 'http://127.0.0.1:9')
+    settings.set('WHOIS_FALLBACK', False)
+    settings.set('DISCORD_WEBHOOK', None)
+    os.makedirs(os.path.join(workdir, 'output'), exist_ok=True)
+    seeds_file = os.path.join(workdir, 'seeds.txt')
+    with open(seeds_file, 'w') as f:
+        f.write('https://www.benchsite0.com/\n')
+    spider = TakeoverSpider(urls=seeds_file, settings=settings)
+    # Set by the crawler in a real run, the middlewares read it
+    spider.settings = settings
+    stub_network(spider.hijacker)
+    return spider
+
+def reset(spider):
+    spider.safe_fld.clear()
+    spider.hijackable_fld.clear()
+    spider.pages_counter.clear()
+    spider.items_counter.clear()
+    if spider.trap_detector:
+        spider.trap_detector.patterns.clear()
+        spider.trap_detector.references.clear()
+        spider.trap_detector.saturated.clear()
+
+def response_of(page) -> HtmlResponse:
+    url, body = page
+    return HtmlResponse(url=url, body=body, encoding='utf-8')
+
+def prepare(spider, pages: list) -> dict:
+    """
+    Input of each benchmark for every page of the corpus.
+    """
+    from subdomain_takeover.middlewares import BlockBinaryFilesMiddleware, DomainLimitDownloaderMiddleware
+    from subdomain_takeover.spiders.takeover import get_fld
+
+    urls = []
+    requests = []
+    for page in pages:
+        response = response_of(page)
+        urls.append(
+            [response.urljoin(href) for href in response.xpath('//a/@href').getall()] +
+            [response.urljoin(src) for src in response.xpath('//script/@src | //iframe/@src | //frame/@src').getall()]
+        )
+        requests.append(spider._get_links_in_response(response))
+    reset(spider)
+
+    # The CNAME records of the hosts are checked once per host in a thread, not on the per-page path
+    spider.checked_hosts.update(urlparse(url).netloc.lower() for url, _ in pages)
+
+    block_binary = BlockBinaryFilesMiddleware()
+    domain_limit = DomainLimitDownloaderMiddleware()
+
+    def parse(page):
+        for _ in spider.parse(response_of(page)):
+            pass
+
+    def process_requests(page_requests):
+        for request in page_requests:
+            try:
+                block_binary.process_request(request, spider)
+                domain_limit.process_request(request, spider)
+            except IgnoreRequest:
+                pass
+
+    def fld_of(page_urls):
+        for url in page_urls:
+            get_fld(url)
+
+    return {
+        'parse': (parse, pages),
+        'get_links_in_response': (lambda page: spider._get_links_in_response(response_of(page)), pages),
+        'get_remote_source_items': (lambda page: spider._get_remote_source_items(response_of(page)), pages),
+        'get_fld': (fld_of, urls),
+        'middlewares': (process_requests, requests),
+    }
+
+def measure(spider, function, inputs: list, repeat: int) -> dict:
+    # Warm up the caches (DNS answers, public suffix list...) like in a running crawl
+    for page_input in inputs:
+        function(page_input)
+
+    best = None
+    for _ in range(repeat):
+        reset(spider)
+        started = time.perf_counter()
+        for page_input in inputs:
+            function(page_input)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    reset(spider)
+    allocated = 0
+    tracemalloc.start()
+    for page_input in inputs:
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        function(page_input)
+        allocated += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+
+    return {
+        'pages_per_sec': round(len(inputs) / best, 2) if best else None,
+        'alloc_kb_per_page': round(allocated / len(inputs) / 1024, 2),
+    }
+
+def compare(results: dict, baseline: dict) -> dict:
+    """
+    Ratio of the results to the baseline (> 1 is faster for pages/s, < 1 is leaner for the allocations).
+    """
+    comparison = {}
+    for name, result in results.items():
+        previous = baseline.get('benchmarks', {}).get(name)
+        if not previous:
+            continue
+        comparison[name] = {
+            metric: round(result[metric] / previous[metric], 3)
+            for metric in ('pages_per_sec', 'alloc_kb_per_page')
+            if result.get(metric) and previous.get(metric)
+        }
+    return comparison
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the per-page path of the spider")
+    parser.add_argument('-c', '--corpus', help='Corpus directory (default: a generated synthetic corpus)')
+    parser.add_argument('--pages', type=int, default=10, help='Pages of each size of the generated corpus')
+    parser.add_argument('-b', '--benchmark', action='append', help='Run only this benchmark (may be repeated)')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='Passes over the corpus, the best one is reported')
+    parser.add_argument('--baseline', help='Compare the results with this baseline file')
+    parser.add_argument('--save-baseline', help='Save the results to this file, to be used as baseline later')
+    parser.add_argument('-L', '--logging-level', default='ERROR', help='Logging level of the spider')
+    parser.add_argument('-o', '--output', help='Write the results to this JSON file instead of stdout')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.logging_level.upper())
+    workdir = tempfile.mkdtemp(prefix="jsjack-micro-")
+    corpus_dir = args.corpus
+    if not corpus_dir:
+        corpus_dir = os.path.join(workdir, 'corpus')
+        corpus.generate(corpus_dir, args.pages)
+    pages = corpus.load(corpus_dir)
+    if not pages:
+        parser.error(f"no pages in the corpus {corpus_dir}")
+
+    # The spider reads and writes its domain lists in the working directory
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        spider = create_spider(workdir)
+        benchmarks = prepare(spider, pages)
+        results = {}
+        for name, (function, inputs) in benchmarks.items():
+            if args.benchmark and name not in args.benchmark:
+                continue
+            results[name] = measure(spider, function, inputs, args.repeat)
+    finally:
+        os.chdir(cwd)
+
+    output = {
+        'corpus': corpus_dir,
+        'pages': len(pages),
+        'corpus_kb': round(sum(len(body) for _, body in pages) / 1024, 1),
+        'benchmarks': results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            output['baseline'] = args.baseline
+            output['compared_to_baseline'] = compare(results, json.load(f))
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(output, f, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+if __name__ == '__main__':
+    main()
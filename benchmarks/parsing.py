@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the parser pool (PARSER_WORKERS): pages/s of the links and remote sources extraction
+in the crawling process, and in pools of 1, 2, 4... processes, over an HTML corpus (see benchmarks/corpus.py).
+
+    python -m benchmarks.parsing --corpus benchmarks/corpus --workers 1 2 4 8 --output results.json
+
+Besides the throughput, every run reports the time the submitting thread (the reactor, in a crawl)
+spends on each page: the whole parsing in the crawling process, only the handover to the pool otherwise.
+Without --corpus, a synthetic corpus is generated in a temporary directory.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from benchmarks import corpus
+from subdomain_takeover.spiders.utils.parsing import ParserPool, extract_page
+
+def measure_inline(pages: list, passes: int, scan_images: bool) -> dict:
+    started = time.perf_counter()
+    for _ in range(passes):
+        for url, body in pages:
+            extract_page(url, body, 'utf-8', scan_images)
+    elapsed = time.perf_counter() - started
+    total = len(pages) * passes
+    return {
+        'pages_per_sec': round(total / elapsed, 2),
+        'submit_ms_per_page': round(elapsed / total * 1000, 3),
+    }
+
+def measure_pool(pages: list, passes: int, scan_images: bool, workers: int, slot_bytes: int) -> dict:
+    pool = ParserPool(workers=workers, scan_images=scan_images, slot_bytes=slot_bytes)
+    pool.start()
+    try:
+        # Warm up the workers (imports, lxml)
+        wait([pool.submit(url, body, 'utf-8') for url, body in pages[:workers * 2]])
+        pool.pages = pool.copied = 0
+
+        pending = set()
+        submitting = 0
+        started = time.perf_counter()
+        for _ in range(passes):
+            for url, body in pages:
+                # Keep every block of shared memory busy, like the concurrent requests of a crawl
+                if len(pending) >= pool.slots:
+                    _, pending = wait(pending, return_when=FIRST_COMPLETED)
+                submit_started = time.perf_counter()
+                pending.add(pool.submit(url, body, 'utf-8'))
+                submitting += time.perf_counter() - submit_started
+        wait(pending)
+        elapsed = time.perf_counter() - started
+    finally:
+        pool.close()
+    total = len(pages) * passes
+    return {
+        'pages_per_sec': round(total / elapsed, 2),
+        'submit_ms_per_page': round(submitting / total * 1000, 3),
+        'bodies_copied': pool.copied,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Pages/s of the parsing with pools of processes of several sizes")
+    parser.add_argument('-c', '--corpus', help='Corpus directory (default: a generated synthetic corpus)')
+    parser.add_argument('--pages', type=int, default=10, help='Pages of each size of the generated corpus')
+    parser.add_argument('-w', '--workers', type=int, nargs='+', help='Pool sizes (default: 1, 2, 4... up to the number of CPUs)')
+    parser.add_argument('-p', '--passes', type=int, default=5, help='Passes over the corpus of every run')
+    parser.add_argument('--scan-images', action='store_true', help='Also extract the styles, images and SVG links')
+    parser.add_argument('--slot-bytes', type=int, default=2 * 1024 * 1024, help='PARSER_SLOT_BYTES')
+    parser.add_argument('-o', '--output', help='Write the results to this JSON file instead of stdout')
+    args = parser.parse_args()
+
+    corpus_dir = args.corpus
+    if not corpus_dir:
+        corpus_dir = os.path.join(tempfile.mkdtemp(prefix="jsjack-parsing-"), 'corpus')
+        corpus.generate(corpus_dir, args.pages)
+    pages = corpus.load(corpus_dir)
+    if not pages:
+        parser.error(f"no pages in the corpus {corpus_dir}")
+
+    pool_sizes = args.workers
+    if not pool_sizes:
+        pool_sizes = [1]
+        while pool_sizes[-1] * 2 <= (os.cpu_count() or 1):
+            pool_sizes.append(pool_sizes[-1] * 2)
+
+    inline = measure_inline(pages, args.passes, args.scan_images)
+    pools = {}
+    for workers in pool_sizes:
+        result = measure_pool(pages, args.passes, args.scan_images, workers, args.slot_bytes)
+        result['speedup'] = round(result['pages_per_sec'] / inline['pages_per_sec'], 2)
+        pools[str(workers)] = result
+
+    output = {
+        'corpus': corpus_dir,
+        'pages': len(pages),
+        'corpus_kb': round(sum(len(body) for _, body in pages) / 1024, 1),
+        'cpus': os.cpu_count(),
+        'inline': inline,
+        'pools': pools,
+        'parameters': vars(args),
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+if __name__ == '__main__':
+    main()
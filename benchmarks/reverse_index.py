@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the reverse index (report.py embedders): pairs/s indexed, bytes per (parent, embedded) pair
+and the latency of the lookups of the parent domains, and of the first 100 parent URLs, of embedded domains.
+
+    python -m benchmarks.reverse_index --pairs 10000000 --output results.json
+
+The pairs are generated like those of a crawl: 20 embedded resources per page, on hosts whose popularity
+follows a power law (a few CDNs embedded by most sites, a long tail embedded by a few of them).
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from subdomain_takeover.spiders.utils.reverse_index import ReverseIndex
+
+def generate_pairs(count: int, pages_per_site: int, hosts: int, seed: int = 1):
+    """
+    Yield count (parent_url, parent_domain, host, fld) pairs, 20 per page.
+    """
+    rnd = random.Random(seed)
+    for i in range(count):
+        page = i // 20
+        parent_domain = f"www.site{page // pages_per_site}.com"
+        host = int(hosts ** rnd.random()) - 1
+        yield (f"https://{parent_domain}/section/page{page}.html", parent_domain, f"static{host % 3}.thirdparty{host}.com", f"thirdparty{host}.com")
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def measure_lookups(index: ReverseIndex, domains: list, urls: bool) -> dict:
+    latencies = []
+    results = 0
+    for domain in domains:
+        started = time.perf_counter()
+        results += sum(1 for _ in index.iter_parents(domain, urls=urls, limit=100 if urls else -1))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        'lookups': len(domains),
+        'results_per_lookup': round(results / len(domains), 1),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(max(latencies), 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Size and lookup latency of the reverse index")
+    parser.add_argument('--pairs', type=int, default=2000000, help='Number of (parent URL, embedded host) pairs')
+    parser.add_argument('--pages-per-site', type=int, default=50, help='Pages crawled on each site (20 pairs per page)')
+    parser.add_argument('--hosts', type=int, default=100000, help='Distinct embedded hosts')
+    parser.add_argument('--runs', type=int, default=1, help='Index the same pairs this number of times, like repeated crawls')
+    parser.add_argument('--lookups', type=int, default=1000, help='Lookups of random embedded FLDs and hosts')
+    parser.add_argument('--flush-pairs', type=int, default=100000, help='REVERSE_INDEX_FLUSH_PAIRS')
+    parser.add_argument('--index-file', help='Path of the index (default: a temporary file, removed at the end)')
+    parser.add_argument('-o', '--output', help='Write the results to this JSON file instead of stdout')
+    args = parser.parse_args()
+
+    index_file = args.index_file or os.path.join(tempfile.mkdtemp(prefix="jsjack-index-"), 'reverse_index.db')
+    index = ReverseIndex(index_file, flush_pairs=args.flush_pairs)
+    started = time.perf_counter()
+    for _ in range(args.runs):
+        for pair in generate_pairs(args.pairs, args.pages_per_site, args.hosts):
+            index.add(*pair)
+        index.flush()
+    build_secs = time.perf_counter() - started
+    size = sum(os.path.getsize(f"{index_file}{suffix}") for suffix in ('', '-wal') if os.path.exists(f"{index_file}{suffix}"))
+
+    rnd = random.Random(2)
+    # The most embedded FLDs (the head of the power law) and random ones
+    flds = [f"thirdparty{host}.com" for host in range(10)] + [f"thirdparty{rnd.randrange(args.hosts)}.com" for _ in range(args.lookups)]
+    hosts = [f"static{host % 3}.thirdparty{host}.com" for host in (rnd.randrange(args.hosts) for _ in range(args.lookups))]
+    results = {
+        'pairs': args.pairs * args.runs,
+        'build_secs': round(build_secs, 1),
+        'pairs_per_sec': round(args.pairs * args.runs / build_secs),
+        'index_mb': round(size / 1024 / 1024, 1),
+        'bytes_per_pair': round(size / args.pairs, 1),
+        'fld_domains': measure_lookups(index, flds, urls=False),
+        'host_domains': measure_lookups(index, hosts, urls=False),
+        'fld_urls_first_100': measure_lookups(index, flds, urls=True),
+        'parameters': vars(args),
+    }
+    index.close()
+    if not args.index_file:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(f"{index_file}{suffix}"):
+                os.remove(f"{index_file}{suffix}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+# Local stand-ins of the web sites, the DNS server and the RDAP server used by the benchmarks
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+from dnslib import RR, QTYPE, RCODE, A, CNAME
+from dnslib.server import DNSServer, BaseResolver, DNSLogger
+
+class SiteGraph:
+    """
+    Synthetic web: `sites` sites with `pages` pages each. Every page links to `fanout` pages of the same site
+    and embeds `third_party` scripts hosted in other domains, picked from three pools:
+    - registered CDNs (the DNS resolves them)
+    - dead domains (NXDOMAIN and unknown to RDAP)
+    - CNAME hosts (registered, but their CNAME points to a dead domain)
+    Optionally, `dead_seeds` seeds do not resolve and `cname_seeds` seeds have a CNAME to a dead domain, like
+    the stale entries of a target list, and the first `slow_sites` sites answer slowly (see start_sites).
+    """
+    def __init__(self, sites: int = 20, pages: int = 50, fanout: int = 5, third_party: int = 4,
+                 cdns: int = 50, dead: int = 10, cnames: int = 10, seed: int = 1,
+                 dead_seeds: int = 0, cname_seeds: int = 0, slow_sites: int = 0):
+        self.sites = sites
+        self.slow_sites = slow_sites
+        self.dead_seeds = dead_seeds
+        self.cname_seeds = cname_seeds
+        self.pages = pages
+        self.fanout = fanout
+        self.third_party = third_party
+        self.seed = seed
+        self.scripts = (
+            [f"http://static.benchcdn{i}.com/lib.js" for i in range(cdns)] +
+            [f"http://static.benchdead{i}.com/lib.js" for i in range(dead)] +
+            [f"http://js.benchcname{i}.com/lib.js" for i in range(cnames)]
+        )
+
+    def seeds(self) -> list:
+        return (
+            [f"http://www.benchsite{i}.com/" for i in range(self.sites)] +
+            [f"http://www.benchdeadseed{i}.com/" for i in range(self.dead_seeds)] +
+            [f"http://www.benchcnameseed{i}.com/" for i in range(self.cname_seeds)]
+        )
+
+    @staticmethod
+    def resolves(host: str) -> bool:
+        """
+        False for the hosts without an address: the dead domains and the CNAME hosts.
+        """
+        labels = host.split(':')[0].split('.')
+        return not is_dead(host.split(':')[0]) and not (len(labels) > 2 and labels[-2].startswith('benchcname'))
+
+    def slow(self, host: str) -> bool:
+        return host.split(':')[0] in {f"www.benchsite{i}.com" for i in range(self.slow_sites)}
+
+    def page(self, host: str, path: str) -> bytes:
+        digits = path.strip('/').lstrip('p')
+        page = int(digits) if digits.isdigit() else 0
+        rnd = random.Random(f"{self.seed}-{host}-{page}")
+        links = [f'<a href="http://{host}/p{rnd.randrange(self.pages)}">page</a>' for _ in range(self.fanout)]
+        scripts = [f'<script src="{rnd.choice(self.scripts)}"></script>' for _ in range(self.third_party)]
+        return (
+            "<html><head><title>%s</title>%s</head><body><h1>%s page %d</h1>%s<p>%s</p></body></html>" % (
+                host, "".join(scripts), host, page, "".join(links), "lorem ipsum " * 50
+            )
+        ).encode()
+
+def is_dead(name: str) -> bool:
+    labels = name.rstrip('.').split('.')
+    return len(labels) >= 2 and labels[-2].startswith(('benchdead', 'benchgone'))
+
+class VerificationLog:
+    """
+    Time of the first query and of the last answer (DNS or RDAP) seen for every name,
+    to approximate how long the verification of each domain took.
+    """
+    def __init__(self):
+        self.times = {}
+
+    def started(self, name: str):
+        self.times.setdefault(name.rstrip('.').lower(), [time.monotonic(), None])
+
+    def answered(self, name: str):
+        entry = self.times.get(name.rstrip('.').lower())
+        if entry:
+            entry[1] = time.monotonic()
+
+    def latencies(self) -> list:
+        return sorted(end - start for start, end in self.times.values() if end is not None)
+
+class ScriptedResolver(BaseResolver):
+    """
+    Resolve bench*.com names: NXDOMAIN for the dead domains, a CNAME to a dead domain for the CNAME hosts
+    and 127.0.0.1 for everything else. Optionally waits `delay` seconds before answering.
+    """
+    def __init__(self, log: VerificationLog, delay: float = 0):
+        self.log = log
+        self.delay = delay
+        self.queries = 0
+
+    def resolve(self, request, handler):
+        self.queries += 1
+        self.log.started(str(request.q.qname))
+        if self.delay:
+            time.sleep(self.delay)
+        reply = request.reply()
+        qname = str(request.q.qname)
+        labels = qname.rstrip('.').split('.')
+        if is_dead(qname):
+            reply.header.rcode = RCODE.NXDOMAIN
+        elif len(labels) >= 2 and labels[-2].startswith('benchcname') and len(labels) > 2:
+            target = f"x.benchgone{labels[-2][len('benchcname'):]}.com"
+            reply.add_answer(RR(request.q.qname, QTYPE.CNAME, rdata=CNAME(target), ttl=60))
+        else:
+            reply.add_answer(RR(request.q.qname, QTYPE.A, rdata=A("127.0.0.1"), ttl=60))
+        self.log.answered(qname)
+        return reply
+
+class _QuietDNSLogger(DNSLogger):
+    def __init__(self):
+        super().__init__(log="-request,-reply,-truncated,-error,-recv,-send,-data")
+
+def start_dns(log: VerificationLog, port: int = 0, delay: float = 0):
+    resolver = ScriptedResolver(log, delay)
+    server = DNSServer(resolver, port=port, address="127.0.0.1", logger=_QuietDNSLogger())
+    server.start_thread()
+    return server, resolver, server.server.server_address[1]
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionError:
+            # The crawler gave up on the request (DOWNLOAD_TIMEOUT) or is shutting down
+            pass
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class _SiteHandler(_Handler):
+    """
+    Serve the site graph. Used as an HTTP proxy, so the request line has the absolute URL.
+    Pages have an ETag and are answered with a 304 when it matches If-None-Match (the pages never change).
+    """
+    def do_GET(self):
+        url = urlparse(self.path)
+        host = url.netloc or self.headers.get("Host", "")
+        self.server.requests += 1
+        if not self.server.graph.resolves(host):
+            # Like a host that does not answer: the crawler waits until DOWNLOAD_TIMEOUT
+            time.sleep(self.server.dead_delay)
+            self._send(504, b"", "text/html")
+            return
+        if url.path.endswith(".js"):
+            self._send(200, b"var x = 1;", "application/javascript")
+            return
+        if self.server.graph.slow(host):
+            time.sleep(self.server.slow_delay)
+        body = self.server.graph.page(host, url.path)
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            self.server.not_modified += 1
+            self._send(304, b"", "text/html", {"ETag": etag})
+        else:
+            self._send(200, body, "text/html", {"ETag": etag})
+
+class _RDAPHandler(_Handler):
+    """Answer RDAP domain queries: 404 for the dead domains, a minimal record for everything else."""
+    def do_GET(self):
+        self.server.requests += 1
+        domain = self.path.rstrip('/').split('/')[-1]
+        if is_dead(domain):
+            self._send(404, b'{"errorCode": 404}', "application/rdap+json")
+        else:
+            self._send(200, json.dumps({"objectClassName": "domain", "ldhName": domain}).encode(), "application/rdap+json")
+        self.server.log.answered(domain)
+
+def _start_http(handler, **attributes):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    server.requests = 0
+    for name, value in attributes.items():
+        setattr(server, name, value)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+def start_sites(graph: SiteGraph, dead_delay: float = 0, slow_delay: float = 0):
+    return _start_http(_SiteHandler, graph=graph, not_modified=0, dead_delay=dead_delay, slow_delay=slow_delay)
+
+def start_rdap(log: VerificationLog):
+    return _start_http(_RDAPHandler, log=log)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the bulk verification mode: run `jsjack.py --verify` on generated hostnames against
+the local DNS and RDAP servers of the benchmarks.
+
+    python -m benchmarks.verify --inputs 100000 --output results.json
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.e2e import ROOT
+from benchmarks.stubs import VerificationLog, start_dns, start_rdap
+
+def hostnames(count: int, dead_ratio: float, cname_ratio: float):
+    """
+    Hosts of distinct first level domains: registered ones, unregistered ones and CNAMEs to unregistered domains.
+    """
+    dead_every = int(1 / dead_ratio) if dead_ratio else 0
+    cname_every = int(1 / cname_ratio) if cname_ratio else 0
+    for i in range(count):
+        if dead_every and i % dead_every == 0:
+            yield f"static.benchdead{i}.com"
+        elif cname_every and i % cname_every == 1:
+            yield f"https://js.benchcname{i}.com/lib.js"
+        else:
+            yield f"static.benchcdn{i}.com"
+
+def run(args) -> dict:
+    log = VerificationLog()
+    dns_server, resolver, dns_port = start_dns(log, delay=args.dns_delay)
+    rdap_server, rdap_port = start_rdap(log)
+
+    workdir = tempfile.mkdtemp(prefix="jsjack-verify-bench-")
+    os.makedirs(os.path.join(workdir, "output"))
+    inputs_file = os.path.join(workdir, "inputs.txt")
+    with open(inputs_file, "w") as f:
+        for host in hostnames(args.inputs, args.dead_ratio, args.cname_ratio):
+            f.write(host + "\n")
+    output_file = os.path.join(workdir, "output", "verify_links.jsonl")
+
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+        "SCRAPY_SETTINGS_MODULE": "subdomain_takeover.settings",
+    })
+    command = [
+        sys.executable, os.path.join(ROOT, "jsjack.py"),
+        "--verify", inputs_file,
+        "-d", f"127.0.0.1:{dns_port}",
+        "-L", args.logging_level,
+        "-s", f"RDAP_URL=http://127.0.0.1:{rdap_port}",
+        "-s", "WHOIS_FALLBACK=False",
+        "-s", f"VERIFY_CONCURRENCY={args.concurrency}",
+        "-s", f"VERIFY_OUTPUT_FILE={output_file}",
+    ] + [arg for setting in args.set for arg in ("-s", setting)]
+
+    started = time.monotonic()
+    with open(os.path.join(workdir, "jsjack.log"), "w") as log_file:
+        process = subprocess.run(command, cwd=workdir, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    elapsed = time.monotonic() - started
+
+    dns_server.stop()
+    rdap_server.shutdown()
+
+    findings = hijackable = 0
+    if os.path.exists(output_file):
+        with open(output_file) as f:
+            for line in f:
+                findings += 1
+                hijackable += json.loads(line)["hijackable"]
+    return {
+        "returncode": process.returncode,
+        "workdir": workdir,
+        "elapsed_secs": elapsed,
+        "inputs": args.inputs,
+        "checks_per_sec": args.inputs / elapsed if elapsed else None,
+        "findings": findings,
+        "hijackable": hijackable,
+        "dns_queries": resolver.queries,
+        "rdap_queries": rdap_server.requests,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        "parameters": vars(args),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of jsjack.py --verify")
+    parser.add_argument('--inputs', type=int, default=100000, help='Number of hostnames to verify')
+    parser.add_argument('--dead-ratio', type=float, default=0.05, help='Ratio of unregistered domains')
+    parser.add_argument('--cname-ratio', type=float, default=0.05, help='Ratio of CNAMEs to unregistered domains')
+    parser.add_argument('--concurrency', type=int, default=128, help='VERIFY_CONCURRENCY')
+    parser.add_argument('--dns-delay', type=float, default=0, help='Seconds the DNS server waits before answering')
+    parser.add_argument('-s', '--set', action='append', default=[], metavar='NAME=VALUE', help='Extra Scrapy setting for jsjack.py')
+    parser.add_argument('-L', '--logging-level', default='INFO', help='Logging level of jsjack.py')
+    parser.add_argument('-o', '--output', help='Write the results to this JSON file instead of stdout')
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+if __name__ == '__main__':
+    main()
@@ -2,10 +2,20 @@
 import argparse
 import logging
 import sys
+import time
+from datetime import datetime
 
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings
 from  subdomain_takeover.spiders.takeover import TakeoverSpider  
+from subdomain_takeover.spiders.utils.database import TakeoverDatabase
+from subdomain_takeover.spiders.utils.discord import TakeoverDiscordBot
+from subdomain_takeover.spiders.utils.hijacker import DomainHijacker
+from subdomain_takeover.spiders.utils.profiler import CrawlProfiler
+from subdomain_takeover.spiders.utils.recheck import DomainRechecker
+from subdomain_takeover.spiders.utils.verify import BulkVerifier
+from subdomain_takeover.spiders.utils import domains
+from subdomain_takeover.spiders.utils.snapshots import PUBLIC_SUFFIX_LIST, RDAP_BOOTSTRAP, check_snapshots, snapshot_path, update_snapshots
 
 def get_logging_level(level_str: str="DEBUG") -> int:
     return {
@@ -17,12 +27,119 @@ def get_logging_level(level_str: str="DEBUG") -> int:
         'CRITICAL': logging.CRITICAL
     }.get(level_str.upper(), logging.INFO)
 
+def build_hijacker(settings):
+    """
+    DomainHijacker (and its Discord bot) configured from the settings, for the modes that do not crawl.
+    """
+    snapshots_dir = settings.get('SNAPSHOTS_DIR', 'data')
+    check_snapshots(snapshots_dir)
+    domains.configure(
+        suffix_list_file=snapshot_path(snapshots_dir, PUBLIC_SUFFIX_LIST),
+        cache_dir=snapshot_path(snapshots_dir, 'tldextract')
+    )
+    discord = TakeoverDiscordBot(
+        webhook_url=settings.get('DISCORD_WEBHOOK'),
+        use_proxies=bool(settings.get('PROXIES')),
+        settings=settings
+    )
+    hijacker = DomainHijacker(
+        dns_server=settings.get('DNS_SERVER', '8.8.8.8'),
+        dns_timeout=settings.get('DNS_TIMEOUT', 5),
+        headers=settings.get('HEADERS', {}),
+        discord=discord,
+        dns_port=settings.getint('DNS_PORT', 53),
+        rdap_url=settings.get('RDAP_URL'),
+        whois_fallback=settings.getbool('WHOIS_FALLBACK', True),
+        rdap_bootstrap_file=snapshot_path(snapshots_dir, RDAP_BOOTSTRAP),
+        dns_cache_size=settings.getint('DNS_CACHE_SIZE', 10000),
+        probe_timeout=settings.getint('PROBE_TIMEOUT', 10)
+    )
+    return discord, hijacker
+
+def start_profiler(settings):
+    if not settings.get('PROFILE_FILE'):
+        return None
+    profiler = CrawlProfiler(settings.get('PROFILE_FILE'), top=settings.getint('PROFILE_TOP', 10))
+    profiler.start()
+    return profiler
+
+def recheck(settings, args):
+    """
+    Check again the domains found by previous runs, without crawling.
+    """
+    logging.basicConfig(level=get_logging_level(args.logging_level), format='%(asctime)s [%(name)s] %(levelname)s: %(message)s')
+    discord, hijacker = build_hijacker(settings)
+    try:
+        database = TakeoverDatabase(settings, read_only=True)
+    except (FileNotFoundError, ValueError) as e:
+        logging.getLogger('domain-rechecker').warning(f"[RECHECK] {e}")
+        database = None
+    rechecker = DomainRechecker(
+        hijacker,
+        database=database,
+        verdicts_file=settings.get('RECHECK_VERDICTS_FILE', 'output/verdicts.jsonl'),
+        max_age_secs=settings.getfloat('RECHECK_MAX_AGE', 7 * 24 * 3600),
+        concurrency=settings.getint('RECHECK_CONCURRENCY', 64),
+        max_hosts_per_fld=settings.getint('RECHECK_MAX_HOSTS_PER_FLD', 50)
+    )
+    profiler = start_profiler(settings)
+    rechecker.run()
+    if database is not None:
+        database.close()
+    discord.close()
+    if profiler:
+        profiler.stop()
+
+def verify(settings, args):
+    """
+    Check the hostnames or URLs of a file (or stdin), without crawling.
+    """
+    logging.basicConfig(level=get_logging_level(args.logging_level), format='%(asctime)s [%(name)s] %(levelname)s: %(message)s')
+    discord, hijacker = build_hijacker(settings)
+    d = datetime.now().strftime("%d%m%Y_%H%M%S")
+    verifier = BulkVerifier(
+        hijacker,
+        output_file=settings.get('VERIFY_OUTPUT_FILE') or f"output/{d}_verify_links.jsonl",
+        concurrency=settings.getint('VERIFY_CONCURRENCY', 128),
+        cache_size=settings.getint('VERIFY_CACHE_SIZE', 100000),
+        compression=settings.get('OUTPUT_COMPRESSION')
+    )
+    profiler = start_profiler(settings)
+    verifier.run(args.verify)
+    discord.close()
+    if profiler:
+        profiler.stop()
+
+def monitor(process, settings, crawl_kwargs: dict):
+    """
+    Crawl every MONITOR_INTERVAL seconds (counted from the start of each crawl) until interrupted.
+    """
+    interval = settings.getfloat('MONITOR_INTERVAL', 24 * 3600)
+    logger = logging.getLogger('monitor')
+
+    def crawl():
+        started = time.monotonic()
+        logger.info("[MONITOR] Starting a new crawl")
+        deferred = process.crawl(TakeoverSpider, **crawl_kwargs)
+
+        def schedule_next(result):
+            # Imported here, the reactor is installed by the first crawl
+            from twisted.internet import reactor
+            delay = max(0, interval - (time.monotonic() - started))
+            logger.info(f"[MONITOR] Crawl finished in {time.monotonic() - started:.0f}s. Next crawl in {delay:.0f}s")
+            reactor.callLater(delay, crawl)
+            return result
+        deferred.addBoth(schedule_next)
+
+    crawl()
+    process.start(stop_after_crawl=False)
+
 def main():
     parser = argparse.ArgumentParser(description="Run Scrapy takeover spider with options.")
     cog = parser.add_argument_group('Crawling Intensity',
         'Options to control the crawling intensity, such as maximum depth, items per field, and pages per field.')
-    parser.add_argument('-u', '--urls', required=True)
-    parser.add_argument('-d', '--dns')
+    parser.add_argument('-u', '--urls')
+    parser.add_argument('-d', '--dns', help='DNS server to resolve the domains, optionally with the port (e.g. 127.0.0.1:5353)')
     parser.add_argument('-A', '--allow-fld', action='store_true')
     parser.add_argument('-S', '--scrapeops-key')
     parser.add_argument('-D', '--discord-webhook')
@@ -30,10 +147,34 @@ def main():
                         help='Set the logging level (default: DEBUG)')
     parser.add_argument('-i', '--scan-images', action='store_true',
                         help='Enable scanning of image items to detect if they are hosted in an orphan domain')
+    parser.add_argument('-R', '--recheck', action='store_true',
+                        help='Do not crawl. Check again the registration and CNAMEs of the domains found by previous runs')
+    parser.add_argument('-V', '--verify', metavar='FILE',
+                        help='Do not crawl. Check the hostnames or URLs of FILE (- for stdin), one per line')
+    parser.add_argument('-W', '--archives', nargs='+', metavar='PATH',
+                        help='Do not crawl. Parse the pages of these WARC (.warc, .warc.gz) or HAR (.har, .har.gz) files, or of the archives in these directories')
+    parser.add_argument('-M', '--monitor', nargs='?', const=0, type=float, metavar='HOURS',
+                        help='Keep running and crawl again every HOURS hours (default: MONITOR_INTERVAL setting), only checking the pages that changed and the hosts they did not embed before')
+    parser.add_argument('--recheck-max-age', type=float,
+                        help='Check again the safe domains whose verdict is older than this number of hours (default: RECHECK_MAX_AGE setting)')
+    parser.add_argument('--update-snapshots', action='store_true',
+                        help='Download the public suffix list and the RDAP bootstrap data to SNAPSHOTS_DIR and exit')
+    parser.add_argument('--profile', nargs='?', const='', metavar='FILE',
+                        help='Profile the run and write the profile to FILE (default: output/[date]_profile.prof) and a summary to FILE.txt')
+    parser.add_argument('--profile-snapshot', type=float, metavar='MINUTES',
+                        help='With --profile, also write a snapshot of the profile every MINUTES minutes')
+    parser.add_argument('-s', '--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='Set a Scrapy setting (may be repeated)')
     cog.add_argument('-E', '--max-depth')
     cog.add_argument('-I', '--max-items')
     cog.add_argument('-P', '--max-pages')
+    cog.add_argument('--fld-budget', type=float, metavar='MINUTES',
+                     help='Stop crawling a FLD this number of minutes after its first request, deferring its remaining pages (FLD_TIME_BUDGET setting)')
+    cog.add_argument('--run-budget', type=float, metavar='MINUTES',
+                     help='Stop crawling this number of minutes after the start, deferring the remaining pages (RUN_TIME_BUDGET setting)')
     args = parser.parse_args()
+    if not args.urls and not args.archives and not args.recheck and not args.verify and not args.update_snapshots:
+        parser.error("the following arguments are required: -u/--urls")
 
     # Get and modify Scrapy settings
     settings = get_project_settings()
@@ -49,11 +190,48 @@ def main():
         settings.set('MAX_PAGES_PER_FLD', args.max_pages)
     if args.max_items:
         settings.set('MAX_ITEMS_PER_FLD', args.max_items)
+    if args.fld_budget:
+        settings.set('FLD_TIME_BUDGET', args.fld_budget * 60)
+    if args.run_budget:
+        settings.set('RUN_TIME_BUDGET', args.run_budget * 60)
     if args.dns:
-        settings.set('DNS_SERVER', args.dns)
+        dns_server, _, dns_port = args.dns.partition(':')
+        args.dns = dns_server
+        settings.set('DNS_SERVER', dns_server)
+        if dns_port:
+            settings.set('DNS_PORT', int(dns_port))
+    for setting in args.set:
+        name, _, value = setting.partition('=')
+        settings.set(name, value, priority='cmdline')
+    if args.profile is not None:
+        d = datetime.now().strftime("%d%m%Y_%H%M%S")
+        settings.set('PROFILE_FILE', args.profile or f"output/{d}_profile.prof")
+    if args.profile_snapshot:
+        settings.set('PROFILE_SNAPSHOT_SECS', args.profile_snapshot * 60)
+    if args.monitor is not None:
+        settings.set('MONITOR_ENABLED', True)
+        if args.monitor:
+            settings.set('MONITOR_INTERVAL', args.monitor * 3600)
+        # The pages are revalidated with their stored validators, never served from the HTTP cache
+        settings.set('HTTPCACHE_ENABLED', False)
+    if args.recheck_max_age is not None:
+        settings.set('RECHECK_MAX_AGE', args.recheck_max_age * 3600)
+
+    if args.update_snapshots:
+        logging.basicConfig(level=get_logging_level(args.logging_level), format='%(asctime)s [%(name)s] %(levelname)s: %(message)s')
+        update_snapshots(settings.get('SNAPSHOTS_DIR', 'data'))
+        return
+
+    if args.recheck:
+        recheck(settings, args)
+        return
+
+    if args.verify:
+        verify(settings, args)
+        return
 
     process = CrawlerProcess(settings)
-    process.crawl(TakeoverSpider,
+    crawl_kwargs = dict(
         urls=args.urls,
         allow_fld=args.allow_fld,
         discord_webhook=args.discord_webhook,
@@ -63,9 +241,15 @@ def main():
         max_depth=args.max_depth,
         dns=args.dns,
         scan_images=args.scan_images,
-        logging_level=get_logging_level(args.logging_level)
+        logging_level=get_logging_level(args.logging_level),
+        archives=args.archives
     )
 
+    if args.monitor is not None:
+        monitor(process, settings, crawl_kwargs)
+        return
+
+    process.crawl(TakeoverSpider, **crawl_kwargs)
     process.start()
 
 if __name__ == '__main__':
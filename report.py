@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import json
+import sys
+
+from scrapy.utils.project import get_project_settings
+from subdomain_takeover.items import item_to_dict
+from subdomain_takeover.spiders.utils.database import TakeoverDatabase, row_to_item
+from subdomain_takeover.spiders.utils.reverse_index import ReverseIndex
+
+ITEM_FIELDS = ['parent_url', 'parent_domain', 'hijackable_domain', 'embedded_url', 'script_domain_fld', 'hijackable', 'cname_hijackable', 'type']
+
+def hijackable_rows(db: TakeoverDatabase, args):
+    for fld, parents, links in db.iter_hijackable_flds(args.limit, args.offset):
+        yield {'script_domain_fld': fld, 'parent_domains': parents, 'links': links}
+
+def parent_rows(db: TakeoverDatabase, args):
+    for row in db.iter_parent_findings(args.domain, args.limit, args.offset):
+        yield item_to_dict(row_to_item(row))
+
+def changes_rows(db: TakeoverDatabase, args):
+    since_run = args.since_run
+    if since_run is None:
+        # Changes of the last finished run, compared with the runs before it
+        since_run = db.finished_run_id(offset=1) or 0
+    for row in db.iter_changes(since_run, args.gone, args.limit, args.offset):
+        item = item_to_dict(row_to_item(row))
+        item['change'] = row[8]
+        yield item
+
+def _reverse_index(db: TakeoverDatabase, args, read_only: bool = False) -> ReverseIndex:
+    return ReverseIndex(args.index_file or db.settings.get('REVERSE_INDEX_FILE', 'output/reverse_index.db'), read_only=read_only)
+
+def embedders_rows(db: TakeoverDatabase, args):
+    index = _reverse_index(db, args, read_only=True)
+    try:
+        if args.urls:
+            for parent_url, parent_domain in index.iter_parents(args.domain, urls=True, limit=args.limit, offset=args.offset):
+                yield {'parent_domain': parent_domain, 'parent_url': parent_url}
+        else:
+            for parent_domain in index.iter_parents(args.domain, limit=args.limit, offset=args.offset):
+                yield {'parent_domain': parent_domain}
+    finally:
+        index.close()
+
+def index_rows(db: TakeoverDatabase, args):
+    """
+    Index the findings already stored in the database (e.g. saved before the reverse index existed).
+    """
+    index = _reverse_index(db, args)
+    count = 0
+    for parent_url, parent_domain, host, fld in db.connection.execute(
+            'SELECT parent_url, parent_domain, hijackable_domain, script_domain_fld FROM js_links'):
+        index.add(parent_url, parent_domain, host, fld)
+        count += 1
+    index.close()
+    yield {'index_file': index.db_name, 'pairs': count}
+
+def write_rows(rows, fields: list, output_format: str, output):
+    if output_format == 'csv':
+        writer = csv.DictWriter(output, fieldnames=fields)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+    else:
+        for row in rows:
+            output.write(json.dumps(row) + '\n')
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the results stored in the takeover database.")
+    parser.add_argument('-b', '--database', help='Path to the sqlite3 database (default: DATABASE_FILE setting)')
+    parser.add_argument('-f', '--format', choices=['jsonl', 'csv'], default='jsonl',
+                        help='Output format (default: jsonl)')
+    parser.add_argument('-o', '--output', help='Write the results to this file instead of stdout')
+    parser.add_argument('-l', '--limit', type=int, default=-1, help='Maximum number of results to return')
+    parser.add_argument('-s', '--offset', type=int, default=0, help='Number of results to skip')
+    subparsers = parser.add_subparsers(dest='query', required=True)
+
+    hijackable = subparsers.add_parser('hijackable', help='Every hijackable FLD with the number of parent domains embedding it')
+    hijackable.set_defaults(rows=hijackable_rows, fields=['script_domain_fld', 'parent_domains', 'links'])
+
+    parent = subparsers.add_parser('parent', help='Every finding of one parent domain')
+    parent.add_argument('domain', help='Parent domain (e.g. www.example.com)')
+    parent.set_defaults(rows=parent_rows, fields=ITEM_FIELDS)
+
+    changes = subparsers.add_parser('changes', help='Findings first seen, or whose verdict changed, in the last run')
+    changes.add_argument('-r', '--since-run', type=int,
+                         help='Return the findings first seen, or whose verdict changed, after this run id (default: the run before the last one)')
+    changes.add_argument('-g', '--gone', action='store_true',
+                         help='Also return the findings seen by that run but not by the later ones (including those of the pages not crawled again)')
+    changes.set_defaults(rows=changes_rows, fields=ITEM_FIELDS + ['change'])
+
+    embedders = subparsers.add_parser('embedders', help='Every parent domain embedding resources of a domain (all its hosts for a FLD)')
+    embedders.add_argument('domain', help='Embedded FLD or host (e.g. example-cdn.com or static.example-cdn.com)')
+    embedders.add_argument('-u', '--urls', action='store_true', help='Return every parent URL instead of the parent domains')
+    embedders.add_argument('-i', '--index-file', help='Path to the reverse index (default: REVERSE_INDEX_FILE setting)')
+    embedders.set_defaults(rows=embedders_rows, fields=['parent_domain', 'parent_url'])
+
+    index = subparsers.add_parser('index', help='Add the findings stored in the database to the reverse index')
+    index.add_argument('-i', '--index-file', help='Path to the reverse index (default: REVERSE_INDEX_FILE setting)')
+    index.set_defaults(rows=index_rows, fields=['index_file', 'pairs'])
+    args = parser.parse_args()
+
+    settings = get_project_settings()
+    if args.database:
+        settings.set('DATABASE_FILE', args.database)
+    try:
+        # Only read: the database is neither created nor upgraded
+        db = TakeoverDatabase(settings, read_only=True)
+    except (FileNotFoundError, ValueError) as e:
+        parser.exit(1, f"{parser.prog}: error: {e}\n")
+
+    output = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        write_rows(args.rows(db, args), args.fields, args.format, output)
+    except FileNotFoundError as e:
+        parser.exit(1, f"{parser.prog}: error: {e}\n")
+    finally:
+        if args.output:
+            output.close()
+        db.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+# Define here your Scrapy extensions
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/extensions.html
+
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from twisted.internet import task
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from subdomain_takeover.spiders.utils.metrics import metrics
+from subdomain_takeover.spiders.utils.profiler import CrawlProfiler
+
+class StatsFileExtension:
+    """
+    Write the stats of the crawl as JSON to the file STATS_FILE when the spider closes,
+    so runs can be compared by other tools (e.g. the benchmarks).
+    """
+    def __init__(self, stats, stats_file: str):
+        self.stats = stats
+        self.stats_file = stats_file
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        stats_file = crawler.settings.get('STATS_FILE')
+        if not stats_file:
+            raise NotConfigured
+        extension = cls(crawler.stats, stats_file)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def spider_closed(self, spider, reason):
+        stats = dict(self.stats.get_stats())
+        stats['finish_reason'] = reason
+        with open(self.stats_file, 'w') as f:
+            json.dump(stats, f, indent=2, default=str, sort_keys=True)
+
+class MetricsExtension:
+    """
+    Copy the hot path metrics (see spiders/utils/metrics.py) to the Scrapy stats every METRICS_STATS_INTERVAL seconds
+    and when the spider closes. If METRICS_PORT is set, the metrics are also served in the Prometheus text format
+    at http://METRICS_HOST:METRICS_PORT/metrics.
+    """
+    def __init__(self, stats, interval: float, host: str, port: int):
+        self.stats = stats
+        self.interval = interval
+        self.host = host
+        self.port = port
+        self.task = None
+        self.server = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('METRICS_ENABLED', True):
+            raise NotConfigured
+        extension = cls(
+            crawler.stats,
+            crawler.settings.getfloat('METRICS_STATS_INTERVAL', 30),
+            crawler.settings.get('METRICS_HOST', '127.0.0.1'),
+            crawler.settings.getint('METRICS_PORT', 0)
+        )
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def spider_opened(self, spider):
+        if self.interval:
+            self.task = task.LoopingCall(metrics.to_stats, self.stats)
+            self.task.start(self.interval, now=False)
+        if self.port:
+            self.server = ThreadingHTTPServer((self.host, self.port), _MetricsHandler)
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, name="metrics-endpoint", daemon=True).start()
+            spider.logger.info(f"[METRICS] Serving metrics at http://{self.host}:{self.port}/metrics")
+
+    def spider_closed(self, spider, reason):
+        if self.task and self.task.running:
+            self.task.stop()
+        metrics.to_stats(self.stats)
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.to_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class ProfilerExtension:
+    """
+    Profile the crawl when PROFILE_FILE is set (see spiders/utils/profiler.py). The profile and its summary
+    are written when the spider closes and, if PROFILE_SNAPSHOT_SECS is set, every PROFILE_SNAPSHOT_SECS seconds
+    to numbered files, so long runs can be inspected while they go on.
+    """
+    def __init__(self, profiler: CrawlProfiler, snapshot_secs: float):
+        self.profiler = profiler
+        self.snapshot_secs = snapshot_secs
+        self.task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        profile_file = crawler.settings.get('PROFILE_FILE')
+        if not profile_file:
+            raise NotConfigured
+        profiler = CrawlProfiler(profile_file, top=crawler.settings.getint('PROFILE_TOP', 10))
+        extension = cls(profiler, crawler.settings.getfloat('PROFILE_SNAPSHOT_SECS', 0))
+        # Start now, before the reactor runs, so every callback and thread is profiled
+        profiler.start()
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def spider_opened(self, spider):
+        if self.snapshot_secs:
+            self.task = task.LoopingCall(self.profiler.snapshot)
+            self.task.start(self.snapshot_secs, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.task and self.task.running:
+            self.task.stop()
+        self.profiler.stop()
+
+class ReactorStallExtension:
+    """
+    Detect the callbacks blocking the reactor. A timer ticks on the reactor every REACTOR_STALL_INTERVAL seconds
+    and a watchdog thread checks that it keeps ticking. When the reactor does not tick for more than
+    REACTOR_STALL_THRESHOLD seconds, the watchdog samples the stack of the reactor thread, logs it and counts the
+    stall by call site in the stats (reactor_stalls/<file>:<line>(<function>)). The lag of every tick is observed
+    in the reactor_lag metric.
+    """
+    def __init__(self, stats, interval: float, threshold: float):
+        self.stats = stats
+        self.interval = interval
+        self.threshold = threshold
+        self.task = None
+        self.reactor_thread = None
+        self.last_tick = None
+        self.reported_tick = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        threshold = crawler.settings.getfloat('REACTOR_STALL_THRESHOLD', 0.5)
+        if threshold <= 0:
+            raise NotConfigured
+        extension = cls(crawler.stats, crawler.settings.getfloat('REACTOR_STALL_INTERVAL', 0.1), threshold)
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def spider_opened(self, spider):
+        self.logger = spider.logger
+        self.reactor_thread = threading.get_ident()
+        self.last_tick = time.monotonic()
+        self.task = task.LoopingCall(self.tick)
+        self.task.start(self.interval, now=False)
+        threading.Thread(target=self.watch, name="reactor-watchdog", daemon=True).start()
+
+    def spider_closed(self, spider, reason):
+        self._stop.set()
+        if self.task and self.task.running:
+            self.task.stop()
+
+    def tick(self):
+        now = time.monotonic()
+        lag = max(0.0, now - self.last_tick - self.interval)
+        metrics.observe('reactor_lag', lag)
+        if self.reported_tick == self.last_tick:
+            self.logger.warning(f"[STALL] The reactor was blocked for {lag:.2f} seconds")
+            self.stats.max_value('reactor_stall_max_secs', round(lag, 3))
+        self.last_tick = now
+
+    def watch(self):
+        while not self._stop.wait(self.interval / 2):
+            last_tick = self.last_tick
+            blocked = time.monotonic() - last_tick - self.interval
+            if blocked < self.threshold or self.reported_tick == last_tick:
+                continue
+            frame = sys._current_frames().get(self.reactor_thread)
+            if frame is None:
+                continue
+            # Report each stall once, with the stack sampled while it is still blocked
+            self.reported_tick = last_tick
+            site = self.call_site(frame)
+            self.stats.inc_value('reactor_stalls')
+            self.stats.inc_value(f'reactor_stalls/{site}')
+            stack = ''.join(traceback.format_stack(frame))
+            self.logger.warning(f"[STALL] The reactor is blocked for more than {blocked:.2f} seconds in {site}:\n{stack}")
+
+    @staticmethod
+    def call_site(frame) -> str:
+        """
+        Innermost frame of the project in the stack (the code calling the blocking function), or the innermost frame.
+        """
+        innermost = frame
+        while frame is not None:
+            if 'subdomain_takeover' in frame.f_code.co_filename.replace(os.sep, '/'):
+                break
+            frame = frame.f_back
+        frame = frame or innermost
+        filename = frame.f_code.co_filename.replace(os.sep, '/')
+        if 'subdomain_takeover/' in filename:
+            filename = 'subdomain_takeover/' + filename.split('subdomain_takeover/', 1)[1]
+        else:
+            filename = os.path.basename(filename)
+        return f"{filename}:{frame.f_lineno}({frame.f_code.co_name})"
@@ -4,6 +4,7 @@
 # https://docs.scrapy.org/en/latest/topics/items.html
 
 import scrapy
+import sys
 from scrapy import Item,Field
 from enum import Enum,auto
 
@@ -28,6 +29,100 @@ class JsLink(Item):
     script_domain_fld=Field()   # The First level domain of the script that can be hijacked (e.g. hijackable.com)
     type=Field()                # Type of inclusion of this script in the parent page (e.g. LinkType.IFRAME, LinkType.FRAME, LinkType.DIRECT, LinkType.JAVASCRIPT)
 
+def item_to_dict(item: JsLink) -> dict:
+    """
+    Convert a JsLink item to a JSON serializable dictionary.
+    """
+    item_dict = dict(item)
+    if 'type' in item_dict and hasattr(item_dict['type'], 'name'):
+        item_dict['type'] = item_dict['type'].name
+    return item_dict
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+class Finding:
+    """
+    Compact form of a JsLink, to keep large numbers of findings in memory.
+    The strings are interned, so the domains and URLs repeated across findings are stored once,
+    and the two booleans and the LinkType are stored as small integers.
+    """
+    __slots__ = ('parent_url', 'parent_domain', 'hijackable_domain', 'embedded_url', 'script_domain_fld', 'flags', 'link_type')
+
+    HIJACKABLE = 1
+    CNAME_HIJACKABLE = 2
+
+    def __init__(
+            self,
+            parent_url: str = None,
+            parent_domain: str = None,
+            hijackable_domain: str = None,
+            embedded_url: str = None,
+            script_domain_fld: str = None,
+            flags: int = 0,
+            link_type: int = LinkType.UNKNOWN.value
+        ):
+        self.parent_url = _intern(parent_url)
+        self.parent_domain = _intern(parent_domain)
+        self.hijackable_domain = _intern(hijackable_domain)
+        self.embedded_url = _intern(embedded_url)
+        self.script_domain_fld = _intern(script_domain_fld)
+        self.flags = flags
+        self.link_type = link_type
+
+    @property
+    def hijackable(self) -> bool:
+        return bool(self.flags & self.HIJACKABLE)
+
+    @property
+    def cname_hijackable(self) -> bool:
+        return bool(self.flags & self.CNAME_HIJACKABLE)
+
+    @property
+    def type(self) -> LinkType:
+        return LinkType(self.link_type)
+
+    @classmethod
+    def from_jslink(cls, item: JsLink) -> "Finding":
+        link_type = item.get('type')
+        return cls(
+            item.get('parent_url'),
+            item.get('parent_domain'),
+            item.get('hijackable_domain'),
+            item.get('embedded_url'),
+            item.get('script_domain_fld'),
+            (cls.HIJACKABLE if item.get('hijackable') else 0) | (cls.CNAME_HIJACKABLE if item.get('cname_hijackable') else 0),
+            link_type.value if link_type is not None else LinkType.UNKNOWN.value
+        )
+
+    def to_jslink(self) -> JsLink:
+        item = JsLink()
+        item['parent_url'] = self.parent_url
+        item['parent_domain'] = self.parent_domain
+        item['hijackable_domain'] = self.hijackable_domain
+        item['script_domain_fld'] = self.script_domain_fld
+        item['embedded_url'] = self.embedded_url
+        item['hijackable'] = self.hijackable
+        item['cname_hijackable'] = self.cname_hijackable
+        item['type'] = self.type
+        return item
+
+    def _astuple(self) -> tuple:
+        return (self.parent_url, self.parent_domain, self.hijackable_domain, self.embedded_url, self.script_domain_fld, self.flags, self.link_type)
+
+    def __reduce__(self):
+        # Pickled as a plain tuple, interned again when loaded
+        return (Finding, self._astuple())
+
+    def __eq__(self, other):
+        return isinstance(other, Finding) and self._astuple() == other._astuple()
+
+    def __hash__(self):
+        return hash(self._astuple())
+
+    def __repr__(self):
+        return f"Finding({self.embedded_url!r} in {self.parent_url!r}, {self.type.name}, hijackable={self.hijackable}, cname_hijackable={self.cname_hijackable})"
+
 class SubdomainTakeoverItem(scrapy.Item):
     # define the fields for your item here like:
     # name = scrapy.Field()
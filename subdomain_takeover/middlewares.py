@@ -4,16 +4,25 @@
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
 # useful for handling different item types with a single interface
-from tldextract import extract as tld_extract
+import json
+import math
+import os
+import time
 from subdomain_takeover.items import JsLink
-from scrapy.exceptions import IgnoreRequest
+from scrapy import signals
+from scrapy.downloadermiddlewares.offsite import OffsiteMiddleware
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet import task
+from twisted.python.failure import Failure
+import scrapy_user_agents.middlewares
+from scrapy_user_agents import user_agent_picker
 from subdomain_takeover.spiders.takeover import TakeoverSpider
+from subdomain_takeover.spiders.utils.domains import get_fld
+from subdomain_takeover.spiders.utils.snapshots import USER_AGENTS, read_snapshot, snapshot_path, write_snapshot
+from subdomain_takeover.spiders.utils.writer import BufferedFileWriter
 from urllib.parse import urlparse
 
-def get_fld(url):
-    ext=tld_extract(url)
-    return f"{ext.domain}.{ext.suffix}"
-
 class DomainLimitDownloaderMiddleware:
     def process_request(self, request, spider: TakeoverSpider):
         fld = get_fld(request.url)
@@ -33,6 +42,181 @@ class DomainLimitDownloaderMiddleware:
             spider.logger.debug(f"[DomainLimitDownloaderMiddleware] Skipping {request.url} (pages limit reached for {fld} ({pages_count} > {pages_limit})")
             raise IgnoreRequest
         
+class SeedOffsiteMiddleware(OffsiteMiddleware):
+    """
+    Offsite filter of Scrapy checking the hosts against the set of allowed domains of the spider, which the spider
+    fills as the seeds are read, instead of a regular expression built from all the seeds when the spider opens.
+    A host is allowed when it, or one of its parent domains, is in the set (or the set is empty, as in Scrapy).
+    """
+    def spider_opened(self, spider):
+        pass
+
+    def should_follow(self, request, spider) -> bool:
+        allowed_domains = getattr(spider, 'allowed_domains', None)
+        if not allowed_domains:
+            return True
+        host = urlparse_cached(request).hostname or ""
+        while host:
+            if host in allowed_domains:
+                return True
+            host = host.partition('.')[2]
+        return False
+
+class ConditionalRequestMiddleware:
+    """
+    In monitor mode, revalidate the pages of the previous runs with If-None-Match and If-Modified-Since,
+    and drop those that did not change (304 Not Modified) before they reach the spider.
+    """
+    def process_request(self, request, spider: TakeoverSpider):
+        page_state = getattr(spider, 'page_state', None)
+        if page_state is None:
+            return None
+        etag, last_modified = page_state.validators(request.url)
+        if etag:
+            request.headers.setdefault('If-None-Match', etag)
+        if last_modified:
+            request.headers.setdefault('If-Modified-Since', last_modified)
+        return None
+
+    def process_response(self, request, response, spider: TakeoverSpider):
+        page_state = getattr(spider, 'page_state', None)
+        if page_state is None:
+            return response
+        if response.status == 304:
+            page_state.not_modified(request.url)
+            spider.crawler.stats.inc_value('monitor/not_modified')
+            raise IgnoreRequest(f"Not modified since the last run: {request.url}")
+        if 200 <= response.status < 300:
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            page_state.save_validators(
+                request.url,
+                etag.decode('latin-1') if etag else None,
+                last_modified.decode('latin-1') if last_modified else None
+            )
+            spider.crawler.stats.inc_value('monitor/modified')
+        return response
+
+class DomainDeadlineMiddleware:
+    """
+    Give every first level domain FLD_TIME_BUDGET seconds from its first request, and the whole run RUN_TIME_BUDGET
+    seconds. The requests of a FLD past its deadline are not downloaded but written to DEFERRED_URLS_FILE, to be
+    crawled by a follow-up run, and the downloads are given at most the time left before the deadline (instead of
+    DOWNLOAD_TIMEOUT). Every DEADLINE_CHECK_SECS, the requests of the expired FLDs still waiting in the downloader
+    (e.g. for DOWNLOAD_DELAY) are deferred too, so the crawl ends once every FLD finished or met its deadline.
+    """
+    # Minimum download timeout of the requests sent just before their deadline
+    MIN_DOWNLOAD_TIMEOUT = 1
+
+    def __init__(self, crawler, fld_budget: float, run_budget: float, deferred_file: str, check_secs: float):
+        self.crawler = crawler
+        self.fld_budget = fld_budget
+        self.run_budget = run_budget
+        self.deferred_file = deferred_file
+        self.check_secs = check_secs
+        self.run_started = time.monotonic()
+        self.fld_started = {}
+        self.cut_short = set()
+        self.deferred = None
+        self.task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        fld_budget = settings.getfloat('FLD_TIME_BUDGET', 0)
+        run_budget = settings.getfloat('RUN_TIME_BUDGET', 0)
+        if not fld_budget and not run_budget:
+            raise NotConfigured
+        middleware = cls(
+            crawler,
+            fld_budget,
+            run_budget,
+            settings.get('DEFERRED_URLS_FILE', 'output/deferred_urls.txt'),
+            settings.getfloat('DEADLINE_CHECK_SECS', 5)
+        )
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider):
+        self.run_started = time.monotonic()
+        self.deferred = BufferedFileWriter(self.deferred_file, append=False, logger=spider.logger)
+        if self.check_secs:
+            self.task = task.LoopingCall(self._defer_waiting_requests, spider)
+            self.task.start(self.check_secs, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.task and self.task.running:
+            self.task.stop()
+        if self.deferred:
+            self.deferred.close()
+            if self.cut_short:
+                spider.logger.info(f"[DEADLINE] {self.deferred.lines_written} requests of {len(self.cut_short)} FLDs cut short deferred to {self.deferred.current_path}")
+
+    def _deadline(self, fld: str) -> float:
+        """
+        :return: The deadline of the FLD, without the FLD budget if it made no request yet.
+        """
+        deadlines = [math.inf]
+        if self.fld_budget and fld in self.fld_started:
+            deadlines.append(self.fld_started[fld] + self.fld_budget)
+        if self.run_budget:
+            deadlines.append(self.run_started + self.run_budget)
+        return min(deadlines)
+
+    def _defer(self, request, fld: str, spider: TakeoverSpider, now: float):
+        stats = self.crawler.stats
+        if self.run_budget and now >= self.run_started + self.run_budget and not spider.run_expired:
+            spider.run_expired = True
+            stats.set_value('deadlines/run_expired', True)
+            spider.logger.info(f"[DEADLINE] The run reached its deadline ({self.run_budget:.0f}s). Deferring the remaining requests")
+        if fld not in self.cut_short:
+            self.cut_short.add(fld)
+            stats.inc_value('deadlines/flds_cut_short')
+            spider.logger.info(f"[DEADLINE] {fld} reached its deadline after {now - self.fld_started.get(fld, self.run_started):.0f}s. Deferring its remaining requests")
+            if getattr(spider, 'trap_detector', None):
+                spider.trap_detector.forget(fld)
+        stats.inc_value('deadlines/requests_deferred')
+        stats.inc_value(f'deadlines/cut_short/{fld}')
+        self.deferred.write_line(request.url)
+
+    def process_request(self, request, spider: TakeoverSpider):
+        fld = get_fld(request.url)
+        now = time.monotonic()
+        self.fld_started.setdefault(fld, now)
+        deadline = self._deadline(fld)
+        if now >= deadline:
+            self._defer(request, fld, spider, now)
+            raise IgnoreRequest(f"Deadline of {fld} reached, deferred: {request.url}")
+        timeout = request.meta.get('download_timeout') or spider.settings.getfloat('DOWNLOAD_TIMEOUT', 180)
+        request.meta['download_timeout'] = min(timeout, max(deadline - now, self.MIN_DOWNLOAD_TIMEOUT))
+        return None
+
+    def _defer_waiting_requests(self, spider: TakeoverSpider):
+        """
+        Defer the requests of the expired FLDs waiting in the queues of the downloader slots.
+        The queue of a slot is a private deque of (request, deferred) in Scrapy 2.13 (see Downloader._enqueue_request):
+        it is rebuilt in place in a single pass, and the deferreds of the removed requests are failed with
+        IgnoreRequest, as process_request would have done.
+        """
+        now = time.monotonic()
+        for slot in self.crawler.engine.downloader.slots.values():
+            waiting = []
+            expired = []
+            for request, deferred in slot.queue:
+                fld = get_fld(request.url)
+                if now >= self._deadline(fld):
+                    expired.append((request, deferred, fld))
+                else:
+                    waiting.append((request, deferred))
+            if not expired:
+                continue
+            slot.queue.clear()
+            slot.queue.extend(waiting)
+            for request, deferred, fld in expired:
+                self._defer(request, fld, spider, now)
+                deferred.errback(Failure(IgnoreRequest(f"Deadline of {fld} reached, deferred: {request.url}")))
+
 # For clarity, I moved from the function of the spider:
 # def link_to_file(self,path):
 #     """Check if the link is to a file to prevent following it"""
@@ -59,4 +243,51 @@ class BlockBinaryFilesMiddleware:
         if rup.path.lower().endswith(binary_extensions):
             spider.logger.warning(f"Blocked download. Request is a binary file: {request.url}")
             raise IgnoreRequest("Blocked download. It is binary file: {request.url}")
-        return None
\ No newline at end of file
+        return None
+
+def default_user_agents_file() -> str:
+    return os.path.join(os.path.dirname(scrapy_user_agents.__file__), 'default_uas.txt')
+
+def group_user_agents(ua_file: str) -> dict:
+    """
+    Group the user agents of the file by device type, browser and OS family (slow: every user agent is parsed).
+    """
+    with open(ua_file) as f:
+        uas = [line.strip() for line in f]
+    stat = os.stat(ua_file)
+    return {
+        'source': os.path.abspath(ua_file),
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+        'groups': user_agent_picker.group_by_device_type(uas)
+    }
+
+class RandomUserAgentMiddleware(scrapy_user_agents.middlewares.RandomUserAgentMiddleware):
+    """
+    scrapy_user_agents' RandomUserAgentMiddleware, but its picker is given the user agents grouped by device type
+    from a snapshot (SNAPSHOTS_DIR/user_agents.json), instead of parsing all of them at every start (~3s).
+    """
+    def __init__(self, crawler):
+        settings = crawler.settings
+        ua_file = settings.get('RANDOM_UA_FILE')
+        ua_file = os.path.abspath(os.path.expanduser(ua_file)) if ua_file else default_user_agents_file()
+        snapshot_file = snapshot_path(settings.get('SNAPSHOTS_DIR', 'data'), USER_AGENTS)
+
+        grouped = None
+        snapshot = read_snapshot(snapshot_file)
+        if snapshot:
+            grouped = json.loads(snapshot)
+            stat = os.stat(ua_file)
+            if (grouped.get('source'), grouped.get('mtime'), grouped.get('size')) != (ua_file, stat.st_mtime, stat.st_size):
+                grouped = None
+        if grouped is None:
+            grouped = group_user_agents(ua_file)
+            write_snapshot(snapshot_file, json.dumps(grouped))
+
+        # Only the grouping is replaced, the user agents are still picked by the library
+        group_by_device_type = user_agent_picker.group_by_device_type
+        user_agent_picker.group_by_device_type = lambda uas: grouped['groups']
+        try:
+            super().__init__(crawler)
+        finally:
+            user_agent_picker.group_by_device_type = group_by_device_type
@@ -5,106 +5,256 @@
 
 
 # useful for handling different item types with a single interface
-from .items import JsLink
-import json
+from .items import JsLink, item_to_dict
 from datetime import datetime
+from os import path
+from twisted.internet import task, threads
 from subdomain_takeover.spiders.takeover import TakeoverSpider
+from subdomain_takeover.spiders.utils.writer import BufferedFileWriter, fsync_descriptors
+from subdomain_takeover.spiders.utils.aggregate import DomainAggregator
+from subdomain_takeover.spiders.utils.ledger import NotificationLedger
+from subdomain_takeover.spiders.utils.database import TakeoverDatabase
+from subdomain_takeover.spiders.utils.reverse_index import ReverseIndex
+from subdomain_takeover.spiders.utils.metrics import metrics
 
 class SubdomainTakeoverJsonPipeline:
-    def __init__(self) -> None:
+    """
+    This pipeline writes the items of this run as newline-delimited JSON and appends
+    the newly seen first level domains to the global safe and hijackable domain lists.
+    With OUTPUT_MODE 'domains' (or 'both'), the items are also aggregated by embedded domain
+    in [date]_domains.jsonl instead of (or besides) one record per link.
+    All files are opened once and written through buffered writers.
+    """
+    output_modes = ('links', 'domains', 'both')
+
+    safe_domains_file = 'output/safe_domains.txt'
+    orphan_domains_file = 'output/hijackable_domains.txt'
+
+    def __init__(self, settings) -> None:
         d = datetime.now().strftime("%d%m%Y_%H%M%S")
-        self.safe_links_file = f"output/{d}_safe_links.json"
-        self.orphan_links_file = f"output/{d}_orphan_links.json"
-        self.safe_domains_file = 'output/safe_domains.txt'
-        self.orphan_domains_file = 'output/hijackable_domains.txt'
-        
-        # Read this run json files
-        self.sfile = open(self.safe_links_file, 'w')
-        self.ofile = open(self.orphan_links_file, 'w')
-        
+        self.safe_links_file = f"output/{d}_safe_links.jsonl"
+        self.orphan_links_file = f"output/{d}_orphan_links.jsonl"
+        self.domains_file = f"output/{d}_domains.jsonl"
+
+        self.output_mode = settings.get('OUTPUT_MODE', 'links')
+        if self.output_mode not in self.output_modes:
+            raise ValueError(f"Unsupported OUTPUT_MODE '{self.output_mode}'. Use one of: {', '.join(self.output_modes)}")
+        self.aggregate_samples = settings.getint('OUTPUT_AGGREGATE_SAMPLES', 10)
+
+        self.compression = settings.get('OUTPUT_COMPRESSION')
+        self.max_bytes = settings.getint('OUTPUT_ROTATE_BYTES', 0)
+        self.flush_items = settings.getint('OUTPUT_FLUSH_ITEMS', 1000)
+        self.flush_secs = settings.getfloat('OUTPUT_FLUSH_SECS', 5)
+        self.fsync_secs = settings.getfloat('OUTPUT_FSYNC_SECS', 60)
+
         # Read the global txt files
-        self.hijackable_domains = set(open(self.orphan_domains_file, 'r').readlines())
-        self.safe_domains = set(open(self.safe_domains_file, 'r').readlines())
+        self.hijackable_domains = self._read_domains(self.orphan_domains_file)
+        self.safe_domains = self._read_domains(self.safe_domains_file)
+
+        self.writers = []
+        self.sfile = self.ofile = None
+        self.aggregator = None
+        self.flush_task = None
+        self.checkpoint_task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings)
+
+    def _read_domains(self, file_path: str) -> set:
+        if not path.exists(file_path):
+            return set()
+        with open(file_path, 'r') as f:
+            return set(line.strip() for line in f if line.strip())
+
+    def _links_writer(self, file_path: str, spider: TakeoverSpider) -> BufferedFileWriter:
+        return BufferedFileWriter(
+            file_path,
+            append=False,
+            compression=self.compression,
+            max_bytes=self.max_bytes,
+            flush_items=self.flush_items,
+            flush_secs=self.flush_secs,
+            logger=spider.logger
+        )
 
-        self.ofile.write('[')
-        self.sfile.write('[')
-        self.ofirst_item = True
-        self.sfirst_item = True
+    def _domains_writer(self, file_path: str, spider: TakeoverSpider) -> BufferedFileWriter:
+        return BufferedFileWriter(
+            file_path,
+            append=True,
+            flush_items=self.flush_items,
+            flush_secs=self.flush_secs,
+            logger=spider.logger
+        )
 
-    def close_spider(self, spider):
-        self.sfile.write(']')
-        self.sfile.close()
-        self.ofile.write(']')
-        self.ofile.close()
+    def open_spider(self, spider: TakeoverSpider):
+        self.safe_domains_writer = self._domains_writer(self.safe_domains_file, spider)
+        self.orphan_domains_writer = self._domains_writer(self.orphan_domains_file, spider)
+        self.writers = [self.safe_domains_writer, self.orphan_domains_writer]
+        if self.output_mode in ('links', 'both'):
+            self.sfile = self._links_writer(self.safe_links_file, spider)
+            self.ofile = self._links_writer(self.orphan_links_file, spider)
+            self.writers += [self.sfile, self.ofile]
+        if self.output_mode in ('domains', 'both'):
+            self.aggregator = DomainAggregator(
+                self.domains_file,
+                max_samples=self.aggregate_samples,
+                compression=self.compression,
+                logger=spider.logger
+            )
+
+        # Periodically flush the buffers so that time-based batches are written while the spider is idle
+        if self.flush_secs:
+            self.flush_task = task.LoopingCall(self.flush)
+            self.flush_task.start(self.flush_secs, now=False)
+        # ...and force the files to disk, less often
+        if self.fsync_secs:
+            self.checkpoint_task = task.LoopingCall(self.checkpoint)
+            self.checkpoint_task.start(self.fsync_secs, now=False)
+
+    def flush(self):
+        for writer in self.writers:
+            writer.flush()
+
+    def checkpoint(self):
+        """
+        Flush the files (and append the changed aggregates) in the reactor thread, then fsync them in a thread.
+        """
+        fds = [writer.flush_stream() for writer in self.writers]
+        if self.aggregator:
+            fds.append(self.aggregator.flush_stream())
+        return threads.deferToThread(fsync_descriptors, fds)
+
+    def close_spider(self, spider: TakeoverSpider):
+        for looping_task in (self.flush_task, self.checkpoint_task):
+            if looping_task and looping_task.running:
+                looping_task.stop()
+        for writer in self.writers:
+            writer.close()
+        if self.aggregator:
+            self.aggregator.close()
 
     def process_item(self, item: JsLink, spider: TakeoverSpider):
-        if isinstance(item, JsLink):
-            item_dict = dict(item)
-            if 'type' in item_dict and hasattr(item_dict['type'], 'name'):
-                item_dict['type'] = item_dict['type'].name
-
-            if item_dict['hijackable']:
-                if not self.ofirst_item:
-                    self.ofile.write(',\n')
-                else:
-                    self.ofirst_item = False
-                json.dump(item_dict, self.ofile)
-                
-                # Save the hijackable domain in the global txt file
-                if (item_dict['script_domain_fld'] + '\n') not in self.hijackable_domains:
-                    self.hijackable_domains.add(item_dict['script_domain_fld'] + '\n')
-                    # Save the registered domain in the global txt file
-                    with open('output/hijackable_domains.txt', 'a') as f:
-                        f.write(f"{item_dict['script_domain_fld']}\n")
-            else:
-                if not self.sfirst_item:
-                    self.sfile.write(',\n')
+        with metrics.timer('pipeline_json'):
+            if isinstance(item, JsLink):
+                item_dict = item_to_dict(item)
+                if self.aggregator:
+                    self.aggregator.add(item_dict)
+
+                if item_dict['hijackable']:
+                    if self.ofile:
+                        self.ofile.write_json(item_dict)
+
+                    # Save the hijackable domain in the global txt file
+                    if item_dict['script_domain_fld'] not in self.hijackable_domains:
+                        self.hijackable_domains.add(item_dict['script_domain_fld'])
+                        self.orphan_domains_writer.write_line(item_dict['script_domain_fld'])
                 else:
-                    self.sfirst_item = False
-                json.dump(item_dict, self.sfile)
+                    if self.sfile:
+                        self.sfile.write_json(item_dict)
 
-                # Save the registered domain in the global txt file
-                if (item_dict['script_domain_fld'] + '\n') not in self.safe_domains:
-                    self.safe_domains.add(item_dict['script_domain_fld'] + '\n')
                     # Save the registered domain in the global txt file
-                    with open('output/safe_domains.txt', 'a') as f:
-                        f.write(f"{item_dict['script_domain_fld']}\n")
+                    if item_dict['script_domain_fld'] not in self.safe_domains:
+                        self.safe_domains.add(item_dict['script_domain_fld'])
+                        self.safe_domains_writer.write_line(item_dict['script_domain_fld'])
         return item
     
+class SubdomainTakeoverDatabasePipeline:
+    """
+    This pipeline saves the JsLink items in the sqlite3 database (DATABASE_FILE).
+    The items are written in batches by the writer thread of TakeoverDatabase, so the reactor is not blocked.
+    """
+    def __init__(self, settings) -> None:
+        self.settings = settings
+        self.database = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings)
+
+    def open_spider(self, spider: TakeoverSpider):
+        self.database = TakeoverDatabase(self.settings, logger=spider.logger)
+        self.database.start_run()
+        self.database.start()
+
+    def close_spider(self, spider: TakeoverSpider):
+        self.database.finish_run()
+        self.database.close()
+
+    def process_item(self, item: JsLink, spider: TakeoverSpider):
+        with metrics.timer('pipeline_database'):
+            if isinstance(item, JsLink):
+                self.database.save_item_to_database(item)
+        return item
+
+class SubdomainTakeoverReverseIndexPipeline:
+    """
+    This pipeline indexes the parent domain and URL of the JsLink items by embedded FLD and host (REVERSE_INDEX_FILE),
+    to list the sites embedding a domain with `report.py embedders`.
+    The pairs are indexed in batches by the writer thread of ReverseIndex, so the reactor is not blocked.
+    """
+    def __init__(self, settings) -> None:
+        self.settings = settings
+        self.index = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings)
+
+    def open_spider(self, spider: TakeoverSpider):
+        self.index = ReverseIndex(
+            self.settings.get('REVERSE_INDEX_FILE', 'output/reverse_index.db'),
+            flush_pairs=self.settings.getint('REVERSE_INDEX_FLUSH_PAIRS', 100000),
+            flush_secs=self.settings.getfloat('REVERSE_INDEX_FLUSH_SECS', 60),
+            logger=spider.logger
+        )
+
+    def close_spider(self, spider: TakeoverSpider):
+        self.index.close()
+
+    def process_item(self, item: JsLink, spider: TakeoverSpider):
+        with metrics.timer('pipeline_reverse_index'):
+            if isinstance(item, JsLink):
+                self.index.add(item.get('parent_url'), item.get('parent_domain'), item.get('hijackable_domain'), item.get('script_domain_fld'))
+        return item
+
 class SubdomainTakeoverDiscordPipeline:
     """
     This pipeline is used to send messages to a Discord channel.
     Will only send notifications if the item is an instance of JsLink and hijackable is True.
     """
+    def __init__(self, settings) -> None:
+        self.ledger_file = settings.get('NOTIFICATIONS_FILE', 'output/notifications.txt')
+        self.dedup_key = settings.get('NOTIFICATIONS_DEDUP_KEY', 'domains')
+        self.ledger = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings)
+
+    def open_spider(self, spider: TakeoverSpider):
+        self.ledger = NotificationLedger(self.ledger_file, dedup_key=self.dedup_key, logger=spider.logger)
+        self.ledger.open()
+
+    def close_spider(self, spider: TakeoverSpider):
+        self.ledger.close()
+
     def process_item(self, item: JsLink, spider: TakeoverSpider):
-        if isinstance(item, JsLink) and item['hijackable']:
-            # Save the notification to the file notifications.txt
-            if not self.already_notified(item, spider):
-                spider.discord.notify_takeover("Subdomain Takeover Detected!", item)
-                with open('output/notifications.txt', 'a') as f:
-                    f.write(f"{item['parent_domain']}<=>{item['hijackable_domain']}\n")
+        with metrics.timer('pipeline_discord'):
+            if isinstance(item, JsLink) and item['hijackable']:
+                # Save the notification to the file notifications.txt
+                if not self.already_notified(item, spider):
+                    spider.discord.notify_takeover("Subdomain Takeover Detected!", item)
+                    self.ledger.add(item)
+                # else:
+                #     spider.logger.info("Item has already been notified, skipping Discord notification.")
             # else:
-            #     spider.logger.info("Item has already been notified, skipping Discord notification.")
-        # else:
-        #     spider.logger.info("Item is not hijackable or not an instance of JsLink, skipping Discord notification.")
+            #     spider.logger.info("Item is not hijackable or not an instance of JsLink, skipping Discord notification.")
         return item
     
-    def already_notified(self, item: JsLink, spider: TakeoverSpider):
+    def already_notified(self, item: JsLink, spider: TakeoverSpider) -> bool:
         """
         Check if the item has already been notified.
-        This is a placeholder for any logic you might want to implement to avoid duplicate notifications.
+        The ledger is loaded once when the spider opens, so this is a lookup in memory.
         """
-        # We read the file notifications.txt and see if the item has already been notified
-        # The file contains a pair of parent_fdl and embedded_fld separated by the string '<=>'
-        notified_file = 'output/notifications.txt'
-        try:
-            with open(notified_file, 'r') as f:
-                notified_items = f.readlines()
-                for line in notified_items:
-                    parent_fld, embedded_fld = line.strip().split('<=>')
-                    if parent_fld == item['parent_domain'] and embedded_fld == item['hijackable_domain']:
-                        return True
-        except FileNotFoundError:
-            # If the file does not exist, we assume no items have been notified yet
-            return False
-        
+        return item in self.ledger
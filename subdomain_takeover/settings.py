@@ -24,6 +24,20 @@ DEPTH_LIMIT=2
 MAX_PAGES_PER_FLD=15    # Maximum number of pages to scrape from a web page
 MAX_ITEMS_PER_FLD=500   # Maximum number of items to scrape from a web page (many of those items tend to be duplicates between pages)
 
+# Time budgets, in seconds (0 = no limit), of every first level domain (from its first request) and of the whole run.
+# The requests of the FLDs past their deadline are not sent, but written to DEFERRED_URLS_FILE for a follow-up run
+FLD_TIME_BUDGET = 0
+RUN_TIME_BUDGET = 0
+DEFERRED_URLS_FILE = 'output/deferred_urls.txt'
+DEADLINE_CHECK_SECS = 5     # Interval of the checks of the requests waiting in the downloader for an expired FLD
+
+# Crawler traps (calendars, faceted search, session ids...): stop following the links of a URL pattern of a domain
+# once TRAP_PATIENCE of its pages in a row did not embed any new third-party host
+TRAP_DETECTION = True
+TRAP_PATIENCE = 10
+TRAP_MAX_PATTERNS_PER_FLD = 1000
+TRAP_MAX_FLDS = 10000      # The state of the FLDs crawled least recently is dropped beyond this number
+
 # Keys and secrets
 SCRAPEOPS_KEY=os.getenv('SCRAPEOPS_KEY')
 DISCORD_WEBHOOK=os.getenv('DISCORD_WEBHOOK')
@@ -36,16 +50,42 @@ DISCORD_WEBHOOK=os.getenv('DISCORD_WEBHOOK')
 # }
 
 DNS_SERVER="8.8.8.8"
+DNS_PORT=53
 DNS_TIMEOUT=15
+# Answers of the DNS_SERVER kept in memory (number of names)
+DNS_CACHE_SIZE=10000
+# Seconds to wait for the providers requested to check if the resource pointed by a CNAME exists
+PROBE_TIMEOUT=10
+
+# Resolve the hosts of the seeds before requesting them, SEED_PREFLIGHT_BATCH at a time with SEED_PREFLIGHT_CONCURRENCY queries
+# in flight. The dead seeds (NXDOMAIN, SERVFAIL or no address) are not requested and are written to SEED_PREFLIGHT_DEAD_FILE,
+# and the seeds with a CNAME are checked for a takeover right away
+SEED_PREFLIGHT = True
+SEED_PREFLIGHT_CONCURRENCY = 64
+SEED_PREFLIGHT_BATCH = 1000
+SEED_PREFLIGHT_DEAD_FILE = 'output/dead_seeds.txt'
+
+# Query this RDAP server for every domain instead of the server of each TLD (e.g. "http://127.0.0.1:8080")
+RDAP_URL=None
+# Query the classic WHOIS when RDAP does not find a domain
+WHOIS_FALLBACK=True
+
+# Local snapshots of the public suffix list, the RDAP bootstrap data and the grouped user agents, so the start
+# does not download nor parse them (refresh them with: jsjack.py --update-snapshots)
+SNAPSHOTS_DIR=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
 
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
 USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36'
 
 DOWNLOADER_MIDDLEWARES = {
+    'scrapy.downloadermiddlewares.offsite.OffsiteMiddleware': None,
+    'subdomain_takeover.middlewares.SeedOffsiteMiddleware': 50,
     'scrapy.downloadermiddlewares.useragent.UserAgentMiddleware': None,
-    'scrapy_user_agents.middlewares.RandomUserAgentMiddleware': 400,
+    'subdomain_takeover.middlewares.RandomUserAgentMiddleware': 400,
     'subdomain_takeover.middlewares.BlockBinaryFilesMiddleware': 500,
-    'subdomain_takeover.middlewares.DomainLimitDownloaderMiddleware': 543
+    'subdomain_takeover.middlewares.DomainLimitDownloaderMiddleware': 543,
+    'subdomain_takeover.middlewares.DomainDeadlineMiddleware': 544,
+    'subdomain_takeover.middlewares.ConditionalRequestMiddleware': 545
 }
 
 HEADERS = {
@@ -81,10 +121,14 @@ HTTPCACHE_ENABLED = True
 HTTPCACHE_DIR = '.scrapy/httpcache'
 HTTPCACHE_EXPIRATION_SECS = 3600 # 1 hour
 
-# My own class to handle prunable cache
-HTTPCACHE_STORAGE = 'subdomain_takeover.spiders.PrunableFilesystemCacheStorage'
-HTTPCACHE_MAX_FILES = 1024
+# My own class to handle prunable cache. Entries are evicted in LRU order as responses are stored
+# (use 'subdomain_takeover.spiders.PrunableFilesystemCacheStorage' to prune the cache only at startup)
+HTTPCACHE_STORAGE = 'subdomain_takeover.spiders.IndexedFilesystemCacheStorage'
+HTTPCACHE_MAX_FILES = 1024          # Maximum number of cached responses
 HTTPCACHE_MAX_SIZE = 50 * 1024 * 1024  # 50 MB
+# Use 'subdomain_takeover.spiders.DeduplicatedCacheStorage' to store identical bodies once, compressed with HTTPCACHE_COMPRESSION
+# ('gzip', or 'zstd' with Python 3.14+, 'backports.zstd' or 'zstandard' installed)
+HTTPCACHE_COMPRESSION = 'gzip'
 
 # Disable cookies (enabled by default)
 #COOKIES_ENABLED = False
@@ -115,11 +159,99 @@ HTTPCACHE_MAX_SIZE = 50 * 1024 * 1024  # 50 MB
 #EXTENSIONS = {
 #    'scrapy.extensions.telnet.TelnetConsole': None,
 #}
+EXTENSIONS = {
+    'subdomain_takeover.extensions.MetricsExtension': 400,
+    'subdomain_takeover.extensions.ReactorStallExtension': 450,
+    'subdomain_takeover.extensions.StatsFileExtension': 500,
+    'subdomain_takeover.extensions.ProfilerExtension': 600,
+}
+
+# Timings and counters of the hot paths, copied to the stats every METRICS_STATS_INTERVAL seconds
+METRICS_ENABLED = True
+METRICS_STATS_INTERVAL = 30
+# Serve the metrics in the Prometheus text format at http://METRICS_HOST:METRICS_PORT/metrics (0 = disabled)
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 0
+
+# Write the stats of the crawl as JSON to this file when the spider closes
+STATS_FILE = None
+
+# Log the stack of the callbacks blocking the reactor for more than REACTOR_STALL_THRESHOLD seconds (0 = disabled)
+REACTOR_STALL_THRESHOLD = 0.5
+REACTOR_STALL_INTERVAL = 0.1        # Seconds between the ticks used to measure the reactor lag
+
+# Profile the crawl with cProfile and write the profile to PROFILE_FILE (and a summary by subsystem to PROFILE_FILE.txt)
+PROFILE_FILE = None
+PROFILE_SNAPSHOT_SECS = 0           # Also write a snapshot of the profile every N seconds (0 = only at the end)
+PROFILE_TOP = 10                    # Functions listed per subsystem in the summary
+
+# Output writers (newline-delimited JSON written in batches)
+OUTPUT_FLUSH_ITEMS = 1000           # Write the buffered items every N items...
+OUTPUT_FLUSH_SECS = 5               # ...or every N seconds, whatever happens first
+OUTPUT_FSYNC_SECS = 60              # Force the output files to disk every N seconds (0 = only when closing)
+OUTPUT_COMPRESSION = None           # None, 'gzip' or 'zstd' (requires Python 3.14+, 'backports.zstd' or 'zstandard')
+OUTPUT_ROTATE_BYTES = 1024 * 1024 * 1024  # Start a new part of the links files every 1 GB (0 = no rotation)
+OUTPUT_MODE = 'links'               # 'links': one record per link, 'domains': aggregated by embedded domain ([date]_domains.jsonl), or 'both'
+OUTPUT_AGGREGATE_SAMPLES = 10       # Sample parent and embedded URLs kept for each embedded domain
+
+# Recheck mode (jsjack.py --recheck). Hijackable domains are always checked, safe ones once their verdict is RECHECK_MAX_AGE seconds old
+RECHECK_VERDICTS_FILE = 'output/verdicts.jsonl'
+RECHECK_MAX_AGE = 7 * 24 * 3600     # 1 week
+RECHECK_CONCURRENCY = 64
+RECHECK_MAX_HOSTS_PER_FLD = 50      # Embedded hosts of each domain whose CNAME is checked again
+
+# Verify mode (jsjack.py --verify FILE). Findings are written to VERIFY_OUTPUT_FILE (default: output/[date]_verify_links.jsonl)
+VERIFY_OUTPUT_FILE = None
+VERIFY_CONCURRENCY = 128
+VERIFY_CACHE_SIZE = 100000          # Verdicts of first level domains kept in memory
+
+# Monitor mode (jsjack.py --monitor [HOURS]): crawl again every MONITOR_INTERVAL seconds, revalidating the known pages
+# with their stored validators and verifying only the hosts that pages did not embed in the previous runs.
+# MONITOR_ENABLED alone keeps the state between runs started by other means (e.g. cron), without looping
+MONITOR_ENABLED = False
+MONITOR_INTERVAL = 24 * 3600
+MONITOR_STATE_FILE = 'output/monitor.db'
+MONITOR_MAX_MISSED_RUNS = 3         # Drop the pages not revalidated nor fetched (2xx) by this many runs in a row (0 = never)
+
+# Parse the pages in PARSER_WORKERS processes instead of the reactor thread (0 = disabled), to use more than one core
+# in a single crawl. The bodies up to PARSER_SLOT_BYTES are handed to the workers through shared memory
+PARSER_WORKERS = 0
+PARSER_SLOT_BYTES = 2 * 1024 * 1024
+
+# Offline parsing of WARC and HAR archives (jsjack.py --archives)
+ARCHIVE_WORKERS = 0                 # Processes reading the archives (0 = one per CPU)
+ARCHIVE_MAX_PAGE_BYTES = 10 * 1024 * 1024  # Larger pages are skipped
+ARCHIVE_QUEUE_SIZE = 64             # Batches of pages waiting to be checked
+ARCHIVE_BATCH_SIZE = 500            # Pages sent by the workers in each batch
+
+# Discord notifications are delivered in the background, merging those sent within DISCORD_BATCH_SECS
+DISCORD_TIMEOUT = 10                # Timeout of each request to the webhook
+DISCORD_BATCH_SECS = 2
+DISCORD_MAX_RETRIES = 5
+DISCORD_CLOSE_TIMEOUT = 30          # Time to wait for pending notifications when the spider closes
+DISCORD_SPOOL_FILE = 'output/discord_spool.jsonl'  # Undelivered notifications, sent again on the next run
+
+# Findings already notified to Discord. Deduplicate them by 'domains' (parent and hijackable domain) or by 'fld' (hijackable FLD only)
+NOTIFICATIONS_FILE = 'output/notifications.txt'
+NOTIFICATIONS_DEDUP_KEY = 'domains'
+
+# Database with the items of all the runs. Items are inserted in batches of DATABASE_BATCH_SIZE or every DATABASE_FLUSH_SECS
+DATABASE_FILE = 'output/takeover.db'
+DATABASE_BATCH_SIZE = 5000
+DATABASE_FLUSH_SECS = 1
+
+# Index of the parent domains and URLs of the findings by embedded FLD and host (report.py embedders).
+# Pairs are indexed in batches of REVERSE_INDEX_FLUSH_PAIRS or every REVERSE_INDEX_FLUSH_SECS
+REVERSE_INDEX_FILE = 'output/reverse_index.db'
+REVERSE_INDEX_FLUSH_PAIRS = 100000
+REVERSE_INDEX_FLUSH_SECS = 60
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 ITEM_PIPELINES = {
     'subdomain_takeover.pipelines.SubdomainTakeoverJsonPipeline': 300,
+    'subdomain_takeover.pipelines.SubdomainTakeoverDatabasePipeline': 350,
+    'subdomain_takeover.pipelines.SubdomainTakeoverReverseIndexPipeline': 360,
     'subdomain_takeover.pipelines.SubdomainTakeoverDiscordPipeline': 400,
 }
 
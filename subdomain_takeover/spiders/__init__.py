@@ -7,4 +7,4 @@ from subdomain_takeover.spiders.utils.colored import Colored
 from subdomain_takeover.spiders.utils.discord import TakeoverDiscordBot
 from subdomain_takeover.spiders.utils.whois import WhoisRDAP
 from subdomain_takeover.spiders.utils.hijacker import DomainHijacker
-from subdomain_takeover.spiders.utils.cache import PrunableFilesystemCacheStorage
\ No newline at end of file
+from subdomain_takeover.spiders.utils.cache import PrunableFilesystemCacheStorage, IndexedFilesystemCacheStorage, DeduplicatedCacheStorage
\ No newline at end of file
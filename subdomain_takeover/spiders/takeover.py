@@ -1,21 +1,30 @@
 from scrapy import signals
 from ..items import JsLink, LinkType
 from scrapy.spiders import Spider, Request, Response 
+from scrapy.http import HtmlResponse
+from scrapy.utils.defer import maybe_deferred_to_future
 from scrapy.utils.project import get_project_settings
-from urllib.parse import urlparse, urljoin, urlencode
+from twisted.internet import threads
+from urllib.parse import urlparse, urljoin, urlencode, parse_qs
 import logging
-from tldextract import extract as tld_extract
 from os import path
 from collections import Counter
 from subdomain_takeover.spiders.utils.discord import TakeoverDiscordBot
 from subdomain_takeover.spiders.utils.hijacker import DomainHijacker
+from subdomain_takeover.spiders.utils.archives import ArchiveIngester
+from subdomain_takeover.spiders.utils.database import row_to_item
+from subdomain_takeover.spiders.utils.metrics import metrics
+from subdomain_takeover.spiders.utils.monitor import PageStateStore
+from subdomain_takeover.spiders.utils.parsing import ParserPool, page_hrefs, remote_sources
+from subdomain_takeover.spiders.utils.preflight import SeedPreflight, DEAD, UNKNOWN
+from subdomain_takeover.spiders.utils.writer import BufferedFileWriter
+from subdomain_takeover.spiders.utils import domains
+from subdomain_takeover.spiders.utils.domains import get_fld
+from subdomain_takeover.spiders.utils.snapshots import PUBLIC_SUFFIX_LIST, RDAP_BOOTSTRAP, check_snapshots, snapshot_path
+from subdomain_takeover.spiders.utils.traps import CrawlTrapDetector
 
 logger = logging.getLogger('takeover-spider')
 
-def get_fld(url):
-    ext=tld_extract(url)
-    return f"{ext.domain}.{ext.suffix}"
-
 class TakeoverSpider(Spider):
     name = 'takeover'
     safe_fdl_file = 'output/safe_domains.txt'
@@ -33,12 +42,14 @@ class TakeoverSpider(Spider):
             dns: str=None,
             scan_images: bool=False,
             logging_level: str=None,
+            archives: list=None,
+            settings=None,
             **kwargs
         ):
         super().__init__(self.name, **kwargs)
 
-        # Read the project settings as fallback values
-        settings = get_project_settings()
+        # Read the crawler (or project) settings as fallback values
+        settings = settings or get_project_settings()
         
         # Initialize instance attributes with arguments or fallback to settings
         self.discord_webhook = discord_webhook or settings.get('DISCORD_WEBHOOK')
@@ -50,6 +61,14 @@ class TakeoverSpider(Spider):
         self.scan_images = scan_images or settings.get('SCAN_IMAGES', False)
         self.logging_level = logging_level or settings.get('LOG_LEVEL', 'INFO')
 
+        # The public suffix list and the RDAP bootstrap data are read from local snapshots when first needed
+        snapshots_dir = settings.get('SNAPSHOTS_DIR', 'data')
+        check_snapshots(snapshots_dir, self.logger)
+        domains.configure(
+            suffix_list_file=snapshot_path(snapshots_dir, PUBLIC_SUFFIX_LIST),
+            cache_dir=snapshot_path(snapshots_dir, 'tldextract')
+        )
+
         # Initialize counters
         self.pages_counter = Counter()
         self.items_counter = Counter()
@@ -76,26 +95,75 @@ class TakeoverSpider(Spider):
             dns_timeout=settings.get('DNS_TIMEOUT', 5),  # Fallback to settings for optional params
             headers=settings.get('HEADERS', {}),
             discord=self.discord,
-            logger=self.logger
+            logger=self.logger,
+            dns_port=settings.getint('DNS_PORT', 53),
+            rdap_url=settings.get('RDAP_URL'),
+            whois_fallback=settings.getbool('WHOIS_FALLBACK', True),
+            rdap_bootstrap_file=snapshot_path(snapshots_dir, RDAP_BOOTSTRAP),
+            dns_cache_size=settings.getint('DNS_CACHE_SIZE', 10000),
+            probe_timeout=settings.getint('PROBE_TIMEOUT', 10)
         )
 
         # Initialize page counter
         self.scrapped_pages = 0
 
-        # Initialize URLs
+        # Monitor mode: validators and embedded hosts of the pages crawled by the previous runs
+        # (not of the archived pages, which are not requested again)
+        self.page_state = None
+        if settings.getbool('MONITOR_ENABLED', False) and not archives:
+            self.page_state = PageStateStore(
+                settings.get('MONITOR_STATE_FILE', 'output/monitor.db'),
+                max_missed_runs=settings.getint('MONITOR_MAX_MISSED_RUNS', 3),
+                logger=self.logger
+            )
+
+        # Stop following the URL patterns that keep yielding pages without new embedded domains
+        self.trap_detector = None
+        if settings.getbool('TRAP_DETECTION', True):
+            self.trap_detector = CrawlTrapDetector(
+                patience=settings.getint('TRAP_PATIENCE', 10),
+                max_patterns_per_fld=settings.getint('TRAP_MAX_PATTERNS_PER_FLD', 1000),
+                max_flds=settings.getint('TRAP_MAX_FLDS', 10000),
+                logger=self.logger
+            )
+
+        # Pool of processes parsing the pages (see spider_opened), instead of the reactor thread
+        self.parser_workers = settings.getint('PARSER_WORKERS', 0)
+        self.parser_pool = None
+
+        # Hosts whose CNAME records were already checked as parent domains (see _check_parent_host_cname_hijack)
+        self.checked_hosts = set()
+
+        # Set by DomainDeadlineMiddleware once RUN_TIME_BUDGET is spent: the remaining seeds are deferred without resolving them
+        self.run_expired = False
+
+        # Resolve the hosts of the seeds before requesting them (see _iter_preflight_seeds)
+        self.seed_preflight = None
+        if settings.getbool('SEED_PREFLIGHT', True):
+            self.seed_preflight = SeedPreflight(
+                self.hijacker,
+                concurrency=settings.getint('SEED_PREFLIGHT_CONCURRENCY', 64),
+                logger=self.logger
+            )
+
+        # Initialize URLs. The seeds are read from the file as the start requests are sent (see start)
         self.start_urls = []
-        if not path.exists(urls):
-            raise FileNotFoundError(f"The urls file '{urls}' does not exist. Please provide a valid file with URLs to explore.")
-        
-        logger.info("Using urls file %s" % urls)
         self.urls_file = urls
-        with open(self.urls_file, "r") as f:
-            self.start_urls = [url.strip() for url in f.readlines() if url.strip()]
+        if urls is not None:
+            if not path.exists(urls):
+                raise FileNotFoundError(f"The urls file '{urls}' does not exist. Please provide a valid file with URLs to explore.")
+            logger.info("Using urls file %s" % urls)
+
+        # Archived pages (WARC or HAR files) parsed instead of crawling (see _iter_archive_items)
+        self.archives = archives or []
+        self.archive_ingester = None
         
-        # Configure domain settings
+        # Configure domain settings. The domains of the seeds are allowed as they are read (see _iter_seed_urls)
         self.allow_fld = bool(allow_fld)
-        self.allowed_domains = []
-        self._populate_allowed_domains()
+        self.allowed_domains = set()
+        # Manually add also the scrapeops proxy domain if it is used
+        if (self.use_scrapeops):
+            self.allowed_domains.add("proxy.scrapeops.io")
 
     def _populate_fdl(self):
         self.safe_fld = set()
@@ -121,27 +189,139 @@ class TakeoverSpider(Spider):
             with open(self.hijackable_fdl_file, "w") as f:
                 f.write("")
 
-    def _populate_allowed_domains(self):
+    def _iter_seed_urls(self):
         """
-        Populate the allowed domains set from the settings.
-        :return: A set of allowed domains.
+        Yield the URLs of the urls file, one line at a time, and allow their domains.
         """
-        # Decide whether to allow first domain level allowlist
-        for url in self.start_urls:
-            try:
-                urlp=urlparse(url)
-                self.allowed_domains.append(urlp.netloc)
+        if self.urls_file is None:
+            return
+        with open(self.urls_file, "r") as f:
+            for line in f:
+                url = line.strip()
+                if url:
+                    self._allow_seed_domain(url)
+                    yield url
+
+    async def start(self):
+        if self.archives:
+            async for item in self._iter_archive_items():
+                yield item
+            return
+        if self.seed_preflight is not None:
+            async for result in self._iter_preflight_seeds():
+                yield result
+        else:
+            for url in self._iter_seed_urls():
+                yield Request(url, dont_filter=True)
+        if self.page_state is not None:
+            # Revalidate the pages found by the previous runs, even if they are not linked anymore from the seeds
+            for url in self.page_state.iter_urls():
+                yield Request(url)
+
+    async def _iter_preflight_seeds(self):
+        """
+        Resolve the hosts of the seeds in batches, in a thread, and yield the requests of the seeds that resolve
+        and the items of the CNAME checks of their hosts. The dead seeds are written to SEED_PREFLIGHT_DEAD_FILE.
+        """
+        batch_size = self.settings.getint('SEED_PREFLIGHT_BATCH', 1000)
+        stats = self.crawler.stats
+        dead_seeds = BufferedFileWriter(self.settings.get('SEED_PREFLIGHT_DEAD_FILE', 'output/dead_seeds.txt'), append=False, logger=self.logger)
+        seeds = self._iter_seed_urls()
+        try:
+            while True:
+                batch = [url for _, url in zip(range(batch_size), seeds)]
+                if not batch:
+                    break
+                if self.run_expired:
+                    # Deferred to the follow-up run by DomainDeadlineMiddleware
+                    for url in batch:
+                        yield Request(url, dont_filter=True)
+                    continue
+                results = await maybe_deferred_to_future(threads.deferToThread(self.seed_preflight.check, batch))
+                for url, status, reason, items in results:
+                    if status != UNKNOWN or items:
+                        # The CNAME records of the host were checked above
+                        self.checked_hosts.add(urlparse(url).netloc.lower())
+                    for item in items:
+                        stats.inc_value('preflight/cname_items')
+                        yield item
+                    if status == DEAD:
+                        stats.inc_value('preflight/seeds_dead')
+                        stats.inc_value(f'preflight/seeds_dead/{reason}')
+                        dead_seeds.write_line(f"{url}\t{reason}")
+                        self.logger.debug(f"[PREFLIGHT] Not requesting {url}: {reason}")
+                        continue
+                    if status == UNKNOWN:
+                        stats.inc_value('preflight/seeds_unresolved')
+                        self.logger.debug(f"[PREFLIGHT] Could not resolve the host of {url}, requesting it anyway: {reason}")
+                    stats.inc_value('preflight/seeds_live')
+                    yield Request(url, dont_filter=True)
+        finally:
+            dead_seeds.close()
+            self.seed_preflight.close()
+        self.logger.info(f"[PREFLIGHT] {stats.get_value('preflight/seeds_live', 0)} seeds requested, {stats.get_value('preflight/seeds_dead', 0)} dead seeds written to {dead_seeds.current_path}")
+
+    async def _iter_archive_items(self):
+        """
+        Yield the items of the archived pages, whose remote sources are extracted in a pool of processes
+        by ArchiveIngester and checked here by _parse. No page is requested: the links to other pages are not followed.
+        """
+        self.archive_ingester = ArchiveIngester(
+            self.archives,
+            workers=self.settings.getint('ARCHIVE_WORKERS', 0),
+            max_page_bytes=self.settings.getint('ARCHIVE_MAX_PAGE_BYTES', 10 * 1024 * 1024),
+            queue_size=self.settings.getint('ARCHIVE_QUEUE_SIZE', 64),
+            batch_size=self.settings.getint('ARCHIVE_BATCH_SIZE', 500),
+            scan_images=self.scan_images,
+            log_level=self.settings.get('LOG_LEVEL', 'INFO'),
+            logger=self.logger
+        )
+        self.archive_ingester.start()
+        try:
+            while True:
+                pages = await maybe_deferred_to_future(threads.deferToThread(self.archive_ingester.get))
+                if pages is None:
+                    break
+                for url, sources in pages:
+                    response = HtmlResponse(url=url, body=b'', encoding='utf-8')
+                    for item in await self._parent_host_items(response):
+                        yield item
+                    for item in self._parse(response, hrefs=[], sources=sources):
+                        yield item
+        finally:
+            self._close_archive_ingester()
+
+    def _close_archive_ingester(self):
+        ingester = self.archive_ingester
+        if ingester is None:
+            return
+        self.archive_ingester = None
+        ingester.close()
+        self.crawler.stats.set_value('archive/files', len(ingester.archives))
+        self.crawler.stats.set_value('archive/files_failed', ingester.failed)
+        self.crawler.stats.set_value('archive/pages', ingester.pages)
+        self.crawler.stats.set_value('archive/records_skipped', ingester.skipped)
+
+    def start_requests(self):
+        # Scrapy < 2.13
+        for url in self._iter_seed_urls():
+            yield Request(url, dont_filter=True)
+
+    def _allow_seed_domain(self, url: str):
+        """
+        Add the host of a seed (and its first level domain if allow_fld is True) to the allowed domains,
+        checked by SeedOffsiteMiddleware.
+        """
+        try:
+            host = urlparse(url).hostname
+            if host:
+                self.allowed_domains.add(host)
 
-                # Add also the first level domain if allow_fld is True
-                if (self.allow_fld):
-                    fld=get_fld(url)
-                    self.allowed_domains.append(fld)
-            except Exception as e:
-                self.logger.error(f"Error parsing URL '{url}': {e}")
-                continue
-        # Manually add also the scrapeops proxy domain if it is used
-        if (self.use_scrapeops):
-            self.allowed_domains.append("proxy.scrapeops.io")
+            # Add also the first level domain if allow_fld is True
+            if (self.allow_fld):
+                self.allowed_domains.add(get_fld(url))
+        except Exception as e:
+            self.logger.error(f"Error parsing URL '{url}': {e}")
 
     def _row_to_item(self, row):
         """
@@ -149,16 +329,7 @@ class TakeoverSpider(Spider):
         :param row: A tuple containing the database row data.
         :return: A JsLink item
         """
-        item = JsLink()
-        item['hijackable_domain'] = row[0]
-        item['script_domain_fld'] = row[1]
-        item['parent_domain'] = row[2]
-        item['parent_url'] = row[3]
-        item['embedded_url'] = row[4]
-        item['hijackable'] = row[5] == 1
-        item['cname_hijackable'] = row[6] == 1
-        item['type'] = LinkType(row[7])
-        return item
+        return row_to_item(row)
 
     @classmethod
     def from_crawler(cls, crawler, *args, **kwargs):
@@ -169,7 +340,10 @@ class TakeoverSpider(Spider):
         :param kwargs: Additional keyword arguments.
         :return: An instance of the TakeoverSpider.
         """
+        kwargs.setdefault('settings', crawler.settings)
         spider = super(TakeoverSpider, cls).from_crawler(crawler, *args, **kwargs)
+        if spider.trap_detector:
+            spider.trap_detector.stats = crawler.stats
         crawler.signals.connect(spider.spider_opened, signal=signals.spider_opened)
         crawler.signals.connect(spider.spider_closed, signal=signals.spider_closed)
         return spider
@@ -180,35 +354,68 @@ class TakeoverSpider(Spider):
         This method is connected to the Scrapy signal `spider_opened`.
         :param spider: The Scrapy spider object.
         """
+        if self.parser_workers and not self.archives:
+            self.parser_pool = ParserPool(
+                workers=self.parser_workers,
+                scan_images=self.scan_images,
+                slot_bytes=self.settings.getint('PARSER_SLOT_BYTES', 2 * 1024 * 1024),
+                # Enough blocks of shared memory for the pages of all the concurrent requests
+                slots=self.settings.getint('CONCURRENT_REQUESTS', 16),
+                logger=self.logger
+            )
+            self.parser_pool.start()
         spider.logger.info("Spider opened. Notifying discord")
         self.discord.notify_status(
             "Spider starting",
-            self.urls_file,
+            self.urls_file or ', '.join(self.archives),
             len(self.safe_fld),
             len(self.hijackable_fld),
             self.scrapped_pages
         )
 
-    def spider_closed(self, spider):
+    def spider_closed(self, spider, reason: str = None):
         """
         Called when the spider is closed. Will notify Discord about the spider close.
         This method is connected to the Scrapy signal `spider_closed`.
         :param spider: The Scrapy spider object.
+        :param reason: The reason the spider was closed ('finished' unless stopped early).
         """
+        # Stop the archive workers if the spider is closed before reading all the archives
+        self._close_archive_ingester()
+        if self.page_state is not None:
+            # The pages of a run stopped early (or cut short by RUN_TIME_BUDGET) were not all requested
+            expired = self.page_state.close(finished=reason == 'finished' and not self.run_expired)
+            if expired:
+                self.crawler.stats.set_value('monitor/pages_expired', expired)
+        if self.parser_pool is not None:
+            self.crawler.stats.set_value('parser_pool/pages', self.parser_pool.pages)
+            self.crawler.stats.set_value('parser_pool/bodies_copied', self.parser_pool.copied)
+            self.parser_pool.close()
+            self.parser_pool = None
         spider.logger.info("Spider closed. Notifying discord")
         self.discord.notify_status(
             "Spider finished",
-            self.urls_file,
+            self.urls_file or ', '.join(self.archives),
             len(self.safe_fld),
             len(self.hijackable_fld),
             self.scrapped_pages
         )
+        # Wait for the queued notifications to be delivered, in a thread so the reactor keeps running
+        return threads.deferToThread(self.discord.close)
 
     def get_scrapeops_url(self,url):
         payload = {'api_key': self.scrapeops_key, 'url': url} # , 'bypass': 'cloudflare'}
         proxy_url = 'https://proxy.scrapeops.io/v1/?' + urlencode(payload)
         return proxy_url
 
+    def original_url(self, url: str) -> str:
+        """
+        The URL of the page requested through the ScrapeOps proxy (see get_scrapeops_url), or the URL itself.
+        """
+        if self.use_scrapeops and url.startswith('https://proxy.scrapeops.io/'):
+            return parse_qs(urlparse(url).query).get('url', [url])[0]
+        return url
+
     def valid_url(self,url):
         """Check if the URL is valid and has a valid scheme (http or https)"""
         try:
@@ -229,16 +436,23 @@ class TakeoverSpider(Spider):
         logger.info("Current registered domains: %s" % (self.registered_domains))
         logger.info("Current orphan domains: %s" % (self.orphan_domains))
 
-    def _get_remote_source_items(self, response: Response) -> list[JsLink]:
+    def _get_remote_source_items(self, response: Response, embedded_urls: list=None, skip_hosts: set=None, sources: list=None) -> list[JsLink]:
         """
         List all the JavaScript files, iframes and frames in the response and yield JsLink items for each of them.
         :param response: The Scrapy response object.
+        :param embedded_urls: Optional list where the URLs of the embedded resources are appended.
+        :param skip_hosts: Optional set of hosts whose resources are not checked (e.g. already embedded in the previous run).
+        :param sources: The remote sources of the page already extracted by the parser pool (see remote_sources).
         :return: A generator of JsLink items for each JavaScript file, iframe and frame found in the response.
         """
         def _populate_items_from_xpath(xpath_results, link_type: LinkType, attrib_name: str) -> list[JsLink]:
             """Populate items from the given XPath results."""
             items=[]
             for xpath_item in xpath_results:
+                if embedded_urls is not None:
+                    embedded_urls.append(xpath_item.attrib[attrib_name])
+                if skip_hosts and urlparse(xpath_item.attrib[attrib_name].strip()).netloc.lower() in skip_hosts:
+                    continue
                 if not hosted_localy(response.url, xpath_item):
                     # Check for an orphan domain hijack
                     item = self.hijacker.detect_unregistered_domain_hijack(
@@ -266,22 +480,13 @@ class TakeoverSpider(Spider):
             resp_fld=get_fld(response_url)
             return js_fld==resp_fld
 
-        remote_scripts=response.xpath("//script[@src]")
-        remote_iframes=response.xpath("//iframe[@src]")
-        remote_frames=response.xpath("//frame[@src]")
+        if sources is None:
+            sources=remote_sources(response, self.scan_images)
         items=[]
 
-        items+=_populate_items_from_xpath(remote_scripts, LinkType.JAVASCRIPT, attrib_name="src")
-        items+=_populate_items_from_xpath(remote_iframes, LinkType.IFRAME, attrib_name="src")
-        items+=_populate_items_from_xpath(remote_frames, LinkType.FRAME, attrib_name="src")
-        
-        if self.scan_images:
-            remote_style_link=response.xpath("//link[@src]")
-            remote_images=response.xpath("//img[@src]")
-            remote_svg=response.xpath("//svg//a[@href]")
-            items+=_populate_items_from_xpath(remote_style_link, LinkType.STYLE, attrib_name="src")
-            items+=_populate_items_from_xpath(remote_images, LinkType.IMAGE, attrib_name="src")
-            items+=_populate_items_from_xpath(remote_svg, LinkType.SVG, attrib_name="href")
+        # Scripts, iframes and frames, then the styles, images and SVG links with scan_images
+        for link_type, attrib_name, elements in sources:
+            items+=_populate_items_from_xpath(elements, link_type, attrib_name=attrib_name)
 
         return items
     
@@ -291,17 +496,18 @@ class TakeoverSpider(Spider):
         else:
             return False
 
-    def _get_links_in_response(self, response: Response) -> list[Request]:
+    def _get_links_in_response(self, response: Response, hrefs: list=None) -> list[Request]:
         """
         Extract all the links in the response and yield Scrapy Request objects for each of them.
         :param response: The Scrapy response object.
+        :param hrefs: The hrefs of the links of the page already extracted by the parser pool.
         :return: A list of Scrapy Request objects for each link found in the response.
         """
-        links=response.xpath("//a[@href]")
+        if hrefs is None:
+            hrefs=page_hrefs(response)
         requests_send = list()
         
-        for link in links:
-            href=link.attrib["href"]
+        for href in hrefs:
             target=urljoin(response.url,href)
             targetp=urlparse(target)
             target_fld = get_fld(target)
@@ -309,7 +515,9 @@ class TakeoverSpider(Spider):
             # Yield a new Request if the link is not a fragment, is a valid URL, and is not a link to a file
             if (not href.startswith("#") and self.valid_url(href)):
                 # logger.debug("Yielding a new Request to %s" % target)
-                if (not self._exceded_crawling(target_fld)):
+                if (self.trap_detector and self.trap_detector.is_trap(target_fld, targetp)):
+                    self.logger.debug(f"[TakeoverSpider] In URL {response.url}. Ignoring the link to {target}, as it matches a crawler trap of {target_fld}")
+                elif (not self._exceded_crawling(target_fld)):
                     if (self.use_scrapeops):
                         so_url=self.get_scrapeops_url(url=target)
                         self.logger.debug("Using scrapeos url %s for the target %s" % (so_url,target))
@@ -321,14 +529,60 @@ class TakeoverSpider(Spider):
         
         return requests_send
     
-    def _check_parent_domain_cname_hijack(self, response: Response):
+    def _parent_host(self, response: Response) -> str:
+        """
+        :return: The host of the page of the response (not the one of the proxy).
+        """
+        return urlparse(self.original_url(response.url)).netloc.lower()
+
+    def _claim_parent_host(self, response: Response) -> bool:
+        """
+        :return: True the first time a page of the host of the response is parsed, whose CNAME records must be checked.
+        """
+        host=self._parent_host(response)
+        if (not host or host in self.checked_hosts):
+            return False
+        self.checked_hosts.add(host)
+        return True
+
+    async def _parent_host_items(self, response: Response) -> list[JsLink]:
+        """
+        Check the CNAME records of the host of the response in a thread (the DNS, RDAP and provider queries block),
+        the first time a page of the host is parsed.
+        :return: The JsLink items (LinkType.DIRECT) of the CNAME records of the host, an empty list if it was already checked.
+        """
+        if not self._claim_parent_host(response):
+            return []
+        items = await maybe_deferred_to_future(threads.deferToThread(self._check_parent_host_cname_hijack, response))
+        metrics.inc('parent_host_items', len(items))
+        return items
+
+    def _check_parent_host_cname_hijack(self, response: Response) -> list[JsLink]:
         """
-        Check if the parent domain of the response has a CNAME hijack.
+        Check if the host of the response has a CNAME hijack (blocking, to be called from a thread).
         :param response: The Scrapy response object.
+        :return: The JsLink items (LinkType.DIRECT) of the CNAME records of the host.
         """
-        response_fld=get_fld(response.url)
-        if (not self.already_explored(response_fld)):
-            self.hijacker.detect_cnames_hijack(response_fld, response_fld, LinkType.DIRECT)
+        page_url=self.original_url(response.url)
+        host=urlparse(page_url).netloc.lower()
+        metrics.inc('parent_host_checks')
+        try:
+            return self.hijacker.detect_cnames_hijack(page_url, page_url, LinkType.DIRECT)
+        except Exception as e:
+            self.logger.warning(f"[TakeoverSpider] Could not check the CNAME of the parent host {host}: {e}")
+            return []
+
+    def _save_embedded_hosts(self, response: Response, embedded_urls: list, known_hosts: set):
+        """
+        Save the hosts embedded by the page for the next run of the monitor, counting those it did not embed before.
+        """
+        hosts = set(urlparse(url.strip()).netloc.lower() for url in embedded_urls)
+        hosts.discard('')
+        new_hosts = hosts - known_hosts if known_hosts is not None else hosts
+        if new_hosts:
+            self.crawler.stats.inc_value('monitor/new_embedded_hosts', len(new_hosts))
+        if hosts != known_hosts:
+            self.page_state.save_embedded_hosts(response.url, hosts)
 
     def parse(self, response: Response):
         """
@@ -336,13 +590,43 @@ class TakeoverSpider(Spider):
         :param response: The Scrapy response object.
         :return: A generator of Scrapy Request objects to follow the links that are not JavaScript files.
         """
+        in_pool = self.parser_pool is not None and isinstance(response, HtmlResponse)
+        host = self._parent_host(response)
+        if in_pool or (host and host not in self.checked_hosts):
+            return self._parse_deferred(response, in_pool)
+        return self._parse(response)
+
+    async def _parse_deferred(self, response: Response, in_pool: bool):
+        """
+        Check the CNAME records of the host of the response in a thread and parse the response in the parser pool
+        if in_pool, then check its remote sources and follow its links like parse.
+        """
+        for item in await self._parent_host_items(response):
+            yield item
+        hrefs, sources = None, None
+        if in_pool:
+            try:
+                hrefs, sources = await maybe_deferred_to_future(
+                    self.parser_pool.extract(response.url, response.body, response.encoding)
+                )
+            except Exception as e:
+                # e.g. a worker killed by the OOM killer breaks the pool: parse the page here
+                self.logger.error(f"[PARSER] Could not parse {response.url} in the parser pool: {e}")
+                self.crawler.stats.inc_value('parser_pool/errors')
+        for result in self._parse(response, hrefs, sources):
+            yield result
+
+    def _parse(self, response: Response, hrefs: list=None, sources: list=None):
+        """
+        Check the remote sources of the response and follow its links.
+        :param hrefs: The hrefs of the links of the page, if already extracted by the parser pool.
+        :param sources: The remote sources of the page, if already extracted by the parser pool.
+        """
         self.scrapped_pages+=1
 
-        # Check if this current domain has a CNAME hijack
-        self._check_parent_domain_cname_hijack(response)
-            
         # Yield normal links to parse and crawl down
-        requests_send = self._get_links_in_response(response)
+        with metrics.timer('extract_links'):
+            requests_send = self._get_links_in_response(response, hrefs)
 
         if requests_send:
             # Yield the requests to follow the links
@@ -350,7 +634,21 @@ class TakeoverSpider(Spider):
                 yield request
 
         # Now, check for JavaScript files for each of which will be created a new JsLink item to yield
-        items = self._get_remote_source_items(response)
+        with metrics.timer('extract_resources'):
+            embedded_urls = [] if self.trap_detector or self.page_state is not None else None
+            # In monitor mode, only the hosts the page did not embed in the previous run are checked
+            known_hosts = self.page_state.embedded_hosts(response.url) if self.page_state is not None else None
+            items = self._get_remote_source_items(response, embedded_urls, skip_hosts=known_hosts, sources=sources)
+        if self.trap_detector:
+            # The links are checked by is_trap with their URL, not the one of the proxy
+            page_url = self.original_url(response.url)
+            self.trap_detector.observe(page_url, embedded_urls)
+            fld = get_fld(page_url)
+            if self.pages_counter.get(fld, 0) >= self.max_pages_per_fld:
+                # No more pages of the FLD will be requested
+                self.trap_detector.forget(fld)
+        if self.page_state is not None:
+            self._save_embedded_hosts(response, embedded_urls, known_hosts)
         
         if items:
             self.logger.debug(f"Found {len(items)} remote source items in the response.")
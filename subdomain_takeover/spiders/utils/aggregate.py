@@ -0,0 +1,120 @@
+# Findings aggregated by embedded domain, instead of one record per (page, embedded resource)
+import logging
+import os
+import random
+import sys
+from subdomain_takeover.spiders.utils.writer import BufferedFileWriter
+
+class DomainAggregate:
+    """
+    Findings of one embedded domain (script_domain_fld, hijackable_domain).
+    """
+    __slots__ = ('script_domain_fld', 'hijackable_domain', 'hijackable', 'cname_hijackable', 'links', 'types', 'parent_domains', 'samples')
+
+    def __init__(self, script_domain_fld: str, hijackable_domain: str):
+        self.script_domain_fld = script_domain_fld
+        self.hijackable_domain = hijackable_domain
+        self.hijackable = False
+        self.cname_hijackable = False
+        self.links = 0
+        self.types = {}             # LinkType name -> number of links
+        self.parent_domains = set()
+        self.samples = []           # (parent_url, embedded_url) reservoir
+
+    def to_dict(self) -> dict:
+        return {
+            'script_domain_fld': self.script_domain_fld,
+            'hijackable_domain': self.hijackable_domain,
+            'hijackable': self.hijackable,
+            'cname_hijackable': self.cname_hijackable,
+            'links': self.links,
+            'types': self.types,
+            'parent_domains': len(self.parent_domains),
+            'samples': [{'parent_url': parent_url, 'embedded_url': embedded_url} for parent_url, embedded_url in self.samples],
+        }
+
+class DomainAggregator:
+    """
+    Aggregate the findings by (script_domain_fld, hijackable_domain) as they stream in: the number of links by
+    LinkType, the number of distinct parent domains and a reservoir of max_samples parent and embedded URLs.
+    The memory depends on the number of distinct embedded domains (and of their parent domains), not on the pages.
+
+    On every flush, the aggregates changed since the previous one are appended to file_path, so the last record of
+    each domain is the current one. When closed, the file is rewritten with a single record per domain.
+    """
+    def __init__(
+            self,
+            file_path: str,
+            max_samples: int = 10,
+            compression: str = None,
+            logger: logging.Logger = None
+        ):
+        self.file_path = file_path
+        self.max_samples = max_samples
+        self.compression = compression
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.aggregates = {}    # (script_domain_fld, hijackable_domain) -> DomainAggregate
+        self._dirty = set()
+        self._random = random.Random()
+        # Only flushed explicitly, with the aggregates changed since the last flush
+        self.writer = BufferedFileWriter(file_path, append=False, compression=compression, flush_items=sys.maxsize, flush_secs=float('inf'), logger=self.logger)
+
+    def add(self, item: dict):
+        """
+        Add a finding (a JsLink as returned by item_to_dict) to the aggregate of its embedded domain.
+        """
+        key = (item.get('script_domain_fld'), item.get('hijackable_domain'))
+        aggregate = self.aggregates.get(key)
+        if aggregate is None:
+            aggregate = self.aggregates[key] = DomainAggregate(*(sys.intern(k) if isinstance(k, str) else k for k in key))
+        aggregate.links += 1
+        aggregate.hijackable = aggregate.hijackable or bool(item.get('hijackable'))
+        aggregate.cname_hijackable = aggregate.cname_hijackable or bool(item.get('cname_hijackable'))
+        link_type = item.get('type')
+        aggregate.types[link_type] = aggregate.types.get(link_type, 0) + 1
+        parent_domain = item.get('parent_domain')
+        if parent_domain:
+            aggregate.parent_domains.add(sys.intern(parent_domain))
+
+        # Reservoir sampling: every link has the same probability to be kept
+        sample = (item.get('parent_url'), item.get('embedded_url'))
+        if len(aggregate.samples) < self.max_samples:
+            aggregate.samples.append(sample)
+        else:
+            position = self._random.randrange(aggregate.links)
+            if position < self.max_samples:
+                aggregate.samples[position] = sample
+        self._dirty.add(key)
+
+    def flush(self):
+        """
+        Append the aggregates changed since the last flush.
+        """
+        for key in self._dirty:
+            self.writer.write_json(self.aggregates[key].to_dict())
+        self._dirty.clear()
+        self.writer.flush()
+
+    def flush_stream(self) -> int:
+        """
+        Append the aggregates changed since the last flush and flush the compressor (see BufferedFileWriter.flush_stream).
+        """
+        self.flush()
+        return self.writer.flush_stream()
+
+    def checkpoint(self):
+        self.flush()
+        self.writer.checkpoint()
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        # Keep only the last record of every domain
+        output_path = self.writer.current_path
+        compacted = BufferedFileWriter(f"{self.file_path}.tmp", append=False, compression=self.compression, logger=self.logger)
+        for aggregate in self.aggregates.values():
+            compacted.write_json(aggregate.to_dict())
+        compacted.close()
+        os.replace(compacted.current_path, output_path)
+        self.logger.info(f"[OUTPUT] {len(self.aggregates)} embedded domains written to {output_path}")
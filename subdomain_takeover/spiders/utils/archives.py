@@ -0,0 +1,374 @@
+# Pages of WARC and HAR archives, parsed offline in a pool of processes
+import base64
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import re
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from scrapy.http import Headers, HtmlResponse
+from scrapy.responsetypes import responsetypes
+from subdomain_takeover.spiders.utils.parsing import extract_sources
+
+WARC_EXTENSIONS = ('.warc', '.warc.gz')
+HAR_EXTENSIONS = ('.har', '.har.gz')
+
+_CHUNK_SIZE = 1024 * 1024
+_HAR_ENTRIES = re.compile(r'(?<!\\)"entries"\s*:\s*\[')
+_HAR_SEPARATORS = re.compile(r'[\s,]*')
+
+def expand_archives(paths: list) -> list:
+    """
+    :return: The WARC and HAR files of paths, looking into the directories recursively.
+             A file given more than once (e.g. a file and its directory) is only returned the first time.
+    """
+    files = {}
+    for archive_path in paths:
+        if os.path.isdir(archive_path):
+            for root, _, names in os.walk(archive_path):
+                for name in sorted(names):
+                    if name.endswith(WARC_EXTENSIONS + HAR_EXTENSIONS):
+                        file_path = os.path.join(root, name)
+                        files.setdefault(os.path.realpath(file_path), file_path)
+        else:
+            files.setdefault(os.path.realpath(archive_path), archive_path)
+    return list(files.values())
+
+def _open_archive(file_path: str):
+    return gzip.open(file_path, 'rb') if file_path.endswith('.gz') else open(file_path, 'rb')
+
+def _decode_body(body: bytes, content_encoding: bytes) -> bytes:
+    """
+    Decode the body like HttpCompressionMiddleware, for the archives keeping the transferred bytes.
+    """
+    for encoding in reversed([e.strip().lower() for e in content_encoding.split(b',') if e.strip()]):
+        if encoding in (b'gzip', b'x-gzip'):
+            body = gzip.decompress(body)
+        elif encoding == b'deflate':
+            try:
+                body = zlib.decompress(body)
+            except zlib.error:
+                body = zlib.decompress(body, -zlib.MAX_WBITS)
+        elif encoding == b'br':
+            import brotli
+            body = brotli.decompress(body)
+        elif encoding == b'zstd':
+            from subdomain_takeover.spiders.utils.writer import decompress_bytes
+            body = decompress_bytes(body, 'zstd')
+        elif encoding != b'identity':
+            raise ValueError(f"unsupported Content-Encoding {encoding.decode(errors='replace')}")
+    return body
+
+def _dechunk(body: bytes) -> bytes:
+    chunks = []
+    position = 0
+    while position < len(body):
+        line_end = body.find(b'\r\n', position)
+        if line_end < 0:
+            break
+        size = int(body[position:line_end].split(b';')[0].strip() or b'0', 16)
+        if size == 0:
+            break
+        chunks.append(body[line_end + 2:line_end + 2 + size])
+        position = line_end + 2 + size + 2
+    return b''.join(chunks)
+
+def _html_response(url: str, status: int, headers: Headers, body: bytes) -> HtmlResponse:
+    """
+    :return: The response the downloader would have built for the page, or None if it is not an HTML page.
+    """
+    response_class = responsetypes.from_args(headers=headers, url=url, body=body)
+    if not issubclass(response_class, HtmlResponse):
+        return None
+    return response_class(url=url, status=status, headers=headers, body=body)
+
+def _skip(f, size: int):
+    while size > 0:
+        chunk = f.read(min(size, _CHUNK_SIZE))
+        if not chunk:
+            break
+        size -= len(chunk)
+
+def iter_warc_pages(file_path: str, max_page_bytes: int, skipped: list = None):
+    """
+    Yield the HTML pages (2xx responses) of a WARC file as Scrapy responses, one record at a time.
+    The records of other types, the other pages and the pages over max_page_bytes are skipped without being read in memory.
+    :param skipped: Optional list with one counter, incremented for every skipped response record.
+    """
+    skipped = skipped if skipped is not None else [0]
+    with _open_archive(file_path) as f:
+        while True:
+            line = f.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            if not line.startswith(b'WARC/'):
+                raise ValueError(f"invalid WARC record header {line[:40]!r}")
+            warc_headers = {}
+            for line in iter(f.readline, b''):
+                if not line.strip():
+                    break
+                name, _, value = line.decode('utf-8', errors='replace').partition(':')
+                warc_headers[name.strip().lower()] = value.strip()
+            length = int(warc_headers.get('content-length', 0))
+            if warc_headers.get('warc-type') != 'response' or not warc_headers.get('content-type', '').startswith('application/http'):
+                _skip(f, length)
+                continue
+
+            # HTTP status line and headers of the archived response
+            status_line = f.readline(min(length, 65536))
+            length -= len(status_line)
+            headers = Headers()
+            while length > 0:
+                line = f.readline(min(length, 65536))
+                length -= len(line)
+                if not line.strip():
+                    break
+                name, _, value = line.partition(b':')
+                headers.appendlist(name.strip(), value.strip())
+            try:
+                status = int(status_line.split()[1])
+            except (IndexError, ValueError):
+                status = 0
+            content_type = headers.get(b'Content-Type') or b''
+            if not 200 <= status < 300 or b'html' not in content_type.lower() or length > max_page_bytes:
+                skipped[0] += 1
+                _skip(f, length)
+                continue
+
+            body = f.read(length)
+            try:
+                if b'chunked' in (headers.get(b'Transfer-Encoding') or b'').lower():
+                    body = _dechunk(body)
+                body = _decode_body(body, headers.get(b'Content-Encoding') or b'')
+            except Exception:
+                skipped[0] += 1
+                continue
+            for name in (b'Transfer-Encoding', b'Content-Encoding', b'Content-Length'):
+                headers.pop(name, None)
+            url = warc_headers.get('warc-target-uri', '').strip('<>')
+            response = _html_response(url, status, headers, body) if len(body) <= max_page_bytes else None
+            if response is None:
+                skipped[0] += 1
+                continue
+            yield response
+
+def _iter_har_entries(f):
+    """
+    Yield the entries of a HAR file one at a time, without loading the whole file.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    while True:
+        match = _HAR_ENTRIES.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        chunk = f.read(_CHUNK_SIZE)
+        if not chunk:
+            return
+        # Keep the end of the buffer, in case the key is split between two chunks
+        buffer = buffer[-32:] + chunk
+
+    position = 0
+    read_size = _CHUNK_SIZE
+    while True:
+        position = _HAR_SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            entry, position_end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # The entry is not complete yet, read more of the file
+            chunk = f.read(read_size)
+            if not chunk:
+                return
+            buffer = buffer[position:] + chunk
+            position = 0
+            read_size = max(read_size, len(buffer))
+            continue
+        yield entry
+        position = position_end
+        read_size = _CHUNK_SIZE
+
+def iter_har_pages(file_path: str, max_page_bytes: int, skipped: list = None):
+    """
+    Yield the HTML pages (2xx responses with content) of a HAR file as Scrapy responses, one entry at a time.
+    :param skipped: Optional list with one counter, incremented for every skipped entry.
+    """
+    import io
+    skipped = skipped if skipped is not None else [0]
+    with _open_archive(file_path) as raw, io.TextIOWrapper(raw, encoding='utf-8-sig') as f:
+        for entry in _iter_har_entries(f):
+            try:
+                url = entry['request']['url']
+                har_response = entry['response']
+                status = int(har_response.get('status') or 0)
+                content = har_response.get('content') or {}
+                text = content.get('text')
+                if not 200 <= status < 300 or text is None:
+                    skipped[0] += 1
+                    continue
+                # The browser already decoded the content
+                body = base64.b64decode(text) if content.get('encoding') == 'base64' else text.encode('utf-8')
+                headers = Headers()
+                for header in har_response.get('headers') or []:
+                    if header['name'].lower() not in ('content-encoding', 'transfer-encoding', 'content-length'):
+                        headers.appendlist(header['name'], header['value'])
+                if not headers.get(b'Content-Type') and content.get('mimeType'):
+                    headers[b'Content-Type'] = content['mimeType']
+            except (KeyError, TypeError, ValueError):
+                skipped[0] += 1
+                continue
+            response = _html_response(url, status, headers, body) if len(body) <= max_page_bytes else None
+            if response is None:
+                skipped[0] += 1
+                continue
+            yield response
+
+def iter_archive_pages(file_path: str, max_page_bytes: int, skipped: list = None):
+    if file_path.endswith(HAR_EXTENSIONS):
+        return iter_har_pages(file_path, max_page_bytes, skipped)
+    return iter_warc_pages(file_path, max_page_bytes, skipped)
+
+# State of the worker processes of ArchiveIngester
+_worker = {}
+
+def _init_worker(results, stop, scan_images: bool, max_page_bytes: int, batch_size: int, log_level: str):
+    logging.basicConfig(
+        level=log_level,
+        format='%(asctime)s [%(name)s] %(levelname)s: %(message)s'
+    )
+    # The pages left in the queue when the crawling process stops early are dropped, instead of blocking the exit
+    results.cancel_join_thread()
+    _worker.update(results=results, stop=stop, scan_images=scan_images, max_page_bytes=max_page_bytes, batch_size=batch_size)
+
+def _put(message) -> bool:
+    """
+    Send a message to the crawling process, unless it asked the workers to stop.
+    """
+    while not _worker['stop'].is_set():
+        try:
+            _worker['results'].put(message, timeout=1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def _ingest(file_path: str):
+    """
+    Extract the remote sources of the pages of an archive and send them in batches of (url, sources).
+    """
+    pages = 0
+    skipped = [0]
+    batch = []
+    error = None
+    try:
+        for response in iter_archive_pages(file_path, _worker['max_page_bytes'], skipped):
+            if _worker['stop'].is_set():
+                return
+            pages += 1
+            # The links to other pages are not followed, only the remote sources are needed
+            batch.append((response.url, extract_sources(response, _worker['scan_images'])))
+            if len(batch) >= _worker['batch_size']:
+                if not _put(('pages', batch)):
+                    return
+                batch = []
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        logging.getLogger('archive-ingester').error(f"[ARCHIVES] Could not read {file_path} after {pages} pages: {error}")
+    if batch and not _put(('pages', batch)):
+        return
+    _put(('done', file_path, pages, skipped[0], error))
+
+class ArchiveIngester:
+    """
+    Read the HTML pages of WARC (.warc, .warc.gz) and HAR (.har, .har.gz) files in a pool of processes and
+    extract their remote sources (like ParserPool), handed to the crawling process where TakeoverSpider verifies
+    them once, so the items go through the same pipelines (and the same notifications) as those of a live crawl.
+
+    Each archive is read one record at a time by a single worker and at most `queue_size` batches of pages
+    wait to be verified, so the memory does not depend on the size of the archives.
+    """
+    def __init__(
+            self,
+            archives: list,
+            workers: int = 0,
+            max_page_bytes: int = 10 * 1024 * 1024,
+            queue_size: int = 64,
+            batch_size: int = 500,
+            scan_images: bool = False,
+            log_level: str = 'INFO',
+            logger: logging.Logger = None
+        ):
+        self.archives = expand_archives(archives)
+        self.scan_images = scan_images
+        self.log_level = log_level
+        self.workers = max(1, min(workers or os.cpu_count() or 1, len(self.archives) or 1))
+        self.max_page_bytes = max_page_bytes
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.logger = logger or logging.getLogger('archive-ingester')
+
+        self.pages = 0
+        self.skipped = 0
+        self.failed = 0
+        self._finished = set()
+        self._futures = {}
+        self._pool = None
+
+    def start(self):
+        # Spawned workers do not inherit the threads and the reactor of the crawling process
+        context = multiprocessing.get_context('spawn')
+        self._results = context.Queue(maxsize=self.queue_size)
+        self._stop = context.Event()
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self._results, self._stop, self.scan_images, self.max_page_bytes, self.batch_size, self.log_level)
+        )
+        self._futures = {self._pool.submit(_ingest, file_path): file_path for file_path in self.archives}
+        self.logger.info(f"[ARCHIVES] Reading {len(self.archives)} archives with {self.workers} processes")
+
+    def _finish(self, file_path: str, pages: int, skipped: int, error: str):
+        self._finished.add(file_path)
+        self.pages += pages
+        self.skipped += skipped
+        if error:
+            self.failed += 1
+        self.logger.info(f"[ARCHIVES] Read {pages} pages of {file_path} ({len(self._finished)}/{len(self.archives)} archives)")
+
+    def get(self) -> list:
+        """
+        Wait for the next batch of pages (blocking, to be called from a thread).
+        :return: A list of (url, sources) with the remote sources of the pages (see extract_sources),
+                 or None when all the archives have been read or the ingester was closed.
+        """
+        while len(self._finished) < len(self.archives) and not self._stop.is_set():
+            try:
+                message = self._results.get(timeout=1)
+            except queue.Empty:
+                # A worker that died (e.g. killed by the OOM killer) does not send its 'done' message
+                for future, file_path in self._futures.items():
+                    if file_path not in self._finished and future.done() and not future.cancelled() and future.exception():
+                        self.logger.error(f"[ARCHIVES] The worker reading {file_path} failed: {future.exception()}")
+                        self._finish(file_path, 0, 0, str(future.exception()))
+                continue
+            if message[0] == 'done':
+                self._finish(*message[1:])
+                continue
+            return message[1]
+        return None
+
+    def close(self):
+        if self._pool is None:
+            return
+        self._stop.set()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._pool = None
+        self.logger.info(f"[ARCHIVES] Read {self.pages} pages of {len(self._finished)} archives ({self.skipped} records skipped, {self.failed} archives failed)")
@@ -1,7 +1,17 @@
 # Cache class to cache HTTP responses with pruning capabilities
 import os
+import hashlib
 import heapq
+import mmap
+import shutil
+import sqlite3
+import time
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
 from scrapy.extensions.httpcache import FilesystemCacheStorage
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+from .writer import compress_bytes, decompress_bytes
 from ..takeover import TakeoverSpider
 
 class PrunableFilesystemCacheStorage(FilesystemCacheStorage):
@@ -65,3 +75,365 @@ class PrunableFilesystemCacheStorage(FilesystemCacheStorage):
                 except Exception:
                     continue
         spider.logger.info(f"[HTTPCACHE] Pruned {removed} old cache files to stay under limit")
+
+class IndexedFilesystemCacheStorage(FilesystemCacheStorage):
+    """
+    Filesystem cache storage that keeps a sqlite3 index of the cached entries with their size and last access time.
+    Whole entries (the directory Scrapy writes for each request) are evicted in LRU order as new responses are stored,
+    so the cache stays within HTTPCACHE_MAX_SIZE and HTTPCACHE_MAX_FILES during the whole run.
+    The cache directory is only walked once, to build the index of a cache created without it.
+    """
+    index_file = 'index.sqlite'
+    commit_every = 500
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.max_files = settings.getint('HTTPCACHE_MAX_FILES', 1024)  # Maximum number of entries. 0 = no limit
+        self.max_size_bytes = settings.getint('HTTPCACHE_MAX_SIZE', 100 * 1024 * 1024)  # 0 = no limit
+        self.index = None
+        self.entries = 0
+        self.total_size = 0
+        self._pending = 0
+
+    def open_spider(self, spider: TakeoverSpider):
+        super().open_spider(spider)
+        self.spider_dir = os.path.join(self.cachedir, spider.name)
+        os.makedirs(self.spider_dir, exist_ok=True)
+        index_path = os.path.join(self.spider_dir, self.index_file)
+        build_index = not os.path.exists(index_path)
+
+        self.index = sqlite3.connect(index_path)
+        self.index.execute("PRAGMA journal_mode=WAL")
+        self.index.execute("PRAGMA synchronous=NORMAL")
+        self.index.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, size INTEGER, atime REAL)")
+        self.index.execute("CREATE INDEX IF NOT EXISTS idx_entries_atime ON entries (atime)")
+        if build_index:
+            self._build_index(spider)
+        self.entries, self.total_size = self.index.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        spider.logger.info(f"[HTTPCACHE] Cache index has {self.entries} entries with total size {self.total_size} bytes")
+        self._evict(spider)
+
+    def close_spider(self, spider: TakeoverSpider):
+        if self.index:
+            self.index.commit()
+            self.index.close()
+            self.index = None
+        super().close_spider(spider)
+
+    def _build_index(self, spider):
+        """Index the entries already in the cache directory (only done once, when there is no index)."""
+        spider.logger.info(f"[HTTPCACHE] Building the index of the cache {self.spider_dir}...")
+        rows = []
+        for prefix in os.scandir(self.spider_dir):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.is_dir():
+                    size, atime = self._entry_stat(entry.path)
+                    rows.append((entry.name, size, atime))
+        self.index.executemany("INSERT OR REPLACE INTO entries (key, size, atime) VALUES (?, ?, ?)", rows)
+        self.index.commit()
+
+    @staticmethod
+    def _entry_stat(entry_path):
+        size = 0
+        mtime = 0
+        for f in os.scandir(entry_path):
+            try:
+                stat = f.stat()
+            except OSError:
+                continue
+            size += stat.st_size
+            mtime = max(mtime, stat.st_mtime)
+        return size, mtime
+
+    def _commit(self):
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.index.commit()
+            self._pending = 0
+
+    def retrieve_response(self, spider, request):
+        response = super().retrieve_response(spider, request)
+        if response is not None:
+            key = os.path.basename(self._get_request_path(spider, request))
+            self.index.execute("UPDATE entries SET atime = ? WHERE key = ?", (time.time(), key))
+            self._commit()
+        return response
+
+    def store_response(self, spider, request, response):
+        super().store_response(spider, request, response)
+        rpath = self._get_request_path(spider, request)
+        key = os.path.basename(rpath)
+        size, _ = self._entry_stat(rpath)
+        previous = self.index.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        if previous:
+            self.total_size -= previous[0]
+        else:
+            self.entries += 1
+        self.total_size += size
+        self.index.execute(
+            "INSERT INTO entries (key, size, atime) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET size = excluded.size, atime = excluded.atime",
+            (key, size, time.time())
+        )
+        self._commit()
+        self._evict(spider)
+
+    def _over_limits(self) -> bool:
+        return bool(
+            (self.max_files and self.entries > self.max_files) or
+            (self.max_size_bytes and self.total_size > self.max_size_bytes)
+        )
+
+    def _evict(self, spider):
+        """Remove the least recently used entries until the cache is within its limits."""
+        removed = 0
+        while self._over_limits():
+            oldest = self.index.execute("SELECT key, size FROM entries ORDER BY atime LIMIT 100").fetchall()
+            if not oldest:
+                break
+            for key, size in oldest:
+                if not self._over_limits():
+                    break
+                prefix_dir = os.path.join(self.spider_dir, key[0:2])
+                shutil.rmtree(os.path.join(prefix_dir, key), ignore_errors=True)
+                try:
+                    os.rmdir(prefix_dir)  # Only removed when it is empty
+                except OSError:
+                    pass
+                self.index.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.entries -= 1
+                self.total_size -= size
+                removed += 1
+        if removed:
+            self.index.commit()
+            spider.logger.debug(f"[HTTPCACHE] Evicted {removed} cache entries to stay under the limits")
+
+class DeduplicatedCacheStorage:
+    """
+    HTTP cache storage that compresses the response bodies and stores them by content hash,
+    so identical bodies (error pages, parked domain templates, mirrors...) are stored only once.
+    The entries (request fingerprint, response metadata and body hash) and the reference count and compression
+    of each body are kept in a sqlite3 index, so changing HTTPCACHE_COMPRESSION does not break the bodies already
+    stored. Bodies are read back through a memory map, and an unreadable body is dropped with its entries.
+    The row of a body is added before its file is written, and the bodies left on disk without a row (by a crash
+    before the index was committed) are removed when the spider opens after an unclean shutdown.
+    Expired entries (HTTPCACHE_EXPIRATION_SECS) are ignored, and the least recently used entries are evicted
+    to stay under HTTPCACHE_MAX_SIZE and HTTPCACHE_MAX_FILES.
+    """
+    index_file = 'index.sqlite'
+    # Present while the storage is open: found when opening, the previous run did not close it
+    dirty_file = 'dirty'
+    commit_every = 500
+
+    def __init__(self, settings):
+        self.cachedir = data_path(settings['HTTPCACHE_DIR'])
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self.compression = settings.get('HTTPCACHE_COMPRESSION', 'gzip')
+        self.max_files = settings.getint('HTTPCACHE_MAX_FILES', 1024)  # Maximum number of entries. 0 = no limit
+        self.max_size_bytes = settings.getint('HTTPCACHE_MAX_SIZE', 100 * 1024 * 1024)  # 0 = no limit
+        self.index = None
+        self.entries = 0
+        self.total_size = 0
+        self._pending = 0
+
+    def open_spider(self, spider: TakeoverSpider):
+        self._fingerprinter = spider.crawler.request_fingerprinter
+        self.spider_dir = os.path.join(self.cachedir, f"{spider.name}-dedup")
+        self.blobs_dir = os.path.join(self.spider_dir, 'blobs')
+        os.makedirs(self.blobs_dir, exist_ok=True)
+
+        self.index = sqlite3.connect(os.path.join(self.spider_dir, self.index_file))
+        self.index.execute("PRAGMA journal_mode=WAL")
+        self.index.execute("PRAGMA synchronous=NORMAL")
+        self.index.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                body_hash TEXT,
+                url TEXT,
+                status INTEGER,
+                headers BLOB,
+                size INTEGER,
+                timestamp REAL,
+                atime REAL
+            )
+        ''')
+        self.index.execute("CREATE INDEX IF NOT EXISTS idx_entries_atime ON entries (atime)")
+        self.index.execute("CREATE TABLE IF NOT EXISTS bodies (hash TEXT PRIMARY KEY, refs INTEGER, size INTEGER, compression TEXT)")
+        columns = {row[1] for row in self.index.execute("PRAGMA table_info(bodies)")}
+        if 'compression' not in columns:
+            # The bodies of the older versions were compressed with the setting of the time, most likely the current one
+            self.index.execute("ALTER TABLE bodies ADD COLUMN compression TEXT")
+            self.index.execute("UPDATE bodies SET compression = ?", (self.compression or '',))
+            self.index.commit()
+        dirty_path = os.path.join(self.spider_dir, self.dirty_file)
+        if os.path.exists(dirty_path):
+            self._sweep_orphan_bodies(spider)
+        else:
+            open(dirty_path, 'w').close()
+        self.entries, entries_size = self.index.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        bodies, bodies_size = self.index.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM bodies").fetchone()
+        self.total_size = entries_size + bodies_size
+        spider.logger.info(f"[HTTPCACHE] Deduplicated cache has {self.entries} entries sharing {bodies} bodies, total size {self.total_size} bytes")
+        self._evict(spider)
+
+    def close_spider(self, spider: TakeoverSpider):
+        if self.index:
+            self.index.commit()
+            self.index.close()
+            self.index = None
+            os.remove(os.path.join(self.spider_dir, self.dirty_file))
+
+    def _key(self, request) -> str:
+        return self._fingerprinter.fingerprint(request).hex()
+
+    def _body_path(self, body_hash: str) -> str:
+        return os.path.join(self.blobs_dir, body_hash[0:2], body_hash)
+
+    def _commit(self):
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.index.commit()
+            self._pending = 0
+
+    def _sweep_orphan_bodies(self, spider):
+        """Remove the body files (and the temporary files) that have no row in the index, after an unclean shutdown."""
+        known = set(row[0] for row in self.index.execute("SELECT hash FROM bodies"))
+        removed = 0
+        for prefix in os.listdir(self.blobs_dir):
+            prefix_dir = os.path.join(self.blobs_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                if name not in known:
+                    try:
+                        os.remove(os.path.join(prefix_dir, name))
+                        removed += 1
+                    except OSError:
+                        pass
+        if removed:
+            spider.logger.info(f"[HTTPCACHE] Removed {removed} cached bodies missing from the index")
+
+    def _read_body(self, body_hash: str, compression: str) -> bytes:
+        with open(self._body_path(body_hash), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return decompress_bytes(b'', compression)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return decompress_bytes(mapped, compression)
+
+    def retrieve_response(self, spider, request):
+        """Return response if present in cache, or None otherwise."""
+        key = self._key(request)
+        row = self.index.execute(
+            "SELECT e.body_hash, e.url, e.status, e.headers, e.timestamp, b.compression FROM entries e LEFT JOIN bodies b ON b.hash = e.body_hash WHERE e.key = ?",
+            (key,)
+        ).fetchone()
+        if row is None:
+            return None  # not cached
+        body_hash, url, status, rawheaders, timestamp, compression = row
+        if 0 < self.expiration_secs < time.time() - timestamp:
+            return None  # expired
+        try:
+            body = self._read_body(body_hash, compression or None)
+        except Exception as e:
+            # Missing, truncated or corrupted file (each codec raises its own errors): download the page again
+            spider.logger.warning(f"[HTTPCACHE] Could not read the cached body of {url}, dropping it: {e}")
+            self._drop_body(body_hash)
+            return None
+        self.index.execute("UPDATE entries SET atime = ? WHERE key = ?", (time.time(), key))
+        self._commit()
+        headers = Headers(headers_raw_to_dict(rawheaders))
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        request.meta['cache_timestamp'] = timestamp
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        """Store the given response in the cache."""
+        key = self._key(request)
+        body_hash = hashlib.sha256(response.body).hexdigest()
+        rawheaders = headers_dict_to_raw(response.headers)
+        now = time.time()
+
+        self._acquire_body(body_hash, response.body)
+        previous = self.index.execute("SELECT body_hash, size FROM entries WHERE key = ?", (key,)).fetchone()
+        if previous:
+            self.total_size -= previous[1]
+            self._release_body(previous[0])
+        else:
+            self.entries += 1
+
+        self.index.execute(
+            "INSERT OR REPLACE INTO entries (key, body_hash, url, status, headers, size, timestamp, atime) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, body_hash, response.url, response.status, rawheaders, len(rawheaders), now, now)
+        )
+        self.total_size += len(rawheaders)
+        self._commit()
+        self._evict(spider)
+
+    def _acquire_body(self, body_hash: str, body: bytes):
+        """Add a reference to the body, writing it to disk if it is not stored yet."""
+        if self.index.execute("UPDATE bodies SET refs = refs + 1 WHERE hash = ?", (body_hash,)).rowcount:
+            return
+        path = self._body_path(body_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = compress_bytes(body, self.compression)
+        # Recorded first: a body whose file is not written is dropped when read, like any unreadable body
+        self.index.execute("INSERT INTO bodies (hash, refs, size, compression) VALUES (?, 1, ?, ?)", (body_hash, len(data), self.compression or ''))
+        self.total_size += len(data)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+    def _release_body(self, body_hash: str):
+        """Remove a reference to the body, deleting it when it is no longer used."""
+        self.index.execute("UPDATE bodies SET refs = refs - 1 WHERE hash = ?", (body_hash,))
+        row = self.index.execute("SELECT size FROM bodies WHERE hash = ? AND refs <= 0", (body_hash,)).fetchone()
+        if row:
+            self.index.execute("DELETE FROM bodies WHERE hash = ?", (body_hash,))
+            self.total_size -= row[0]
+            try:
+                os.remove(self._body_path(body_hash))
+            except OSError:
+                pass
+
+    def _drop_body(self, body_hash: str):
+        """Remove an unreadable body and the entries using it."""
+        entries, size = self.index.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE body_hash = ?", (body_hash,)).fetchone()
+        self.index.execute("DELETE FROM entries WHERE body_hash = ?", (body_hash,))
+        self.entries -= entries
+        self.total_size -= size
+        row = self.index.execute("SELECT size FROM bodies WHERE hash = ?", (body_hash,)).fetchone()
+        if row:
+            self.index.execute("DELETE FROM bodies WHERE hash = ?", (body_hash,))
+            self.total_size -= row[0]
+        try:
+            os.remove(self._body_path(body_hash))
+        except OSError:
+            pass
+        self.index.commit()
+
+    def _over_limits(self) -> bool:
+        return bool(
+            (self.max_files and self.entries > self.max_files) or
+            (self.max_size_bytes and self.total_size > self.max_size_bytes)
+        )
+
+    def _evict(self, spider):
+        """Remove the least recently used entries until the cache is within its limits."""
+        removed = 0
+        while self._over_limits():
+            oldest = self.index.execute("SELECT key, body_hash, size FROM entries ORDER BY atime LIMIT 100").fetchall()
+            if not oldest:
+                break
+            for key, body_hash, size in oldest:
+                if not self._over_limits():
+                    break
+                self.index.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._release_body(body_hash)
+                self.entries -= 1
+                self.total_size -= size
+                removed += 1
+        if removed:
+            self.index.commit()
+            spider.logger.debug(f"[HTTPCACHE] Evicted {removed} cache entries to stay under the limits")
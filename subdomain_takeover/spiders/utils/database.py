@@ -1,30 +1,115 @@
 import sqlite3
 import logging
-from subdomain_takeover.items import JsLink
+import os
+import queue
+import threading
+import time
+from subdomain_takeover.items import Finding, JsLink, LinkType
+from subdomain_takeover.spiders.utils.metrics import metrics
+
+# Columns selected to build JsLink items (see TakeoverSpider._row_to_item)
+ITEM_COLUMNS = "hijackable_domain, script_domain_fld, parent_domain, parent_url, embedded_url, hijackable, cname_hijackable, type"
+
+# A finding seen again updates its verdict. run_id is the run that first saw the finding or last changed
+# its verdict, first_run_id the run that first saw it and last_seen_run_id the last run that saw it
+INSERT_LINK = '''
+    INSERT INTO js_links (
+        parent_url,
+        parent_domain,
+        hijackable_domain,
+        hijackable,
+        embedded_url,
+        script_domain_fld,
+        cname_hijackable,
+        type,
+        run_id,
+        first_run_id,
+        last_seen_run_id
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?9, ?9, ?9)
+    ON CONFLICT(parent_url, embedded_url) DO UPDATE SET
+        run_id = CASE
+            WHEN js_links.hijackable IS NOT excluded.hijackable OR js_links.cname_hijackable IS NOT excluded.cname_hijackable
+            THEN excluded.run_id ELSE js_links.run_id END,
+        hijackable_domain = excluded.hijackable_domain,
+        script_domain_fld = excluded.script_domain_fld,
+        hijackable = excluded.hijackable,
+        cname_hijackable = excluded.cname_hijackable,
+        last_seen_run_id = excluded.last_seen_run_id
+'''
+
+# Kinds of changes returned by TakeoverDatabase.iter_changes
+CHANGE_NEW = 'new'
+CHANGE_VERDICT = 'verdict'
+CHANGE_GONE = 'gone'
+
+def row_to_item(row) -> JsLink:
+    """
+    Convert a database row with the ITEM_COLUMNS to a JsLink item.
+    :param row: A tuple containing the database row data.
+    :return: A JsLink item
+    """
+    item = JsLink()
+    item['hijackable_domain'] = row[0]
+    item['script_domain_fld'] = row[1]
+    item['parent_domain'] = row[2]
+    item['parent_url'] = row[3]
+    item['embedded_url'] = row[4]
+    item['hijackable'] = row[5] == 1
+    item['cname_hijackable'] = row[6] == 1
+    item['type'] = LinkType(row[7])
+    return item
 
 class TakeoverDatabase:
-    def __init__(self, settings, logger=None):
+    """
+    Store the JsLink items in a sqlite3 database.
+    Items are inserted by a dedicated writer thread in batches, so saving an item only queues it. The queue keeps
+    compact Finding records, as it can grow to many items when the crawl is faster than the disk.
+    The database runs in WAL mode, so it can be queried while the items are written.
+    With read_only=True (e.g. to query it with report.py), the database is neither created nor upgraded.
+    """
+    _STOP = object()
+
+    def __init__(self, settings, logger=None, read_only: bool = False):
         self.settings = settings
         self.db_name = self.settings.get("DATABASE_FILE", "takeover.db")
-        self.connection = sqlite3.connect(self.db_name)
-        self.cursor = self.connection.cursor()
+        self.batch_size = int(self.settings.get("DATABASE_BATCH_SIZE", 5000))
+        self.flush_secs = float(self.settings.get("DATABASE_FLUSH_SECS", 1))
         self.logger = logger or logging.getLogger(__name__)
-        self.init_database()
+        self.read_only = read_only
+        self.saved = 0
+        self.run_id = None
+        self._connection = None
+        self._queue = queue.Queue()
+        self._writer = None
+        if read_only:
+            self.check_database()
+        else:
+            self.init_database()
 
-    def insert_subdomain(self, subdomain, status):
-        self.cursor.execute('''
-            INSERT INTO subdomains (subdomain, status) VALUES (?, ?)
-        ''', (subdomain, status))
-        self.connection.commit()
+    def _connect(self) -> sqlite3.Connection:
+        if self.read_only:
+            return sqlite3.connect(f"file:{self.db_name}?mode=ro", uri=True)
+        connection = sqlite3.connect(self.db_name)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """
+        Connection used to query the database from the calling thread. Opened on first use.
+        """
+        if self._connection is None:
+            self._connection = self._connect()
+        return self._connection
 
     def init_database(self):
         """
         Initialize the sqlite3 database to store the items.
         """
         # Check if the database is initialized, if not, create the table
-        self.conn = sqlite3.connect(self.db_name)
-        self.cursor = self.conn.cursor()
-        self.cursor.execute('''
+        connection = self._connect()
+        connection.execute('''
             CREATE TABLE IF NOT EXISTS js_links (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 parent_url TEXT,
@@ -35,94 +120,227 @@ class TakeoverDatabase:
                 domain_embedding TEXT,
                 cname_hijackable BOOLEAN,
                 hijackable_fld BOOLEAN,
-                type INTEGER
+                type INTEGER,
+                script_domain_fld TEXT,
+                run_id INTEGER
+            )
+        ''')
+        connection.execute('''
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP
             )
         ''')
-        self.conn.commit()
+        # Databases created by older versions do not have the FLD of the embedded domain nor the run
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(js_links)")]
+        if "script_domain_fld" not in columns:
+            connection.execute("ALTER TABLE js_links ADD COLUMN script_domain_fld TEXT")
+        if "run_id" not in columns:
+            connection.execute("ALTER TABLE js_links ADD COLUMN run_id INTEGER")
+        if "first_run_id" not in columns:
+            connection.execute("ALTER TABLE js_links ADD COLUMN first_run_id INTEGER")
+            connection.execute("ALTER TABLE js_links ADD COLUMN last_seen_run_id INTEGER")
+            connection.execute("UPDATE js_links SET first_run_id = run_id, last_seen_run_id = run_id")
+        connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_js_links_parent_embedded ON js_links (parent_url, embedded_url)")
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_js_links_fld ON js_links (script_domain_fld)")
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_js_links_hijackable ON js_links (hijackable, script_domain_fld)")
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_js_links_parent_domain ON js_links (parent_domain)")
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_js_links_run ON js_links (run_id)")
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_js_links_last_seen_run ON js_links (last_seen_run_id)")
+        connection.commit()
+        connection.close()
         self.logger.info("Database initialized at %s" % self.db_name)
 
+    def check_database(self):
+        """
+        Check that the database exists and has the columns of this version, without modifying it.
+        """
+        if not os.path.exists(self.db_name):
+            raise FileNotFoundError(f"The database '{self.db_name}' does not exist")
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(js_links)")]
+        if "last_seen_run_id" not in columns:
+            raise ValueError(f"The database '{self.db_name}' was created by an older version. Run a crawl to upgrade it")
+
+    def start_run(self) -> int:
+        """
+        Register a new run. The items saved from now on are tagged with its id.
+        """
+        with self.connection:
+            self.run_id = self.connection.execute("INSERT INTO runs DEFAULT VALUES").lastrowid
+        return self.run_id
+
+    def finish_run(self):
+        if self.run_id is not None:
+            self.flush()
+            with self.connection:
+                self.connection.execute("UPDATE runs SET finished_at = CURRENT_TIMESTAMP WHERE id = ?", (self.run_id,))
+
+    def start(self):
+        """
+        Start the writer thread.
+        """
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name="database-writer", daemon=True)
+            self._writer.start()
+
+    def _write_loop(self):
+        connection = self._connect()
+        stopping = False
+        while not stopping:
+            finding = self._queue.get()
+            if finding is self._STOP:
+                break
+            rows = [self._finding_to_row(finding)]
+            deadline = time.monotonic() + self.flush_secs
+            while len(rows) < self.batch_size:
+                try:
+                    finding = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if finding is self._STOP:
+                    stopping = True
+                    break
+                rows.append(self._finding_to_row(finding))
+            try:
+                with metrics.timer('database_batch'), connection:
+                    before = connection.total_changes
+                    connection.executemany(INSERT_LINK, rows)
+                    self.saved += connection.total_changes - before
+            except sqlite3.Error as e:
+                self.logger.error(f"Error saving {len(rows)} items to the database: {e}")
+        connection.close()
+
+    def _finding_to_row(self, finding: Finding) -> tuple:
+        return (
+            finding.parent_url,
+            finding.parent_domain,
+            finding.hijackable_domain,
+            finding.hijackable,
+            finding.embedded_url,
+            finding.script_domain_fld,
+            finding.cname_hijackable,
+            finding.link_type,
+            self.run_id
+        )
+
     def save_item_to_database(self, item: JsLink):
         """
-        Save the JavaScript to the sqlite3 database.
+        Queue the item to be saved to the sqlite3 database. Items already stored are updated with the new verdict.
         """
         if item:
-            # Check if the item is already in the database
-            self.cursor.execute('''
-                SELECT COUNT(*) FROM js_links WHERE parent_url = ? AND embedded_url = ?
-            ''', (item.get('parent_url'), item.get('embedded_url')))
-            count = self.cursor.fetchone()[0]
-            if count > 0:
-                self.logger.debug("Item already exists in the database, skipping: %s" % item)
-            else:
-                # Get the database connection object and save the item 
-                self.logger.debug(f"Saving item to database: {item}")
-                self.cursor.execute('''
-                    INSERT INTO js_links (
-                        parent_url,
-                        parent_domain,
-                        hijackable_domain,
-                        hijackable,
-                        embedded_url,
-                        domain_embedding,
-                        cname_hijackable,
-                        hijackable_fld,
-                        type
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    item.get('parent_url'),
-                    item.get('parent_domain'),
-                    item.get('hijackable_domain'),
-                    item.get('hijackable', False),
-                    item.get('embedded_url'),
-                    item.get('domain_embedding'),
-                    item.get('cname_hijackable', False),
-                    item.get('hijackable_fld', False),
-                    int(item.get('type').value)
-                ))
+            self.start()
+            self._queue.put(Finding.from_jslink(item))
         else:
             self.logger.warning("Attempted to save an empty item to the database.")
 
     def save_items_to_database(self, items):
         """
-        Save multiple JavaScript items to the sqlite3 database in a single transaction.
+        Queue multiple items to be saved to the sqlite3 database.
         """
         if items:
             self.logger.debug(f"Saving {len(items)} items to database")
             for item in items:
-                # Print item details for debugging
-                self.logger.debug(f"Processing item: {item}")
                 self.save_item_to_database(item)
-            self.connection.commit()
-            self.logger.info(f"{len(items)} items saved to database successfully.")
         else:
             self.logger.warning("Attempted to save an empty list of items to the database.")
 
+    def flush(self):
+        """
+        Wait until all the queued items are written.
+        """
+        if self._writer:
+            self._queue.put(self._STOP)
+            self._writer.join()
+            self._writer = None
+
     def get_hijackable_links(self):
         """
         Retrieve all hijackable links from the database.
         """
-        self.cursor.execute('''
-            SELECT * FROM js_links WHERE hijackable = 1
-        ''')
-        return self.cursor.fetchall()
-    
+        return self.connection.execute(f'''
+            SELECT {ITEM_COLUMNS} FROM js_links WHERE hijackable = 1
+        ''').fetchall()
+
     def get_safe_links(self):
         """
-        Retrieve all hijackable links from the database.
+        Retrieve all safe links from the database.
         """
-        self.cursor.execute('''
-            SELECT * FROM js_links WHERE hijackable <> 1
-        ''')
-        return self.cursor.fetchall()
-    
+        return self.connection.execute(f'''
+            SELECT {ITEM_COLUMNS} FROM js_links WHERE hijackable <> 1
+        ''').fetchall()
+
     def get_all_links(self):
         """
         Retrieve all links from the database.
         """
-        self.cursor.execute('''
-            SELECT * FROM js_links
-        ''')
-        return self.cursor.fetchall()
-        
+        return self.connection.execute(f'''
+            SELECT {ITEM_COLUMNS} FROM js_links
+        ''').fetchall()
+
+    def iter_hijackable_flds(self, limit: int = -1, offset: int = 0):
+        """
+        Yield every hijackable FLD with the number of distinct parent domains embedding it.
+        Rows are read from the cursor as they are needed, never loaded all at once.
+        """
+        yield from self.connection.execute('''
+            SELECT script_domain_fld, COUNT(DISTINCT parent_domain), COUNT(*)
+            FROM js_links WHERE hijackable = 1
+            GROUP BY script_domain_fld ORDER BY script_domain_fld
+            LIMIT ? OFFSET ?
+        ''', (limit, offset))
+
+    def iter_embedded_urls(self, script_domain_fld: str, limit: int = -1):
+        """
+        Yield the distinct embedded URLs of the findings of a FLD (read through idx_js_links_fld).
+        """
+        for (embedded_url,) in self.connection.execute(
+            "SELECT DISTINCT embedded_url FROM js_links WHERE script_domain_fld = ? LIMIT ?", (script_domain_fld, limit)
+        ):
+            yield embedded_url
+
+    def iter_parent_findings(self, parent_domain: str, limit: int = -1, offset: int = 0):
+        """
+        Yield the findings of one parent domain.
+        """
+        yield from self.connection.execute(f'''
+            SELECT {ITEM_COLUMNS} FROM js_links WHERE parent_domain = ?
+            ORDER BY id LIMIT ? OFFSET ?
+        ''', (parent_domain, limit, offset))
+
+    def finished_run_id(self, offset: int = 0) -> int:
+        """
+        Id of the last finished run (offset=0), the one before it (offset=1), etc. None if there is no such run.
+        """
+        row = self.connection.execute('''
+            SELECT id FROM runs WHERE finished_at IS NOT NULL ORDER BY id DESC LIMIT 1 OFFSET ?
+        ''', (offset,)).fetchone()
+        return row[0] if row else None
+
+    def iter_changes(self, since_run: int, gone: bool = False, limit: int = -1, offset: int = 0):
+        """
+        Yield the findings first seen (CHANGE_NEW) or whose verdict changed (CHANGE_VERDICT) after the run since_run,
+        as the ITEM_COLUMNS followed by the kind of change.
+        :param gone: Also yield the findings seen by the run since_run but by no later run (CHANGE_GONE).
+        """
+        query = f'''
+            SELECT {ITEM_COLUMNS}, CASE WHEN first_run_id > ?1 THEN '{CHANGE_NEW}' ELSE '{CHANGE_VERDICT}' END, run_id, id
+            FROM js_links WHERE run_id > ?1
+        '''
+        if gone:
+            query += f'''
+                UNION ALL
+                SELECT {ITEM_COLUMNS}, '{CHANGE_GONE}', last_seen_run_id, id
+                FROM js_links WHERE last_seen_run_id = ?1
+            '''
+        query += "ORDER BY 10, 11 LIMIT ?2 OFFSET ?3"
+        for row in self.connection.execute(query, (since_run, limit, offset)):
+            yield row[:9]
+
     def close(self):
-        self.connection.close()
\ No newline at end of file
+        self.flush()
+        if not self.read_only:
+            self.logger.info(f"{self.saved} items saved to the database {self.db_name}")
+        if self._connection:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,231 @@
+# Background delivery of webhook messages, so the crawler never waits on Discord
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from subdomain_takeover.spiders.utils.metrics import metrics
+
+class WebhookDeliveryQueue:
+    """
+    Deliver Discord embeds from a background thread.
+    Embeds queued within batch_secs of each other are merged into a single message (up to MAX_EMBEDS).
+    Rate limits (HTTP 429) are honoured by waiting for Retry-After, and failed deliveries are retried
+    up to max_retries times. Messages that could not be delivered are written to spool_file and queued
+    again the next time the queue is started. They stay in spool_file until close(), so a crash never loses them.
+    close() blocks until the pending messages are delivered or spooled: call it from a thread, not from the reactor.
+    """
+    MAX_EMBEDS = 10  # Discord accepts up to 10 embeds per message
+    _STOP = object()
+
+    def __init__(
+            self,
+            webhook_url: str,
+            username: str,
+            proxies: dict = None,
+            timeout: float = 10,
+            batch_secs: float = 2,
+            max_retries: int = 5,
+            backoff_secs: float = 1,
+            spool_file: str = None,
+            logger: logging.Logger = None
+        ):
+        self.webhook_url = webhook_url
+        self.username = username
+        self.proxies = proxies
+        self.timeout = timeout
+        self.batch_secs = batch_secs
+        self.max_retries = max_retries
+        self.backoff_secs = backoff_secs
+        self.spool_file = spool_file
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.delivered = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._abort = threading.Event()
+        self._lock = threading.Lock()
+        self._inflight = None
+        self._thread = None
+        # Size of the spool queued again by start(), removed from the spool file by close()
+        self._spool_offset = 0
+
+    def start(self):
+        if self._thread:
+            return
+        # Set by close() when the previous thread timed out
+        self._abort.clear()
+        for embed in self._read_spool():
+            self._queue.put(embed)
+        self._thread = threading.Thread(target=self._run, name="discord-delivery", daemon=True)
+        self._thread.start()
+
+    def put(self, embed: dict):
+        """
+        Queue an embed to be delivered. Never blocks.
+        """
+        self.start()
+        self._queue.put(embed)
+
+    def close(self, timeout: float = 30):
+        """
+        Deliver the pending messages, waiting at most timeout seconds. Whatever is left is spooled to disk.
+        The message being posted when the timeout expires is given the time of its request to complete,
+        and is only spooled if it was not delivered.
+        """
+        if not self._thread:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            self._abort.set()
+            pending = []
+            while True:
+                try:
+                    embed = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if embed is not self._STOP:
+                    pending.append(embed)
+            self.logger.warning(f"[DISCORD] Timed out delivering notifications. Spooling {len(pending)} messages to {self.spool_file}")
+            self._spool(pending)
+            # No more retries: the thread spools the message in flight if its last request fails
+            self._thread.join(self.timeout + 1)
+            if self._thread.is_alive():
+                with self._lock:
+                    inflight = self._inflight or []
+                    self._inflight = None
+                self.logger.warning(f"[DISCORD] The webhook is not answering. Spooling {len(inflight)} messages in flight")
+                self._spool(inflight)
+        self._thread = None
+        # The spooled messages queued again are now delivered or spooled a second time, after the offset
+        self._trim_spool()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            embed = self._queue.get()
+            if embed is self._STOP:
+                break
+            batch = [embed]
+            deadline = time.monotonic() + self.batch_secs
+            while len(batch) < self.MAX_EMBEDS:
+                try:
+                    embed = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if embed is self._STOP:
+                    stopping = True
+                    break
+                batch.append(embed)
+            with self._lock:
+                self._inflight = batch
+            delivered = self._deliver(batch)
+            with self._lock:
+                if self._inflight is None:
+                    # close() gave up waiting for this request and already spooled the batch
+                    return
+                self._inflight = None
+            if not delivered:
+                self._spool(batch)
+            if self._abort.is_set():
+                return
+
+    def _deliver(self, embeds: list) -> bool:
+        """
+        Post the embeds in a single message, retrying on rate limits and transient errors.
+        :return: True if Discord accepted the message.
+        """
+        import requests
+        data = {"username": self.username, "embeds": embeds}
+        for attempt in range(self.max_retries + 1):
+            if self._abort.is_set():
+                return False
+            delay = self.backoff_secs * (2 ** attempt)
+            try:
+                with metrics.timer('discord_post'):
+                    if self.proxies:
+                        response = requests.post(url=self.webhook_url, json=data, proxies=self.proxies, verify=False, timeout=self.timeout)
+                    else:
+                        response = requests.post(url=self.webhook_url, json=data, timeout=self.timeout)
+            except requests.RequestException as e:
+                self.logger.warning(f"[DISCORD] Error posting to the webhook (attempt {attempt + 1}): {e}")
+            else:
+                if response.status_code < 300:
+                    self.delivered += len(embeds)
+                    metrics.inc('discord_delivered', len(embeds))
+                    return True
+                if response.status_code == 429:
+                    metrics.inc('discord_rate_limited')
+                    delay = self._retry_after(response, delay)
+                    self.logger.info(f"[DISCORD] Rate limited. Retrying in {delay:.2f} seconds")
+                elif response.status_code < 500:
+                    # The message is rejected and sending it again will not help
+                    self.logger.error(f"[DISCORD] Webhook rejected the message ({response.status_code}): {response.text[:200]}")
+                    self.failed += len(embeds)
+                    return True
+                else:
+                    self.logger.warning(f"[DISCORD] Webhook returned {response.status_code} (attempt {attempt + 1})")
+            if attempt < self.max_retries:
+                self._abort.wait(delay)
+        self.failed += len(embeds)
+        self.logger.error(f"[DISCORD] Giving up delivering {len(embeds)} messages after {self.max_retries + 1} attempts")
+        return False
+
+    @staticmethod
+    def _retry_after(response, default: float) -> float:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is None:
+            try:
+                retry_after = response.json().get("retry_after")
+            except ValueError:
+                pass
+        try:
+            return max(0.0, float(retry_after))
+        except (TypeError, ValueError):
+            return default
+
+    def _spool(self, embeds: list):
+        if not self.spool_file or not embeds:
+            return
+        directory = os.path.dirname(self.spool_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.spool_file, "a") as f:
+            for embed in embeds:
+                f.write(json.dumps(embed) + "\n")
+
+    def _read_spool(self) -> list:
+        """
+        :return: The spooled messages. The spool file is left as it is until _trim_spool().
+        """
+        if not self.spool_file or not os.path.exists(self.spool_file):
+            return []
+        embeds = []
+        with open(self.spool_file, "rb") as f:
+            for line in f:
+                if line.strip():
+                    embeds.append(json.loads(line))
+            self._spool_offset = f.tell()
+        if embeds:
+            self.logger.info(f"[DISCORD] Queued again {len(embeds)} undelivered messages from {self.spool_file}")
+        return embeds
+
+    def _trim_spool(self):
+        """
+        Remove the messages read by _read_spool() from the spool file, keeping those spooled since.
+        """
+        offset, self._spool_offset = self._spool_offset, 0
+        if not offset or not os.path.exists(self.spool_file):
+            return
+        with open(self.spool_file, "rb") as f:
+            f.seek(offset)
+            undelivered = f.read()
+        if not undelivered:
+            os.remove(self.spool_file)
+            return
+        tmp_path = f"{self.spool_file}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(undelivered)
+        os.replace(tmp_path, self.spool_file)
@@ -1,8 +1,8 @@
 import socket
 from datetime import datetime
-import requests
 import logging
 from subdomain_takeover.items import JsLink
+from subdomain_takeover.spiders.utils.delivery import WebhookDeliveryQueue
 
 class TakeoverDiscordBot:
     def __init__(self, webhook_url: str, logger=None, use_proxies=False, settings=None):
@@ -11,6 +11,26 @@ class TakeoverDiscordBot:
         self.settings = settings or {}
         self.webhook_url = webhook_url
         self.hostname = socket.gethostname()
+        # An empty DISCORD_WEBHOOK disables the notifications too
+        self.queue = None
+        if self.webhook_url:
+            self.queue = WebhookDeliveryQueue(
+                webhook_url=self.webhook_url,
+                username=f"{self.hostname} - Domain Takeover Bot",
+                proxies=self.settings.get("PROXIES") if self.use_proxies else None,
+                timeout=float(self.settings.get("DISCORD_TIMEOUT", 10)),
+                batch_secs=float(self.settings.get("DISCORD_BATCH_SECS", 2)),
+                max_retries=int(self.settings.get("DISCORD_MAX_RETRIES", 5)),
+                spool_file=self.settings.get("DISCORD_SPOOL_FILE", "output/discord_spool.jsonl"),
+                logger=self.logger
+            )
+
+    def close(self):
+        """
+        Deliver the pending notifications. Those that can not be delivered are spooled to disk.
+        """
+        if self.queue:
+            self.queue.close(timeout=float(self.settings.get("DISCORD_CLOSE_TIMEOUT", 30)))
 
     def notify_takeover(self, msg_title: str, jslink: JsLink):
         """
@@ -18,51 +38,44 @@ class TakeoverDiscordBot:
         :param msg_title: Title of the message to be sent.
         :param jslink: The JavaScript item containing details about the domain takeover.
         """
-        if self.webhook_url is None:
+        if self.queue is None:
             self.logger.warning("Discord webhook URL is not set. Skipping notification.")
         else:
             now = datetime.now()
             date=now.strftime("%d-%m-%Y")
             time=now.strftime("%H:%M:%S")
-            data={
-                "username": f"{self.hostname} - Domain Takeover Bot"
+            embed={
+                "description" : "Domain Takeover Notification",
+                "title" : msg_title,
+                "fields": [
+                    {
+                        "name": "Date",
+                        "value": f"{date}-{time}"
+                    },
+                    {
+                        "name": "Parent Domain",
+                        "value": str(jslink.get("parent_domain"))
+                    },
+                    {
+                        "name": "Parent URL",
+                        "value": str(jslink.get("parent_url"))
+                    },
+                    {
+                        "name": "Embedded Domain",
+                        "value": "%s (%s)" % (jslink.get("hijackable_fld"), jslink.get("hijackable_domain"))
+                    },
+                    {
+                        "name": "Script",
+                        "value": str(jslink.get("embedded_url"))
+                    },
+                    {
+                        "name": "Link type",
+                        "value": str(jslink.get("type"))
+                    }
+                ]
             }
-            data["embeds"]=[
-                {
-                    "description" : "Domain Takeover Notification",
-                    "title" : msg_title,
-                    "fields": [
-                        {
-                            "name": "Date",
-                            "value": f"{date}-{time}"
-                        },
-                        {
-                            "name": "Parent Domain",
-                            "value": str(jslink.get("parent_domain"))
-                        },
-                        {
-                            "name": "Parent URL",
-                            "value": str(jslink.get("parent_url"))
-                        },
-                        {
-                            "name": "Embedded Domain",
-                            "value": "%s (%s)" % (jslink.get("hijackable_fld"), jslink.get("hijackable_domain"))
-                        },
-                        {
-                            "name": "Script",
-                            "value": str(jslink.get("embedded_url"))
-                        },
-                        {
-                            "name": "Link type",
-                            "value": str(jslink.get("type"))
-                        }
-                    ]
-                }
-            ]
-            if (self.use_proxies):
-                requests.post(url=self.webhook_url,json=dict(data),proxies=self.settings.get("PROXIES"),verify=False)
-            else:
-                requests.post(url=self.webhook_url,json=dict(data))
+            # Queued for the background delivery thread, which sends it along other embeds
+            self.queue.put(embed)
 
     def notify_status(
             self,
@@ -76,45 +89,38 @@ class TakeoverDiscordBot:
         Notify about the status of the crawler via Discord.
         :param status: status message to be sent in the title of the Discord message.
         """
-        if self.webhook_url is None:
+        if self.queue is None:
             self.logger.warning("Discord webhook URL is not set in settings. Skipping notification.")
         else:
             now = datetime.now()
             date=now.strftime("%d-%m-%Y")
             time=now.strftime("%H:%M:%S")
             
-            data={
-                "username": f"{socket.gethostname()} - Domain Takeover Bot"
+            embed={
+                "description" : "Domain Takeover Status",
+                "title" : status,
+                "fields": [
+                    {
+                        "name": "Date",
+                        "value": f"{date}-{time}"
+                    },
+                    {
+                        "name": "File name",
+                        "value": file_name
+                    },
+                    {
+                        "name": "Domains Explored",
+                        "value": f"{registered_domains+orphan_domains}"
+                    },
+                    {
+                        "name": "Scrapped pages",
+                        "value": f"{scrapped_pages}"
+                    },
+                    {
+                        "name": "Hijackable Domains",
+                        "value": f"{orphan_domains}"
+                    }                        
+                ]
             }
-            data["embeds"]=[
-                {
-                    "description" : "Domain Takeover Status",
-                    "title" : status,
-                    "fields": [
-                        {
-                            "name": "Date",
-                            "value": f"{date}-{time}"
-                        },
-                        {
-                            "name": "File name",
-                            "value": file_name
-                        },
-                        {
-                            "name": "Domains Explored",
-                            "value": f"{registered_domains+orphan_domains}"
-                        },
-                        {
-                            "name": "Scrapped pages",
-                            "value": f"{scrapped_pages}"
-                        },
-                        {
-                            "name": "Hijackable Domains",
-                            "value": f"{orphan_domains}"
-                        }                        
-                    ]
-                }
-            ]
-            if (self.use_proxies):
-                requests.post(url=self.webhook_url,json=dict(data),proxies=self.settings.get("PROXIES"),verify=False)
-            else:
-                requests.post(url=self.webhook_url,json=dict(data))
+            # Queued for the background delivery thread, which sends it along other embeds
+            self.queue.put(embed)
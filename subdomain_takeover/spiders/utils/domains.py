@@ -0,0 +1,45 @@
+# First level domain of the URLs, with a public suffix list loaded on first use and never fetched at startup
+import threading
+
+_suffix_list_file = None
+_cache_dir = None
+_extractor = None
+_extractor_lock = threading.Lock()
+
+def configure(suffix_list_file: str = None, cache_dir: str = None):
+    """
+    Use the public suffix list snapshot suffix_list_file if it exists, instead of the one bundled with tldextract.
+    The list is only read the first time a domain is extracted, and the parsed list is cached in cache_dir.
+    """
+    global _suffix_list_file, _cache_dir, _extractor
+    _suffix_list_file = suffix_list_file
+    _cache_dir = cache_dir
+    _extractor = None
+
+def _get_extractor():
+    global _extractor
+    extractor = _extractor
+    if extractor is None:
+        # Built once: tldextract parses the list and builds its suffix trie on the first extraction, which every
+        # thread (e.g. of the verification or the seeds pre-flight) would otherwise do at the same time
+        with _extractor_lock:
+            if _extractor is None:
+                from os import path
+                from tldextract import TLDExtract
+                if _suffix_list_file and path.exists(_suffix_list_file):
+                    suffix_list_urls = (f"file://{path.abspath(_suffix_list_file)}",)
+                else:
+                    # Only the snapshot bundled with tldextract, no network access
+                    suffix_list_urls = ()
+                warm = TLDExtract(cache_dir=_cache_dir, suffix_list_urls=suffix_list_urls, fallback_to_snapshot=True)
+                warm('example.com')
+                _extractor = warm
+            extractor = _extractor
+    return extractor
+
+def tld_extract(url: str):
+    return _get_extractor()(url)
+
+def get_fld(url):
+    ext=tld_extract(url)
+    return f"{ext.domain}.{ext.suffix}"
@@ -1,17 +1,16 @@
 from functools import lru_cache
 import logging
-import requests
-from tldextract import extract as tld_extract
+import threading
+import time
 from subdomain_takeover.items import JsLink, LinkType
 from urllib.parse import urlparse
 from scrapy.spiders import Response
-from dnslib import DNSRecord, RCODE, QTYPE
 from subdomain_takeover.spiders.utils.discord import TakeoverDiscordBot
 from subdomain_takeover.spiders.utils.whois import WhoisRDAP, WhoisClassic
+from subdomain_takeover.spiders.utils.metrics import metrics
+from subdomain_takeover.spiders.utils.domains import get_fld
 
-def get_fld(url):
-    ext=tld_extract(url)
-    return f"{ext.domain}.{ext.suffix}"
+# dnslib and requests are imported where they are used, to keep the start fast
 
 class DomainHijacker:
     """
@@ -25,37 +24,82 @@ class DomainHijacker:
             headers: dict = None,
             discord: TakeoverDiscordBot=None,
             logger: logging.Logger=None,
-            explored_domains: set=None
+            explored_domains: set=None,
+            dns_port: int = None,
+            rdap_url: str = None,
+            whois_fallback: bool = True,
+            rdap_bootstrap_file: str = None,
+            dns_cache_size: int = None,
+            probe_timeout: int = None
         ):
         # Get settings from the provided settings or use defaults
-        self.dns_server = dns_server or settings.get("DNS_SERVER", "8.8.8.8")
-        self.dns_timeout = dns_timeout or settings.get("DNS_TIMEOUT", 5)
-        self.headers = headers or settings.get("HEADERS", {})
+        self.dns_server = dns_server or (settings.get("DNS_SERVER", "8.8.8.8") if settings else "8.8.8.8")
+        self.dns_port = int(dns_port or (settings.get("DNS_PORT", 53) if settings else 53))
+        self.dns_timeout = dns_timeout or (settings.get("DNS_TIMEOUT", 5) if settings else 5)
+        self.headers = headers or (settings.get("HEADERS", {}) if settings else {})
+        self.probe_timeout = probe_timeout or (settings.get("PROBE_TIMEOUT", 10) if settings else 10)
+        dns_cache_size = int(dns_cache_size or (settings.get("DNS_CACHE_SIZE", 10000) if settings else 10000))
+        # Answers of the last dns_cache_size names queried (e.g. warmed up by the seeds pre-flight)
+        self._resolve = lru_cache(maxsize=dns_cache_size)(self._resolve)
+        # Set by _resolve, which only runs on a cache miss, for the query of the current thread
+        self._miss = threading.local()
 
         self.discord = discord
         self.logger = logger or logging.getLogger('domain-hijacker')
-        self.whois_rdap = WhoisRDAP()
-        self.whois_classic = WhoisClassic()
+        self.whois_rdap = WhoisRDAP(rdap_url=rdap_url, bootstrap_file=rdap_bootstrap_file)
+        # The classic WHOIS is only queried when RDAP does not find the domain
+        self.whois_classic = WhoisClassic() if whois_fallback else None
 
-    @lru_cache(maxsize=512)
-    def _query_dns(self, fld: str) -> DNSRecord:
+    def _whois_registered(self, fld: str) -> bool:
+        return self.whois_classic is not None and self.whois_classic.is_registered(fld)
+
+    def _query_dns(self, fld: str) -> "DNSRecord":
         """
         Query the DNS server for the given first-level domain (fld).
-        The function uses an LRU CACHE to cache the results of the DNS queries.
+        The function uses an LRU CACHE (of DNS_CACHE_SIZE names) to cache the results of the DNS queries.
         :param fld: The first-level domain to query (e.g. "example.com").
         :return: A DNSRecord object containing the DNS response.
         """
-        query=DNSRecord.question(fld)
-        dns_response = DNSRecord.parse(
-            query.send(
-                self.dns_server,
-                53, 
-                False,
-                timeout=self.dns_timeout
+        self._miss.value = False
+        dns_response = self._resolve(fld)
+        metrics.inc('dns_cache_misses' if self._miss.value else 'dns_cache_hits')
+        return dns_response
+
+    def _resolve(self, fld: str) -> "DNSRecord":
+        from dnslib import DNSRecord
+        self._miss.value = True
+        with metrics.timer('dns_lookup'):
+            query=DNSRecord.question(fld)
+            dns_response = DNSRecord.parse(
+                query.send(
+                    self.dns_server,
+                    self.dns_port,
+                    False,
+                    timeout=self.dns_timeout
+                )
             )
-        )
         return dns_response
 
+    def _probe(self, url: str) -> "requests.Response":
+        """
+        Request the URL of a provider to check if the resource pointed by a CNAME exists.
+        """
+        import requests
+        with metrics.timer('provider_probe'):
+            return requests.get(url, headers=self.headers, verify=False, timeout=self.probe_timeout)
+
+    def is_unregistered(self, fld: str) -> bool:
+        """
+        Check if the first-level domain is not registered: the DNS returns NXDOMAIN and it is not found with RDAP nor WHOIS.
+        :param fld: The first-level domain to check (e.g. "example.com").
+        :return: True if the domain can be registered.
+        """
+        from dnslib import RCODE
+        dns_response = self._query_dns(fld)
+        if RCODE[dns_response.header.rcode] != 'NXDOMAIN':
+            return False
+        return not self.whois_rdap.is_registered(fld) and not self._whois_registered(fld)
+
     def detect_cnames_hijack(
             self, 
             parent_response_url,
@@ -70,6 +114,7 @@ class DomainHijacker:
         :param link_type: The type of the link (e.g. LinkType.JAVASCRIPT, LinkType.IFRAME, etc.)
         :return: A JsLink item with the hijackable domain information if a CNAME hijack is detected, None otherwise.
         """
+        from dnslib import QTYPE, RCODE
         jsitem=None
         parent_domain_name=urlparse(parent_response_url).netloc
         link_domain_name=urlparse(link_url).netloc
@@ -108,7 +153,7 @@ class DomainHijacker:
                     self.discord.notify_takeover("CNAME Domain Hijack Detected (direct)!",jslink=jsitem)
                 elif ("s3.amazonaws.com" in pointer.lower()):
                     # Check the S3 bucket exists. If not, we can create it ourselves
-                    s3_response=requests.get(pointer,headers=self.headers,verify=False)
+                    s3_response=self._probe(pointer)
                     if (s3_response.status_code == 404 and "NoSuchBucket" in s3_response.text):
                         jsitem['hijackable']=True
                         jsitem["cname_hijackable"]=True
@@ -117,7 +162,7 @@ class DomainHijacker:
                     else:
                         self.logger.debug("The pointer %s is hoste in an S3 bucket, but it is currently taken")
                 elif ("bitbucket.io" in pointer.lower()):
-                    bb_response=requests.get(pointer,headers=self.headers,verify=False)
+                    bb_response=self._probe(pointer)
                     if (bb_response.text == "Repository not found" and bb_response.status_code == 404):
                         jsitem['hijackable']=True
                         jsitem["cname_hijackable"]=True
@@ -126,7 +171,7 @@ class DomainHijacker:
                     else:
                         self.logger.debug("The pointer %s is hoste in an bitbucket, but it is currently taken")
                 elif ("hatenablog.com" in pointer.lower()):
-                    hatena_response=requests.get(pointer,headers=self.headers,verify=False)
+                    hatena_response=self._probe(pointer)
                     if (hatena_response.text == "Blog is not found" and hatena_response.status_code == 404):
                         jsitem['hijackable']=True
                         jsitem["cname_hijackable"]=True
@@ -135,7 +180,7 @@ class DomainHijacker:
                     else:
                         self.logger.debug("The pointer %s is hoste in an hatenablog, but it is currently taken")
                 elif ("helpjuice.com" in pointer.lower()):
-                    hj_response=requests.get(pointer,headers=self.headers,verify=False)
+                    hj_response=self._probe(pointer)
                     if (hj_response.text == "We could not find what you're looking for" and hj_response.status_code == 404):
                         jsitem['hijackable']=True
                         jsitem["cname_hijackable"]=True
@@ -144,7 +189,7 @@ class DomainHijacker:
                     else:
                         self.logger.debug("The pointer %s is hoste in an helpjuice bucket, but it is currently taken")
                 elif ("helpscoutdocs.com" in pointer.lower()):
-                    hs_response=requests.get(pointer,headers=self.headers,verify=False)
+                    hs_response=self._probe(pointer)
                     if (hs_response.text == "No settings were found for this company" and hs_response.status_code == 404):
                         jsitem['hijackable']=True
                         jsitem["cname_hijackable"]=True
@@ -153,11 +198,11 @@ class DomainHijacker:
                     else:
                         self.logger.debug("The pointer %s is hoste in an helpscoutdocs bucket, but it is currently taken")
                 elif ("github.io" in pointer.lower()):
-                    gh_response=requests.get(pointer,headers=self.headers,verify=False)
+                    gh_response=self._probe(pointer)
                     if (gh_response.text == "There isn't a GitHub Pages site here" and gh_response.status_code == 404):
                         # Check if the username is taken in github:
                         gh_username = pointer.split(".")[0].split("//")[-1]
-                        gh_user_response = requests.get(f"https://api.github.com/users/{gh_username}", headers=self.headers, verify=False)
+                        gh_user_response = self._probe(f"https://api.github.com/users/{gh_username}")
                         if gh_user_response.status_code == 404:
                             jsitem['hijackable']=True
                             jsitem["cname_hijackable"]=True
@@ -168,7 +213,7 @@ class DomainHijacker:
                     else:
                         self.logger.debug("The pointer %s is hosted in an GitHub page and exists")
                 elif ("gitbook.io" in pointer.lower()):
-                    ghb_response=requests.get(pointer,headers=self.headers,verify=False)
+                    ghb_response=self._probe(pointer)
                     if ghb_response.status_code == 404:
                         jsitem['hijackable']=True
                         jsitem["cname_hijackable"]=True
@@ -233,14 +278,16 @@ class DomainHijacker:
             jsitem["type"]=link_type
             
             self.logger.debug("Querying first level domain %s to server %s" % (fld,self.dns_server))
+            verification_started = time.perf_counter()
             
             # Query the DNS server for the link domain name
             dns_response = self._query_dns(fld)
 
+            from dnslib import RCODE
             if RCODE[dns_response.header.rcode] == 'NXDOMAIN':
                 # Now, check if the domain is not registered using RDAP
                 if not self.whois_rdap.is_registered(fld):
-                    if not self.whois_classic.is_registered(fld):
+                    if not self._whois_registered(fld):
                         jsitem["hijackable"]=True
                         self.logger.warning("First Level Domain %s (of domain %s) not registered" % (fld,jslp.netloc))
                         self.logger.warning("Used as script source in %s (%s)" % (response.url,source_attr))
@@ -254,6 +301,7 @@ class DomainHijacker:
                     self.logger.info("Used as script source in %s (%s)" % (response.url,source_attr))
             else:
                 self.logger.debug("Third-party domain '%s' (%s) embedded in '%s', but is registered" % (fld, jslp.netloc,respp.netloc))
+            metrics.observe('verification', time.perf_counter() - verification_started)
         # else:
         #     self.logger.debug("Source link %s is not a valid domain or is the same as the response URL %s" % (source_attr, response.url))
 
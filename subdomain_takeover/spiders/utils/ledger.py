@@ -0,0 +1,82 @@
+# Ledger of the findings already notified, to avoid notifying them twice
+import logging
+import os
+from subdomain_takeover.spiders.utils.domains import get_fld
+from subdomain_takeover.items import JsLink
+
+LEDGER_SEPARATOR = '<=>'
+
+def legacy_fld(hijackable_domain: str) -> str:
+    """
+    Get the script_domain_fld of a ledger entry written without it: the FLD of the domain, or for the CNAME
+    findings, stored as 'domain (pointer)', the FLD of the pointer (as detect_cnames_hijack does).
+    """
+    domain, _, pointer = hijackable_domain.partition(' (')
+    if pointer.endswith(')'):
+        return get_fld(pointer[:-1])
+    return get_fld(domain)
+
+class NotificationLedger:
+    """
+    Append-only log of notified findings, indexed in memory by a hash set.
+    The log is read once when the ledger is opened and every new entry is appended to it,
+    so checking if a finding was already notified does not touch the disk.
+
+    Each line of the log contains 'parent_domain<=>hijackable_domain<=>script_domain_fld'.
+    Lines written by older versions only contain the first two fields.
+    """
+    DEDUP_KEYS = ('domains', 'fld')
+
+    def __init__(self, file_path: str = 'output/notifications.txt', dedup_key: str = 'domains', logger=None):
+        if dedup_key not in self.DEDUP_KEYS:
+            raise ValueError(f"Unsupported dedup key '{dedup_key}'. Use one of: {', '.join(self.DEDUP_KEYS)}")
+        self.file_path = file_path
+        self.dedup_key = dedup_key
+        self.logger = logger or logging.getLogger(__name__)
+        self.notified = set()
+        self._file = None
+
+    def open(self):
+        if os.path.exists(self.file_path):
+            with open(self.file_path, 'r') as f:
+                for line in f:
+                    fields = line.strip().split(LEDGER_SEPARATOR)
+                    if len(fields) < 2:
+                        continue
+                    if len(fields) < 3:
+                        # Older entries do not store the FLD
+                        fields.append(legacy_fld(fields[1]))
+                    self.notified.add(self._key(*fields[:3]))
+            self.logger.debug("Loaded %d notified findings from %s" % (len(self.notified), self.file_path))
+        # Line buffered, so every notification is persisted as soon as it is recorded
+        self._file = open(self.file_path, 'a', buffering=1)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _key(self, parent_domain: str, hijackable_domain: str, script_domain_fld: str):
+        if self.dedup_key == 'fld':
+            return script_domain_fld
+        return (parent_domain, hijackable_domain)
+
+    def _item_key(self, item: JsLink):
+        return self._key(item.get('parent_domain'), item.get('hijackable_domain'), item.get('script_domain_fld'))
+
+    def __contains__(self, item: JsLink) -> bool:
+        return self._item_key(item) in self.notified
+
+    def __len__(self) -> int:
+        return len(self.notified)
+
+    def add(self, item: JsLink):
+        """
+        Record the item as notified.
+        """
+        self.notified.add(self._item_key(item))
+        self._file.write(LEDGER_SEPARATOR.join([
+            str(item.get('parent_domain')),
+            str(item.get('hijackable_domain')),
+            str(item.get('script_domain_fld'))
+        ]) + '\n')
@@ -0,0 +1,110 @@
+# Lightweight timings and counters of the hot paths (extraction, DNS, RDAP/WHOIS, probes, pipelines, Discord)
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (in seconds) of the latency buckets
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60
+)
+
+class Histogram:
+    """
+    Fixed buckets histogram. Observing a value is a binary search and two additions.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, p: float) -> float:
+        """
+        Estimate a percentile by interpolating inside the bucket it falls in.
+        """
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+class Metrics:
+    """
+    Registry of counters and latency histograms, shared by all the components of the process.
+    """
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        """
+        Time the block of code and observe the elapsed seconds in the histogram `name`.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def to_stats(self, stats, prefix: str = 'metrics'):
+        """
+        Copy the counters and a summary of the histograms to a Scrapy stats collector.
+        """
+        with self._lock:
+            for name, value in self.counters.items():
+                stats.set_value(f"{prefix}/{name}", value)
+            for name, histogram in self.histograms.items():
+                stats.set_value(f"{prefix}/{name}/count", histogram.count)
+                stats.set_value(f"{prefix}/{name}/sum", round(histogram.sum, 6))
+                stats.set_value(f"{prefix}/{name}/p50", histogram.percentile(50))
+                stats.set_value(f"{prefix}/{name}/p99", histogram.percentile(99))
+
+    def to_prometheus(self, namespace: str = 'jsjack') -> str:
+        """
+        Render the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {namespace}_{name}_total counter")
+                lines.append(f"{namespace}_{name}_total {value}")
+            for name, histogram in sorted(self.histograms.items()):
+                metric = f"{namespace}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+                lines.append(f"{metric}_sum {histogram.sum}")
+                lines.append(f"{metric}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+# Metrics of this process
+metrics = Metrics()
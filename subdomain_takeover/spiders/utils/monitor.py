@@ -0,0 +1,124 @@
+# State of the pages between the runs of the monitor mode: HTTP validators and embedded third-party hosts
+import logging
+import sqlite3
+import time
+
+class PageStateStore:
+    """
+    Keep, for every crawled page, the validators of its last response (ETag and Last-Modified),
+    sent back as If-None-Match and If-Modified-Since by ConditionalRequestMiddleware, and the hosts of the
+    scripts, iframes and frames it embedded, so the next run only verifies the hosts it did not embed before.
+    The pages not revalidated (304) nor fetched again (2xx) by `max_missed_runs` finished runs in a row, e.g. gone,
+    failing or not linked within the crawling limits anymore, are dropped (0 keeps them forever).
+    Used from the reactor thread only. Changes are committed every `commit_every` updates and when closed.
+    """
+    def __init__(self, db_name: str, commit_every: int = 1000, max_missed_runs: int = 3, logger: logging.Logger = None):
+        self.db_name = db_name
+        self.commit_every = commit_every
+        self.max_missed_runs = max_missed_runs
+        self.logger = logger or logging.getLogger(__name__)
+        self._pending = 0
+        self.run_started = time.time()
+        self.connection = sqlite3.connect(db_name)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                embedded_hosts TEXT,
+                checked_at REAL,
+                changed_at REAL,
+                missed_runs INTEGER DEFAULT 0
+            )
+        ''')
+        columns = {row[1] for row in self.connection.execute('PRAGMA table_info(pages)')}
+        if 'missed_runs' not in columns:
+            self.connection.execute('ALTER TABLE pages ADD COLUMN missed_runs INTEGER DEFAULT 0')
+        self.connection.commit()
+
+    def _changed(self):
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        self.connection.commit()
+        self._pending = 0
+
+    def validators(self, url: str) -> tuple:
+        """
+        :return: The ETag and Last-Modified of the last response of the page (None if unknown).
+        """
+        row = self.connection.execute('SELECT etag, last_modified FROM pages WHERE url = ?', (url,)).fetchone()
+        return row if row else (None, None)
+
+    def save_validators(self, url: str, etag: str, last_modified: str):
+        now = time.time()
+        self.connection.execute('''
+            INSERT INTO pages (url, etag, last_modified, checked_at, changed_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET etag = excluded.etag, last_modified = excluded.last_modified,
+                checked_at = excluded.checked_at, changed_at = excluded.changed_at, missed_runs = 0
+        ''', (url, etag, last_modified, now, now))
+        self._changed()
+
+    def not_modified(self, url: str):
+        self.connection.execute('UPDATE pages SET checked_at = ?, missed_runs = 0 WHERE url = ?', (time.time(), url))
+        self._changed()
+
+    def embedded_hosts(self, url: str) -> set:
+        """
+        :return: The hosts embedded by the page in its last run, or None if the page was never parsed.
+        """
+        row = self.connection.execute('SELECT embedded_hosts FROM pages WHERE url = ?', (url,)).fetchone()
+        if not row or row[0] is None:
+            return None
+        return set(row[0].split()) if row[0] else set()
+
+    def save_embedded_hosts(self, url: str, hosts: set):
+        self.connection.execute('''
+            INSERT INTO pages (url, embedded_hosts, checked_at) VALUES (?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET embedded_hosts = excluded.embedded_hosts
+        ''', (url, ' '.join(sorted(hosts)), time.time()))
+        self._changed()
+
+    def iter_urls(self, batch_size: int = 1000):
+        """
+        Yield the URLs of the known pages, reading them in batches.
+        """
+        last_rowid = 0
+        while True:
+            rows = self.connection.execute(
+                'SELECT rowid, url FROM pages WHERE rowid > ? ORDER BY rowid LIMIT ?', (last_rowid, batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            for _, url in rows:
+                yield url
+            last_rowid = rows[-1][0]
+
+    def expire(self) -> int:
+        """
+        Count a missed run for the pages not checked successfully since this run started,
+        and drop those that missed max_missed_runs runs in a row.
+        :return: The number of pages dropped.
+        """
+        self.connection.execute('UPDATE pages SET missed_runs = missed_runs + 1 WHERE checked_at IS NULL OR checked_at < ?', (self.run_started,))
+        expired = 0
+        if self.max_missed_runs:
+            expired = self.connection.execute('DELETE FROM pages WHERE missed_runs >= ?', (self.max_missed_runs,)).rowcount
+            if expired:
+                self.logger.info(f"[MONITOR] Dropped {expired} pages not checked successfully by the last {self.max_missed_runs} runs")
+        self.commit()
+        return expired
+
+    def close(self, finished: bool = False):
+        """
+        :param finished: The run was not stopped early, so the pages it did not check successfully are aged (see expire).
+        :return: The number of pages dropped.
+        """
+        expired = self.expire() if finished else 0
+        self.commit()
+        self.connection.close()
+        return expired
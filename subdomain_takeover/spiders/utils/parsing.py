@@ -0,0 +1,172 @@
+# Extraction of the links and embedded resources of the pages, optionally in a pool of parser processes
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from scrapy.http import HtmlResponse
+from twisted.internet.defer import Deferred
+from subdomain_takeover.items import LinkType
+
+# Resources checked on every page: (XPath, LinkType, attribute with the URL)
+REMOTE_SOURCES = (
+    ("//script[@src]", LinkType.JAVASCRIPT, "src"),
+    ("//iframe[@src]", LinkType.IFRAME, "src"),
+    ("//frame[@src]", LinkType.FRAME, "src"),
+)
+# Resources only checked with SCAN_IMAGES
+IMAGE_SOURCES = (
+    ("//link[@src]", LinkType.STYLE, "src"),
+    ("//img[@src]", LinkType.IMAGE, "src"),
+    ("//svg//a[@href]", LinkType.SVG, "href"),
+)
+
+class ExtractedLink:
+    """
+    Element extracted by a parser process, with the same `attrib` as the Selector it replaces
+    (only the src and href attributes are kept).
+    """
+    __slots__ = ('attrib',)
+
+    def __init__(self, attrib: dict):
+        self.attrib = attrib
+
+    def __reduce__(self):
+        return (ExtractedLink, (self.attrib,))
+
+def page_hrefs(response) -> list:
+    """
+    :return: The href of every link of the page.
+    """
+    return [link.attrib["href"] for link in response.xpath("//a[@href]")]
+
+def remote_sources(response, scan_images: bool = False) -> list:
+    """
+    :return: A list of (LinkType, attribute name, elements) with the elements embedding remote resources of the page.
+    """
+    sources = REMOTE_SOURCES + IMAGE_SOURCES if scan_images else REMOTE_SOURCES
+    return [(link_type, attrib_name, response.xpath(xpath)) for xpath, link_type, attrib_name in sources]
+
+def extract_sources(response, scan_images: bool = False) -> list:
+    """
+    :return: The remote sources of the page (see remote_sources), with ExtractedLink elements cheap to send between processes.
+    """
+    return [
+        (link_type, attrib_name, [
+            ExtractedLink({name: element.attrib[name] for name in ("src", "href") if name in element.attrib})
+            for element in elements
+        ])
+        for link_type, attrib_name, elements in remote_sources(response, scan_images)
+    ]
+
+def extract_page(url: str, body: bytes, encoding: str, scan_images: bool = False) -> tuple:
+    """
+    Parse a page and extract what TakeoverSpider.parse needs, in a form cheap to send between processes.
+    :return: A tuple with the hrefs of the links of the page and its remote sources (see remote_sources).
+    """
+    response = HtmlResponse(url=url, body=body, encoding=encoding)
+    return page_hrefs(response), extract_sources(response, scan_images)
+
+# State of the worker processes of ParserPool
+_worker = {}
+
+def _init_worker(slot_names: list, scan_images: bool):
+    _worker.update(slots=[SharedMemory(name=name) for name in slot_names], scan_images=scan_images)
+
+def _extract(url: str, slot: int, length: int, body: bytes, encoding: str) -> tuple:
+    if slot is not None:
+        body = bytes(_worker['slots'][slot].buf[:length])
+    return extract_page(url, body, encoding, _worker['scan_images'])
+
+class ParserPool:
+    """
+    Parse the pages in a pool of processes, so the lxml parsing and the XPath queries of large pages do not
+    keep the reactor thread (and the downloads) waiting. The workers only extract the links and the remote
+    sources, the verification of the embedded domains and the scheduling of the requests stay in the crawler.
+
+    The bodies are copied once, to one of `slots` blocks of shared memory of `slot_bytes` reused between pages,
+    instead of being pickled through a pipe. Larger bodies, or bodies sent while every block is in use, are pickled.
+    """
+    def __init__(
+            self,
+            workers: int = 0,
+            scan_images: bool = False,
+            slot_bytes: int = 2 * 1024 * 1024,
+            slots: int = 0,
+            logger: logging.Logger = None
+        ):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.scan_images = scan_images
+        self.slot_bytes = slot_bytes
+        self.slots = slots or self.workers * 4
+        self.logger = logger or logging.getLogger('parser-pool')
+
+        self.pages = 0
+        self.copied = 0     # Bodies pickled instead of written to shared memory
+        self._blocks = []
+        self._free = []
+        self._pool = None
+
+    def start(self):
+        self._blocks = [SharedMemory(create=True, size=self.slot_bytes) for _ in range(self.slots)]
+        self._free = list(range(self.slots))
+        # Spawned workers do not inherit the threads and the reactor of the crawling process
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=([block.name for block in self._blocks], self.scan_images)
+        )
+        self.logger.info(f"[PARSER] Parsing the pages with {self.workers} processes")
+
+    def submit(self, url: str, body: bytes, encoding: str):
+        """
+        Send a page to the workers.
+        :return: A concurrent.futures.Future with the result of extract_page.
+        """
+        slot = None
+        if len(body) <= self.slot_bytes:
+            try:
+                slot = self._free.pop()
+            except IndexError:
+                pass
+        self.pages += 1
+        if slot is None:
+            self.copied += 1
+            return self._pool.submit(_extract, url, None, 0, body, encoding)
+        self._blocks[slot].buf[:len(body)] = body
+        future = self._pool.submit(_extract, url, slot, len(body), None, encoding)
+        # The block is reused once the worker is done with it
+        future.add_done_callback(lambda _: self._free.append(slot))
+        return future
+
+    def extract(self, url: str, body: bytes, encoding: str) -> Deferred:
+        """
+        Send a page to the workers, from the reactor thread.
+        :return: A Deferred fired in the reactor thread with the result of extract_page.
+        """
+        from twisted.internet import reactor
+
+        deferred = Deferred()
+
+        def done(future):
+            if future.cancelled():
+                reactor.callFromThread(deferred.cancel)
+            elif future.exception() is not None:
+                reactor.callFromThread(deferred.errback, future.exception())
+            else:
+                reactor.callFromThread(deferred.callback, future.result())
+
+        self.submit(url, body, encoding).add_done_callback(done)
+        return deferred
+
+    def close(self):
+        if self._pool is None:
+            return
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._pool = None
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+        self.logger.info(f"[PARSER] Parsed {self.pages} pages in the pool ({self.copied} bodies not sent through shared memory)")
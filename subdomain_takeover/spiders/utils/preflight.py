@@ -0,0 +1,77 @@
+# Resolution of the hosts of the seeds before the crawl, to skip the dead ones
+import ipaddress
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from subdomain_takeover.items import LinkType
+from subdomain_takeover.spiders.utils.hijacker import DomainHijacker
+
+LIVE = 'live'
+DEAD = 'dead'
+UNKNOWN = 'unknown'     # The DNS server did not answer, or failed (SERVFAIL, REFUSED...): the seed is requested anyway
+
+class SeedPreflight:
+    """
+    Resolve the hosts of the seeds with the DNS server of the DomainHijacker, `concurrency` queries at a time,
+    so the seeds that do not resolve anymore are not requested (and do not wait for DOWNLOAD_TIMEOUT in a
+    download slot), and the answers are in the cache of the hijacker when the pages are parsed.
+    Only the hosts answered with NXDOMAIN, or without an IPv4 address, are dead. The IP addresses are not resolved.
+    The seeds whose host has a CNAME are checked for a takeover right away, even if they are dead.
+    """
+    def __init__(self, hijacker: DomainHijacker, concurrency: int = 64, logger: logging.Logger = None):
+        self.hijacker = hijacker
+        self.concurrency = concurrency
+        self.logger = logger or logging.getLogger('seed-preflight')
+        self._pool = None
+
+    def _check(self, url: str) -> tuple:
+        """
+        :return: A tuple (url, status, reason, items) with the JsLink items of the CNAME checks of the seed.
+        """
+        from dnslib import QTYPE, RCODE
+
+        host = urlparse(url).hostname
+        if not host:
+            # Left to Scrapy, which reports the invalid URLs
+            return (url, LIVE, None, [])
+        try:
+            ipaddress.ip_address(host)
+            return (url, LIVE, None, [])
+        except ValueError:
+            pass
+        try:
+            answer = self.hijacker._query_dns(host)
+        except Exception as e:
+            return (url, UNKNOWN, f"{type(e).__name__}: {e}", [])
+
+        record_types = {QTYPE[record.rtype] for record in answer.rr}
+        items = []
+        if 'CNAME' in record_types:
+            try:
+                items = self.hijacker.detect_cnames_hijack(url, url, LinkType.DIRECT)
+            except Exception as e:
+                self.logger.warning(f"[PREFLIGHT] Could not check the CNAME of {host}: {e}")
+        rcode = RCODE[answer.header.rcode]
+        if rcode == 'NXDOMAIN':
+            return (url, DEAD, rcode, items)
+        if rcode != 'NOERROR':
+            # The name may exist: a failure of its name servers is not a proof that the host is dead
+            return (url, UNKNOWN, rcode, items)
+        if 'A' not in record_types:
+            # Scrapy only connects to IPv4 addresses
+            return (url, DEAD, 'no address', items)
+        return (url, LIVE, None, items)
+
+    def check(self, urls: list) -> list:
+        """
+        Resolve the hosts of the seeds (blocking, to be called from a thread).
+        :return: A list of tuples (url, status, reason, items) in the order of urls.
+        """
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='seed-preflight')
+        return list(self._pool.map(self._check, urls))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,147 @@
+# Profile a whole crawl, including the reactor callbacks and the worker threads
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+
+# Subsystem of a profiled function, by the path of its source file. The first match wins.
+SUBSYSTEMS = (
+    ('spider', ('subdomain_takeover/spiders/takeover.py',)),
+    ('hijacker', ('subdomain_takeover/spiders/utils/hijacker.py', '/dnslib/')),
+    ('whois', ('subdomain_takeover/spiders/utils/whois.py', '/whoisit/', '/whois/')),
+    ('pipelines', ('subdomain_takeover/pipelines.py', 'subdomain_takeover/spiders/utils/database.py',
+                   'subdomain_takeover/spiders/utils/writer.py', 'subdomain_takeover/spiders/utils/ledger.py',
+                   'subdomain_takeover/spiders/utils/discord.py', 'subdomain_takeover/spiders/utils/delivery.py')),
+    ('middlewares', ('subdomain_takeover/middlewares.py', 'scrapy/downloadermiddlewares/', 'scrapy/spidermiddlewares/',
+                     '/scrapy_user_agents/', '/ua_parser/')),
+    ('parsing', ('/parsel/', '/lxml/', '/w3lib/', 'scrapy/linkextractors/', 'scrapy/http/')),
+    ('scrapy', ('/scrapy/',)),
+    ('twisted', ('/twisted/',)),
+)
+
+def subsystem_of(filename: str) -> str:
+    filename = filename.replace(os.sep, '/')
+    for subsystem, patterns in SUBSYSTEMS:
+        if any(pattern in filename for pattern in patterns):
+            return subsystem
+    return 'other'
+
+class _Snapshot:
+    """
+    Stats of a profile taken without disabling it (pstats.Stats would disable it, and only from the calling thread).
+    """
+    def __init__(self, profile: cProfile.Profile):
+        profile.snapshot_stats()
+        self.stats = profile.stats
+
+    def create_stats(self):
+        pass
+
+class CrawlProfiler:
+    """
+    Deterministic profiler (cProfile) of the main thread, where the reactor runs, and of every thread started
+    after it (database writer, Discord delivery, Twisted thread pool...).
+    The stats of all the threads are merged into a single profile file, readable with pstats or snakeviz,
+    and a text summary with the most expensive functions of each subsystem is written next to it.
+    """
+    def __init__(self, profile_file: str, top: int = 10, logger: logging.Logger = None):
+        self.profile_file = profile_file
+        self.top = top
+        self.logger = logger or logging.getLogger('crawl-profiler')
+        self.snapshots = 0
+        self._main = None
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._main:
+            return
+        self._main = cProfile.Profile()
+        self._main.enable()
+        threading.setprofile(self._start_thread)
+        self.logger.info(f"[PROFILE] Profiling the crawl to {self.profile_file}")
+
+    def _start_thread(self, frame, event, arg):
+        # Called once by every new thread, replaced by the profile of the thread
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Since Python 3.12 cProfile uses sys.monitoring and the main profile already covers every thread
+            sys.setprofile(None)
+            return
+        with self._lock:
+            self._threads.append(profile)
+
+    def stats(self) -> pstats.Stats:
+        """
+        Merged stats of all the profiled threads so far. Profiling goes on.
+        """
+        with self._lock:
+            profiles = [self._main] + self._threads
+        stats = pstats.Stats(_Snapshot(profiles[0]))
+        for profile in profiles[1:]:
+            stats.add(_Snapshot(profile))
+        return stats
+
+    def summary(self, stats: pstats.Stats) -> str:
+        """
+        Own time of each subsystem and its most expensive functions.
+        """
+        subsystems = {}
+        for (filename, line, name), (_, calls, tottime, cumtime, callers) in stats.stats.items():
+            source = filename
+            if filename == '~' and callers:
+                # Built-in functions (e.g. re.search) belong to the subsystem of their most expensive caller
+                source = max(callers.items(), key=lambda caller: caller[1][3])[0][0]
+            subsystem = subsystems.setdefault(subsystem_of(source), {'tottime': 0.0, 'functions': []})
+            subsystem['tottime'] += tottime
+            subsystem['functions'].append((tottime, cumtime, calls, f"{filename}:{line}({name})"))
+
+        total = sum(subsystem['tottime'] for subsystem in subsystems.values()) or 1
+        output = io.StringIO()
+        output.write(f"Profile of {total:.3f} seconds of CPU time, {stats.total_calls} calls\n")
+        for name, subsystem in sorted(subsystems.items(), key=lambda s: s[1]['tottime'], reverse=True):
+            output.write(f"\n== {name}: {subsystem['tottime']:.3f}s ({subsystem['tottime'] / total:.1%})\n")
+            output.write(f"{'tottime':>10} {'cumtime':>10} {'calls':>10}  function\n")
+            for tottime, cumtime, calls, function in sorted(subsystem['functions'], reverse=True)[:self.top]:
+                output.write(f"{tottime:10.3f} {cumtime:10.3f} {calls:10d}  {function}\n")
+        return output.getvalue()
+
+    def dump(self, profile_file: str = None):
+        """
+        Write the profile and its summary (profile_file + '.txt').
+        """
+        profile_file = profile_file or self.profile_file
+        directory = os.path.dirname(profile_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        stats = self.stats()
+        stats.dump_stats(profile_file)
+        with open(profile_file + '.txt', 'w') as f:
+            f.write(self.summary(stats))
+        return profile_file
+
+    def snapshot(self):
+        """
+        Write the profile collected so far to a numbered file, without stopping the profiler.
+        """
+        self.snapshots += 1
+        root, ext = os.path.splitext(self.profile_file)
+        profile_file = self.dump(f"{root}.{self.snapshots}{ext}")
+        self.logger.info(f"[PROFILE] Snapshot written to {profile_file}")
+
+    def stop(self):
+        """
+        Stop profiling and write the profile and its summary.
+        """
+        if not self._main:
+            return
+        threading.setprofile(None)
+        self._main.disable()
+        self.dump()
+        self._main = None
+        self.logger.info(f"[PROFILE] Profile written to {self.profile_file} (summary in {self.profile_file}.txt)")
@@ -0,0 +1,195 @@
+# Re-verify the domains found by previous runs without crawling
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlparse
+from subdomain_takeover.spiders.utils.database import TakeoverDatabase
+from subdomain_takeover.spiders.utils.hijacker import DomainHijacker
+from subdomain_takeover.spiders.utils.writer import BufferedFileWriter
+
+class DomainRechecker:
+    """
+    Check again the registration (and the CNAME of the embedded hosts) of the domains found by previous runs.
+    The known domains are read from the global safe and hijackable domain lists, and the embedded URLs of the domains
+    to check from the database of the findings (up to max_hosts_per_fld per domain, through its index on the fld).
+    Only the domains that were hijackable, had dangling CNAMEs or whose verdict is older than max_age_secs are checked.
+    The time of each verdict is kept in verdicts_file, so the next recheck skips the fresh ones. The file is appended
+    while checking and compacted to the last verdict of each domain at the end of the run.
+    The verdict of a fld is its registration only: the dangling CNAMEs of its hosts are reported in the verdict and diff
+    records, but do not move a registered fld to the hijackable domains.
+    """
+    def __init__(
+            self,
+            hijacker: DomainHijacker,
+            database: TakeoverDatabase = None,
+            output_dir: str = 'output',
+            verdicts_file: str = 'output/verdicts.jsonl',
+            max_age_secs: float = 7 * 24 * 3600,
+            concurrency: int = 64,
+            max_hosts_per_fld: int = 50,
+            logger: logging.Logger = None
+        ):
+        self.hijacker = hijacker
+        self.database = database
+        self.output_dir = output_dir
+        self.safe_domains_file = os.path.join(output_dir, 'safe_domains.txt')
+        self.hijackable_domains_file = os.path.join(output_dir, 'hijackable_domains.txt')
+        self.verdicts_file = verdicts_file
+        self.max_age_secs = max_age_secs
+        self.concurrency = concurrency
+        self.max_hosts_per_fld = max_hosts_per_fld
+        self.logger = logger or logging.getLogger('domain-rechecker')
+
+        self.verdicts = {}      # fld -> True if hijackable
+        self.checked_at = {}    # fld -> timestamp of the last verdict
+        self.cnames = {}        # fld -> dangling CNAMEs of its hosts at the last verdict
+        self.hosts = {}         # fld -> URLs of the embedded hosts seen for the fld (only for the due domains)
+
+    def _read_domains(self, file_path: str) -> list:
+        if not os.path.exists(file_path):
+            return []
+        with open(file_path, 'r') as f:
+            return [line.strip() for line in f if line.strip()]
+
+    def load(self):
+        """
+        Load the known domains, their previous verdicts and the time they were checked.
+        """
+        for fld in self._read_domains(self.safe_domains_file):
+            self.verdicts[fld] = False
+        for fld in self._read_domains(self.hijackable_domains_file):
+            self.verdicts[fld] = True
+
+        if os.path.exists(self.verdicts_file):
+            with open(self.verdicts_file, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        verdict = json.loads(line)
+                        self.checked_at[verdict['domain']] = verdict['checked_at']
+                        self.verdicts[verdict['domain']] = verdict['hijackable']
+                        self.cnames[verdict['domain']] = verdict.get('cnames', [])
+        self.logger.info(f"[RECHECK] Loaded {len(self.verdicts)} known domains")
+
+    def due(self) -> list:
+        """
+        Domains to check again: the hijackable ones, those with dangling CNAMEs and those with an expired verdict.
+        """
+        now = time.time()
+        return [
+            fld for fld, hijackable in self.verdicts.items()
+            if hijackable or self.cnames.get(fld) or now - self.checked_at.get(fld, 0) >= self.max_age_secs
+        ]
+
+    def load_hosts(self, flds: list):
+        """
+        Load the embedded URLs of the flds from the database.
+        """
+        if self.database is None:
+            self.logger.warning("[RECHECK] No database of findings: only the registration of the domains is checked")
+            return
+        for fld in flds:
+            self.hosts[fld] = [
+                url for url in self.database.iter_embedded_urls(fld, self.max_hosts_per_fld)
+                if url and urlparse(url).netloc
+            ]
+
+    def _check(self, fld: str) -> dict:
+        """
+        Check the registration of the fld and the CNAME of its embedded hosts.
+        :return: The verdict, or None if the domain could not be checked.
+        """
+        try:
+            hijackable = self.hijacker.is_unregistered(fld)
+            cnames = []
+            for url in self.hosts.get(fld, ()):
+                for item in self.hijacker.detect_cnames_hijack(url, url):
+                    if item['cname_hijackable']:
+                        cnames.append(item['hijackable_domain'])
+        except Exception as e:
+            self.logger.warning(f"[RECHECK] Could not check {fld}: {e}")
+            return None
+        return {
+            'domain': fld,
+            'hijackable': hijackable,
+            'cnames': cnames,
+            'checked_at': time.time()
+        }
+
+    def run(self) -> list:
+        """
+        Check the due domains and write the changes to a diff file.
+        :return: The list of changes ('orphaned' or 'claimed' for the registration of a fld, 'cnames' when the dangling
+                 CNAMEs of its hosts changed).
+        """
+        self.load()
+        due = self.due()
+        self.load_hosts(due)
+        self.logger.info(f"[RECHECK] Checking {len(due)} of {len(self.verdicts)} known domains with {self.concurrency} workers")
+
+        d = datetime.now().strftime("%d%m%Y_%H%M%S")
+        self.diff_file = os.path.join(self.output_dir, f"{d}_recheck_diff.jsonl")
+        verdicts_writer = BufferedFileWriter(self.verdicts_file, append=True, logger=self.logger)
+        diff_writer = BufferedFileWriter(self.diff_file, append=False, logger=self.logger)
+        changes = []
+        checked = 0
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for verdict in pool.map(self._check, due):
+                if verdict is None:
+                    continue
+                checked += 1
+                verdicts_writer.write_json(verdict)
+                fld = verdict['domain']
+                previous = self.verdicts.get(fld)
+                if previous != verdict['hijackable']:
+                    change = dict(verdict, change='orphaned' if verdict['hijackable'] else 'claimed')
+                    diff_writer.write_json(change)
+                    changes.append(change)
+                    self.logger.warning(f"[RECHECK] Domain {fld} was {change['change']}")
+                if set(verdict['cnames']) != set(self.cnames.get(fld, ())):
+                    change = dict(verdict, change='cnames')
+                    diff_writer.write_json(change)
+                    changes.append(change)
+                    self.logger.warning(f"[RECHECK] Dangling CNAMEs of the hosts of {fld}: {', '.join(verdict['cnames']) or 'none'}")
+                self.verdicts[fld] = verdict['hijackable']
+                self.cnames[fld] = verdict['cnames']
+                self.checked_at[fld] = verdict['checked_at']
+                if checked % 1000 == 0:
+                    self.logger.info(f"[RECHECK] Checked {checked}/{len(due)} domains ({checked / (time.monotonic() - started):.1f}/s)")
+        verdicts_writer.close()
+        diff_writer.close()
+
+        self._write_domain_lists()
+        self._compact_verdicts()
+        self.logger.info(f"[RECHECK] Checked {checked} domains: {sum(c['change'] == 'orphaned' for c in changes)} newly orphaned, {sum(c['change'] == 'claimed' for c in changes)} newly claimed, {sum(c['change'] == 'cnames' for c in changes)} with changed dangling CNAMEs. Diff written to {self.diff_file}")
+        return changes
+
+    def _write_domain_lists(self):
+        """
+        Rewrite the global domain lists with the current verdicts.
+        """
+        for file_path, hijackable in ((self.safe_domains_file, False), (self.hijackable_domains_file, True)):
+            tmp_path = file_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                for fld, verdict in self.verdicts.items():
+                    if verdict == hijackable:
+                        f.write(f"{fld}\n")
+            os.replace(tmp_path, file_path)
+
+    def _compact_verdicts(self):
+        """
+        Rewrite the verdicts file with the last verdict of each domain.
+        """
+        tmp_path = self.verdicts_file + '.tmp'
+        with open(tmp_path, 'w') as f:
+            for fld, checked_at in self.checked_at.items():
+                f.write(json.dumps({
+                    'domain': fld,
+                    'hijackable': self.verdicts[fld],
+                    'cnames': self.cnames.get(fld, []),
+                    'checked_at': checked_at
+                }) + '\n')
+        os.replace(tmp_path, self.verdicts_file)
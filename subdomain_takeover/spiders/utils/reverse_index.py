@@ -0,0 +1,302 @@
+# Inverted index from the embedded domains to the parent domains and parent URLs embedding them
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from subdomain_takeover.spiders.utils.domains import get_fld
+from subdomain_takeover.spiders.utils.metrics import metrics
+
+# Posting lists of every embedded FLD and host: ids of the parent domains, or of the parent URLs, embedding it
+FLD_DOMAINS = 0
+FLD_URLS = 1
+HOST_DOMAINS = 2
+HOST_URLS = 3
+
+# Maximum number of ids in a query with IN (the default SQLITE_MAX_VARIABLE_NUMBER of old sqlite versions is 999)
+_MAX_VARIABLES = 900
+
+def encode_postings(ids) -> bytes:
+    """
+    Encode sorted, distinct ids as the varints (LEB128) of their differences.
+    """
+    data = bytearray()
+    previous = 0
+    for value in ids:
+        delta = value - previous
+        previous = value
+        while delta >= 0x80:
+            data.append((delta & 0x7F) | 0x80)
+            delta >>= 7
+        data.append(delta)
+    return bytes(data)
+
+def decode_postings(data: bytes) -> list:
+    ids = []
+    previous = 0
+    value = 0
+    shift = 0
+    for byte in data:
+        if byte & 0x80:
+            value |= (byte & 0x7F) << shift
+            shift += 7
+        else:
+            previous += value | (byte << shift)
+            ids.append(previous)
+            value = 0
+            shift = 0
+    return ids
+
+class ReverseIndex:
+    """
+    Index the (parent, embedded) pairs of the findings by embedded FLD and by embedded host, to find at once
+    every site embedding a domain that became hijackable (or that was registered to neutralise it).
+
+    Domain names and parent URLs are stored once, with an integer id. The ids of the parent domains and of the
+    parent URLs of every embedded FLD and host are stored as blocks of delta-encoded varints: every flush
+    writes a block with the ids of the new pairs, merged with the last blocks of the list while they have fewer
+    than `min_block_ids` ids or less than twice the ids of the new block. A posting list has few blocks
+    (logarithmic in its size), and an update only rewrites the small blocks of the lists it touches.
+    Pairs are written by a dedicated writer thread in batches of `flush_pairs`, or every `flush_secs`.
+    With read_only=True (e.g. to query it with report.py), the index is not created if it does not exist.
+    """
+    _STOP = object()
+
+    def __init__(
+            self,
+            db_name: str,
+            flush_pairs: int = 100000,
+            flush_secs: float = 60,
+            min_block_ids: int = 1024,
+            cache_size: int = 1000000,
+            logger: logging.Logger = None,
+            read_only: bool = False
+        ):
+        self.db_name = db_name
+        self.flush_pairs = flush_pairs
+        self.flush_secs = flush_secs
+        self.min_block_ids = min_block_ids
+        self.cache_size = cache_size
+        self.logger = logger or logging.getLogger(__name__)
+        self.read_only = read_only
+        self.pairs = 0
+        self._connection = None
+        self._queue = queue.Queue()
+        self._writer = None
+        if read_only:
+            if not os.path.exists(db_name):
+                raise FileNotFoundError(f"The reverse index '{db_name}' does not exist")
+        else:
+            self.init_database()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.read_only:
+            return sqlite3.connect(f"file:{self.db_name}?mode=ro", uri=True)
+        connection = sqlite3.connect(self.db_name)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """
+        Connection used to query the index from the calling thread. Opened on first use.
+        """
+        if self._connection is None:
+            self._connection = self._connect()
+        return self._connection
+
+    def init_database(self):
+        connection = self._connect()
+        connection.execute("CREATE TABLE IF NOT EXISTS names (id INTEGER PRIMARY KEY, name TEXT UNIQUE)")
+        connection.execute("CREATE TABLE IF NOT EXISTS urls (id INTEGER PRIMARY KEY, url TEXT UNIQUE, domain_id INTEGER)")
+        connection.execute('''
+            CREATE TABLE IF NOT EXISTS postings (
+                kind INTEGER,
+                key_id INTEGER,
+                block INTEGER,
+                count INTEGER,
+                data BLOB,
+                PRIMARY KEY (kind, key_id, block)
+            ) WITHOUT ROWID
+        ''')
+        connection.commit()
+        connection.close()
+
+    def start(self):
+        """
+        Start the writer thread.
+        """
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name="reverse-index-writer", daemon=True)
+            self._writer.start()
+
+    def add(self, parent_url: str, parent_domain: str, host: str, fld: str):
+        """
+        Queue a (parent, embedded) pair to be indexed.
+        """
+        if not (parent_url and parent_domain and host and fld):
+            return
+        self.start()
+        self._queue.put((parent_url, parent_domain, host, fld))
+
+    def _write_loop(self):
+        connection = self._connect()
+        cache = {'names': {}, 'urls': {}}
+        stopping = False
+        while not stopping:
+            pair = self._queue.get()
+            if pair is self._STOP:
+                break
+            pairs = [pair]
+            deadline = time.monotonic() + self.flush_secs
+            while len(pairs) < self.flush_pairs:
+                try:
+                    pair = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if pair is self._STOP:
+                    stopping = True
+                    break
+                pairs.append(pair)
+            try:
+                with metrics.timer('reverse_index_batch'), connection:
+                    self._write(connection, pairs, cache)
+                self.pairs += len(pairs)
+            except sqlite3.Error as e:
+                self.logger.error(f"[INDEX] Error indexing {len(pairs)} pairs: {e}")
+                # The ids added by the rolled back transaction are not valid
+                for ids in cache.values():
+                    ids.clear()
+            # The ids of the names seen in the run are kept, unless there are too many of them
+            for ids in cache.values():
+                if len(ids) > self.cache_size:
+                    ids.clear()
+        connection.close()
+
+    @staticmethod
+    def _ids(connection: sqlite3.Connection, table: str, column: str, values: set, cache: dict, domain_ids: dict = None) -> dict:
+        """
+        Get the ids of the values, adding the missing ones to the table.
+        """
+        missing = [value for value in values if value not in cache]
+        if missing:
+            if domain_ids is None:
+                connection.executemany(f"INSERT OR IGNORE INTO {table} ({column}) VALUES (?)", ((value,) for value in missing))
+            else:
+                connection.executemany(
+                    f"INSERT OR IGNORE INTO {table} ({column}, domain_id) VALUES (?, ?)",
+                    ((value, domain_ids[value]) for value in missing)
+                )
+            for start in range(0, len(missing), _MAX_VARIABLES):
+                chunk = missing[start:start + _MAX_VARIABLES]
+                placeholders = ','.join('?' * len(chunk))
+                cache.update(connection.execute(f"SELECT {column}, id FROM {table} WHERE {column} IN ({placeholders})", chunk))
+        return cache
+
+    def _write(self, connection: sqlite3.Connection, pairs: list, cache: dict):
+        names = set()
+        for _, parent_domain, host, fld in pairs:
+            names.update((parent_domain, host, fld))
+        name_ids = self._ids(connection, 'names', 'name', names, cache['names'])
+        url_domains = {parent_url: name_ids[parent_domain] for parent_url, parent_domain, _, _ in pairs}
+        url_ids = self._ids(connection, 'urls', 'url', set(url_domains), cache['urls'], url_domains)
+
+        postings = {}   # (kind, key_id) -> ids
+        for parent_url, parent_domain, host, fld in pairs:
+            domain_id = name_ids[parent_domain]
+            url_id = url_ids[parent_url]
+            fld_id = name_ids[fld]
+            host_id = name_ids[host]
+            postings.setdefault((FLD_DOMAINS, fld_id), set()).add(domain_id)
+            postings.setdefault((FLD_URLS, fld_id), set()).add(url_id)
+            postings.setdefault((HOST_DOMAINS, host_id), set()).add(domain_id)
+            postings.setdefault((HOST_URLS, host_id), set()).add(url_id)
+
+        # Blocks of the touched posting lists, with the data of the small ones (the only ones usually merged)
+        blocks = {}     # (kind, key_id) -> [(block, count, data)]
+        keys = {}       # kind -> key_ids
+        for kind, key_id in postings:
+            keys.setdefault(kind, []).append(key_id)
+        for kind, key_ids in keys.items():
+            for start in range(0, len(key_ids), _MAX_VARIABLES):
+                chunk = key_ids[start:start + _MAX_VARIABLES]
+                placeholders = ','.join('?' * len(chunk))
+                for key_id, block, count, data in connection.execute(f'''
+                    SELECT key_id, block, count, CASE WHEN count < ? THEN data END FROM postings
+                    WHERE kind = ? AND key_id IN ({placeholders}) ORDER BY key_id, block
+                ''', (self.min_block_ids, kind, *chunk)):
+                    blocks.setdefault((kind, key_id), []).append((block, count, data))
+
+        deleted = []
+        inserted = []
+        for (kind, key_id), ids in postings.items():
+            key_blocks = blocks.get((kind, key_id), [])
+            # Merge the last blocks into the new one while they are small, or not much larger than it,
+            # dropping the ids indexed more than once
+            while key_blocks and (key_blocks[-1][1] < self.min_block_ids or key_blocks[-1][1] <= 2 * len(ids)):
+                block, _, data = key_blocks.pop()
+                if data is None:
+                    data = connection.execute(
+                        "SELECT data FROM postings WHERE kind = ? AND key_id = ? AND block = ?", (kind, key_id, block)
+                    ).fetchone()[0]
+                ids.update(decode_postings(data))
+                deleted.append((kind, key_id, block))
+            block = key_blocks[-1][0] + 1 if key_blocks else 0
+            inserted.append((kind, key_id, block, len(ids), encode_postings(sorted(ids))))
+        connection.executemany("DELETE FROM postings WHERE kind = ? AND key_id = ? AND block = ?", deleted)
+        connection.executemany("INSERT INTO postings (kind, key_id, block, count, data) VALUES (?, ?, ?, ?, ?)", inserted)
+
+    def flush(self):
+        """
+        Wait until all the queued pairs are indexed.
+        """
+        if self._writer:
+            self._queue.put(self._STOP)
+            self._writer.join()
+            self._writer = None
+
+    def postings(self, kind: int, key: str) -> list:
+        """
+        :return: The sorted ids of the posting list of the key (an embedded FLD or host).
+        """
+        row = self.connection.execute("SELECT id FROM names WHERE name = ?", (key,)).fetchone()
+        if not row:
+            return []
+        ids = set()
+        for (data,) in self.connection.execute("SELECT data FROM postings WHERE kind = ? AND key_id = ?", (kind, row[0])):
+            ids.update(decode_postings(data))
+        return sorted(ids)
+
+    def iter_parents(self, domain: str, urls: bool = False, limit: int = -1, offset: int = 0):
+        """
+        Yield the parent domains embedding resources of the domain, or (parent URL, parent domain) with urls=True.
+        A first level domain matches the resources of all its hosts, any other name only those of that host.
+        """
+        domain = domain.strip().lower().rstrip('.')
+        if get_fld(domain) == domain:
+            kind = FLD_URLS if urls else FLD_DOMAINS
+        else:
+            kind = HOST_URLS if urls else HOST_DOMAINS
+        ids = self.postings(kind, domain)
+        ids = ids[offset:] if limit < 0 else ids[offset:offset + limit]
+        for start in range(0, len(ids), _MAX_VARIABLES):
+            chunk = ids[start:start + _MAX_VARIABLES]
+            placeholders = ','.join('?' * len(chunk))
+            if urls:
+                yield from self.connection.execute(f'''
+                    SELECT urls.url, names.name FROM urls JOIN names ON names.id = urls.domain_id
+                    WHERE urls.id IN ({placeholders}) ORDER BY urls.id
+                ''', chunk)
+            else:
+                for (name,) in self.connection.execute(f"SELECT name FROM names WHERE id IN ({placeholders}) ORDER BY id", chunk):
+                    yield name
+
+    def close(self):
+        self.flush()
+        if self.pairs:
+            self.logger.info(f"[INDEX] {self.pairs} pairs indexed in {self.db_name}")
+        if self._connection:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,93 @@
+# Local snapshots of the data otherwise fetched or computed at every start (public suffix list, RDAP bootstrap, user agents)
+import json
+import logging
+import os
+import shutil
+
+PUBLIC_SUFFIX_LIST = 'public_suffix_list.dat'
+RDAP_BOOTSTRAP = 'rdap_bootstrap.json'
+USER_AGENTS = 'user_agents.json'
+
+PUBLIC_SUFFIX_LIST_URL = 'https://publicsuffix.org/list/public_suffix_list.dat'
+
+def snapshot_path(directory: str, name: str) -> str:
+    return os.path.join(directory or '.', name)
+
+def read_snapshot(file_path: str) -> str:
+    """
+    :return: The content of the snapshot, or None if it does not exist.
+    """
+    try:
+        with open(file_path, 'r') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def write_snapshot(file_path: str, data: str):
+    """
+    Replace the snapshot atomically, so a concurrent start never reads half of it.
+    """
+    directory = os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(data)
+    os.replace(tmp_path, file_path)
+
+def check_snapshots(directory: str, logger: logging.Logger = None) -> list:
+    """
+    Warn at startup about the snapshots that were never downloaded: they are not shipped with the repository
+    (the data folder is ignored by git) and are only created by jsjack.py --update-snapshots.
+    :return: The paths of the missing snapshots.
+    """
+    logger = logger or logging.getLogger(__name__)
+    missing = [
+        file_path for file_path in (snapshot_path(directory, name) for name in (PUBLIC_SUFFIX_LIST, RDAP_BOOTSTRAP))
+        if not os.path.exists(file_path)
+    ]
+    if missing:
+        logger.warning(
+            f"[SNAPSHOTS] Missing {', '.join(missing)}: run jsjack.py --update-snapshots first. Until then, the public "
+            "suffix list bundled with tldextract is used and the RDAP bootstrap data is downloaded on the first RDAP query"
+        )
+    return missing
+
+def update_snapshots(directory: str, timeout: float = 30, logger: logging.Logger = None) -> list:
+    """
+    Download the public suffix list and the RDAP bootstrap data, and group the default user agents.
+    A snapshot that cannot be updated is left as it was.
+    :return: The paths of the updated snapshots.
+    """
+    import requests
+    import whoisit
+    from subdomain_takeover.middlewares import group_user_agents, default_user_agents_file
+
+    logger = logger or logging.getLogger(__name__)
+
+    def public_suffix_list():
+        response = requests.get(PUBLIC_SUFFIX_LIST_URL, timeout=timeout)
+        response.raise_for_status()
+        # tldextract caches the parsed list by the path of the file, not by its content
+        shutil.rmtree(snapshot_path(directory, 'tldextract'), ignore_errors=True)
+        return response.text
+
+    def rdap_bootstrap():
+        whoisit.clear_bootstrapping()
+        whoisit.bootstrap()
+        return whoisit.save_bootstrap_data()
+
+    def user_agents():
+        return json.dumps(group_user_agents(default_user_agents_file()))
+
+    updated = []
+    for name, fetch in ((PUBLIC_SUFFIX_LIST, public_suffix_list), (RDAP_BOOTSTRAP, rdap_bootstrap), (USER_AGENTS, user_agents)):
+        file_path = snapshot_path(directory, name)
+        try:
+            write_snapshot(file_path, fetch())
+        except Exception as e:
+            logger.error(f"[SNAPSHOTS] Could not update {file_path}: {e}")
+            continue
+        updated.append(file_path)
+        logger.info(f"[SNAPSHOTS] Updated {file_path}")
+    return updated
@@ -0,0 +1,125 @@
+# Detection of crawler traps (calendars, faceted search, session ids, endless pagination) by URL pattern
+import logging
+import re
+from urllib.parse import urlparse, parse_qsl, ParseResult
+from subdomain_takeover.spiders.utils.domains import get_fld
+
+_NUMBER = re.compile(r'\d+')
+# Path segments that look like identifiers (session ids, hashes, UUIDs...)
+_IDENTIFIER = re.compile(r'^(?=[^/]*\d)(?:[\w-]{16,}|[0-9a-fA-F-]{8,})$')
+
+def url_pattern(url: ParseResult) -> tuple:
+    """
+    Pattern of a URL: its host, its path with the numbers and identifiers replaced by placeholders,
+    and the names of its query parameters, without their values.
+    e.g. https://www.example.com/events/2024/05?page=3&sort=date -> ('www.example.com', '/events/{n}/{n}', ('page', 'sort'))
+    """
+    segments = []
+    for segment in url.path.split('/'):
+        if _IDENTIFIER.match(segment):
+            segments.append('{id}')
+        else:
+            segments.append(_NUMBER.sub('{n}', segment))
+    query_keys = tuple(sorted({key for key, _ in parse_qsl(url.query, keep_blank_values=True)}))
+    return (url.netloc.lower(), '/'.join(segments), query_keys)
+
+class _PatternStats:
+    __slots__ = ('pages', 'new_references', 'stale_pages')
+
+    def __init__(self):
+        self.pages = 0
+        self.new_references = 0
+        self.stale_pages = 0    # Pages in a row without new third-party references
+
+class CrawlTrapDetector:
+    """
+    Learn the URL patterns of the pages crawled on every first level domain, counting the pages of each pattern
+    and the new third-party references (embedded hosts not seen before on the FLD) they yielded.
+    Once `patience` pages of a pattern in a row yield nothing new, the pattern is saturated and the links
+    matching it are not followed anymore, so the MAX_PAGES_PER_FLD budget is spent on other pages.
+    The state of a FLD is dropped by forget() once it is not crawled anymore, and only the `max_flds` FLDs
+    observed last are kept.
+    """
+    def __init__(
+            self,
+            patience: int = 5,
+            max_patterns_per_fld: int = 1000,
+            max_references_per_fld: int = 10000,
+            max_flds: int = 10000,
+            stats=None,
+            logger: logging.Logger = None
+        ):
+        self.patience = patience
+        self.max_patterns_per_fld = max_patterns_per_fld
+        self.max_references_per_fld = max_references_per_fld
+        self.max_flds = max_flds
+        self.stats = stats
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.patterns = {}      # fld -> {pattern: _PatternStats}, the FLD observed last at the end
+        self.references = {}    # fld -> hosts embedded by the pages of the fld
+        self.saturated = {}     # fld -> saturated patterns
+
+    def _inc_stat(self, key: str):
+        if self.stats is not None:
+            self.stats.inc_value(key)
+
+    def observe(self, url: str, embedded_urls) -> int:
+        """
+        Account a crawled page and the URLs of the resources it embeds.
+        :return: The number of new third-party references of the page.
+        """
+        page = urlparse(url)
+        fld = get_fld(url)
+        patterns = self.patterns.pop(fld, None)
+        if patterns is None:
+            patterns = {}
+            if len(self.patterns) >= self.max_flds:
+                # Drop the state of the FLD observed least recently
+                self.forget(next(iter(self.patterns)))
+                self._inc_stat('traps/flds_evicted')
+        self.patterns[fld] = patterns
+        references = self.references.setdefault(fld, set())
+        new_references = 0
+        for embedded_url in embedded_urls:
+            host = urlparse(embedded_url.strip()).netloc.lower()
+            if host and host != page.netloc and host not in references:
+                new_references += 1
+                if len(references) < self.max_references_per_fld:
+                    references.add(host)
+
+        pattern = url_pattern(page)
+        stats = patterns.get(pattern)
+        if stats is None:
+            if len(patterns) >= self.max_patterns_per_fld:
+                return new_references
+            stats = patterns[pattern] = _PatternStats()
+        stats.pages += 1
+        stats.new_references += new_references
+        stats.stale_pages = 0 if new_references else stats.stale_pages + 1
+
+        if stats.stale_pages >= self.patience and pattern not in self.saturated.get(fld, ()):
+            self.saturated.setdefault(fld, set()).add(pattern)
+            self._inc_stat('traps/patterns_saturated')
+            self.logger.info(f"[TRAPS] Not following more links like {pattern} on {fld}: {stats.pages} pages yielded {stats.new_references} new embedded hosts, none in the last {stats.stale_pages}")
+        return new_references
+
+    def is_trap(self, fld: str, url: ParseResult) -> bool:
+        """
+        :param url: The parsed URL of a link found on a page.
+        :return: True if the link matches a saturated pattern of its fld and should not be followed.
+        """
+        saturated = self.saturated.get(fld)
+        if not saturated or url_pattern(url) not in saturated:
+            return False
+        self._inc_stat('traps/links_skipped')
+        self._inc_stat(f'traps/links_skipped/{fld}')
+        return True
+
+    def forget(self, fld: str):
+        """
+        Drop the state of a FLD that is not crawled anymore (its page budget is spent or its deadline passed).
+        """
+        self.patterns.pop(fld, None)
+        self.references.pop(fld, None)
+        self.saturated.pop(fld, None)
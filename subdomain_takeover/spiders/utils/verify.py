@@ -0,0 +1,144 @@
+# Verify a list of hostnames or URLs without crawling
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urlparse
+from subdomain_takeover.items import JsLink, LinkType, item_to_dict
+from subdomain_takeover.spiders.utils.domains import get_fld
+from subdomain_takeover.spiders.utils.hijacker import DomainHijacker
+from subdomain_takeover.spiders.utils.writer import BufferedFileWriter
+
+class BulkVerifier:
+    """
+    Run the takeover checks of DomainHijacker on hostnames or URLs read from a file (or stdin), one per line.
+    For every input, the registration of its first level domain (NXDOMAIN, RDAP and WHOIS) and the CNAME of its host
+    (dangling providers) are checked, and the findings are written as JsLink JSONL, like the links files of a crawl.
+
+    Inputs are read as they are checked, with at most `concurrency * 4` of them in flight, and the verdicts of the
+    last `cache_size` first level domains are kept, so the memory does not grow with the number of inputs.
+    """
+    def __init__(
+            self,
+            hijacker: DomainHijacker,
+            output_file: str,
+            concurrency: int = 128,
+            cache_size: int = 100000,
+            compression: str = None,
+            logger: logging.Logger = None
+        ):
+        self.hijacker = hijacker
+        self.output_file = output_file
+        self.concurrency = concurrency
+        self.cache_size = cache_size
+        self.compression = compression
+        self.logger = logger or logging.getLogger('bulk-verifier')
+
+        self.checked = 0
+        self.hijackable = 0
+        self.failed = 0
+        self._verdicts = OrderedDict()  # fld -> True if unregistered (LRU)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _iter_inputs(input_file: str):
+        f = sys.stdin if input_file == '-' else open(input_file, 'r')
+        try:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    yield line
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+    @staticmethod
+    def _to_url(target: str) -> str:
+        return target if '://' in target else f"http://{target}/"
+
+    def _is_unregistered(self, fld: str) -> bool:
+        with self._lock:
+            verdict = self._verdicts.get(fld)
+            if verdict is not None:
+                self._verdicts.move_to_end(fld)
+                return verdict
+        verdict = self.hijacker.is_unregistered(fld)
+        with self._lock:
+            self._verdicts[fld] = verdict
+            if len(self._verdicts) > self.cache_size:
+                self._verdicts.popitem(last=False)
+        return verdict
+
+    def _check(self, target: str) -> list:
+        """
+        :return: The JsLink items of the target, or None if it could not be checked.
+        """
+        try:
+            url = self._to_url(target)
+            host = urlparse(url).hostname
+            if not host:
+                self.logger.warning(f"[VERIFY] Skipping invalid input {target}")
+                return None
+            fld = get_fld(url)
+            item = JsLink()
+            item['parent_url'] = None
+            item['parent_domain'] = None
+            item['hijackable_domain'] = host
+            item['script_domain_fld'] = fld
+            item['embedded_url'] = target
+            item['hijackable'] = self._is_unregistered(fld)
+            item['cname_hijackable'] = False
+            item['type'] = LinkType.DIRECT
+            items = [item]
+            if not item['hijackable']:
+                # An unregistered domain has no records, so its CNAME is only checked when it is registered
+                items += self.hijacker.detect_cnames_hijack(url, url, LinkType.DIRECT)
+        except Exception as e:
+            self.logger.warning(f"[VERIFY] Could not check {target}: {e}")
+            return None
+        for item in items:
+            item['embedded_url'] = target
+            item['parent_url'] = None
+            item['parent_domain'] = None
+        return items
+
+    def run(self, input_file: str) -> int:
+        """
+        Check every input of input_file ('-' for stdin).
+        :return: The number of hijackable findings.
+        """
+        writer = BufferedFileWriter(self.output_file, append=False, compression=self.compression, logger=self.logger)
+        started = time.monotonic()
+        pending = set()
+        max_pending = self.concurrency * 4
+
+        def collect(done):
+            for future in done:
+                items = future.result()
+                self.checked += 1
+                if items is None:
+                    self.failed += 1
+                    continue
+                for item in items:
+                    if item['hijackable']:
+                        self.hijackable += 1
+                        self.logger.warning(f"[VERIFY] {item['hijackable_domain']} ({item['embedded_url']}) can be taken over")
+                    writer.write_json(item_to_dict(item))
+                if self.checked % 10000 == 0:
+                    self.logger.info(f"[VERIFY] Checked {self.checked} inputs ({self.checked / (time.monotonic() - started):.1f}/s)")
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for target in self._iter_inputs(input_file):
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending.add(pool.submit(self._check, target))
+            done, _ = wait(pending)
+            collect(done)
+        writer.close()
+
+        elapsed = time.monotonic() - started
+        self.logger.info(f"[VERIFY] Checked {self.checked} inputs in {elapsed:.1f}s ({self.checked / elapsed if elapsed else 0:.1f}/s): {self.hijackable} hijackable, {self.failed} failed. Results written to {writer.current_path}")
+        return self.hijackable
@@ -1,17 +1,65 @@
 from functools import lru_cache
-import whoisit
-import whois
+import threading
+from subdomain_takeover.spiders.utils.metrics import metrics
+from subdomain_takeover.spiders.utils.snapshots import read_snapshot, write_snapshot
+
+# whoisit, whois and requests are imported on first use, most runs only need them for a few domains
 
 class WhoisRDAP:
-    def __init__(self):
-        whoisit.bootstrap()
+    _bootstrap_lock = threading.Lock()
+
+    def __init__(self, rdap_url: str = None, timeout: float = 10, bootstrap_file: str = None):
+        """
+        :param rdap_url: Base URL of a RDAP server to query for every domain (e.g. http://127.0.0.1:8080).
+                         If not set, the RDAP server of each TLD is found with the IANA bootstrap data.
+        :param bootstrap_file: Snapshot of the IANA bootstrap data. Loaded before the first query, or written
+                               after downloading the data if it does not exist yet.
+        """
+        self.rdap_url = rdap_url.rstrip('/') if rdap_url else None
+        self.timeout = timeout
+        self.bootstrap_file = bootstrap_file
+        # One session per thread (requests sessions are not thread-safe), keeping the connections to the RDAP servers open
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            session = self._local.session = requests.Session()
+        return session
+
+    def _bootstrap(self):
+        import whoisit
+        with self._bootstrap_lock:
+            if whoisit.is_bootstrapped():
+                return
+            snapshot = read_snapshot(self.bootstrap_file) if self.bootstrap_file else None
+            if snapshot:
+                whoisit.load_bootstrap_data(snapshot)
+                return
+            whoisit.bootstrap()
+            if self.bootstrap_file:
+                write_snapshot(self.bootstrap_file, whoisit.save_bootstrap_data())
 
     @lru_cache(maxsize=128)
     def fetch_whois_data(self, domain: str):
+        metrics.inc('rdap_queries')
         try:
-            return whoisit.domain(domain)
+            with metrics.timer('rdap_query'):
+                return self._fetch(domain)
         except Exception as e:
             return {}
+
+    def _fetch(self, domain: str):
+        if self.rdap_url:
+            response = self._session().get(f"{self.rdap_url}/domain/{domain}", timeout=self.timeout)
+            if response.status_code != 200:
+                return {}
+            data = response.json()
+            return {'name': data.get('ldhName', domain), 'raw': data}
+        import whoisit
+        self._bootstrap()
+        return whoisit.domain(domain, session=self._session())
         
     def is_registered(self, domain: str) -> bool:
         whois_data = self.fetch_whois_data(domain)
@@ -22,8 +70,11 @@ class WhoisRDAP:
 class WhoisClassic:
     @lru_cache(maxsize=128)
     def fetch_whois_data(self, domain: str):
+        metrics.inc('whois_queries')
         try:
-            return whois.whois(domain)
+            import whois
+            with metrics.timer('whois_query'):
+                return whois.whois(domain)
         except Exception as e:
             return {}
         
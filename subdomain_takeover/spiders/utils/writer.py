@@ -0,0 +1,222 @@
+# Buffered writers for the output files (per-run link files and global domain lists)
+import gzip
+import io
+import json
+import logging
+import os
+import time
+
+COMPRESSION_EXTENSIONS = {
+    None: "",
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+
+def _zstd_module():
+    """
+    Return a module exposing the ZstdFile API (Python 3.14 'compression.zstd' or 'backports.zstd'),
+    or the 'zstandard' package as a last resort.
+    """
+    try:
+        from compression import zstd
+        return zstd
+    except ImportError:
+        pass
+    try:
+        from backports import zstd
+        return zstd
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        raise ImportError("zstd compression requires Python 3.14+, 'backports.zstd' or 'zstandard' to be installed")
+
+def compress_bytes(data: bytes, compression: str = None) -> bytes:
+    """
+    Compress a buffer in one go with None, 'gzip' or 'zstd'.
+    """
+    if compression is None:
+        return data
+    if compression == "gzip":
+        return gzip.compress(data)
+    if compression == "zstd":
+        zstd = _zstd_module()
+        if hasattr(zstd, "ZstdCompressor") and hasattr(zstd.ZstdCompressor, "stream_writer"):
+            return zstd.ZstdCompressor().compress(data)
+        return zstd.compress(data)
+    raise ValueError(f"Unsupported compression '{compression}'. Use one of: gzip, zstd")
+
+def decompress_bytes(data, compression: str = None) -> bytes:
+    """
+    Decompress a bytes-like object (e.g. a memory map) compressed with compress_bytes.
+    """
+    if compression is None:
+        return bytes(data)
+    if compression == "gzip":
+        return gzip.decompress(data)
+    if compression == "zstd":
+        zstd = _zstd_module()
+        if hasattr(zstd, "ZstdDecompressor") and hasattr(zstd.ZstdDecompressor, "stream_reader"):
+            return zstd.ZstdDecompressor().decompress(data)
+        return zstd.decompress(data)
+    raise ValueError(f"Unsupported compression '{compression}'. Use one of: gzip, zstd")
+
+def open_compressed(raw, compression: str = None, mode: str = "wb"):
+    """
+    Wrap an already opened binary file object with the requested compression.
+    :param raw: The underlying binary file object.
+    :param compression: None, 'gzip' or 'zstd'.
+    :param mode: 'wb' to write or 'rb' to read.
+    :return: A file-like object reading or writing (de)compressed bytes.
+    """
+    if compression is None:
+        return raw
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=raw, mode=mode)
+    if compression == "zstd":
+        zstd = _zstd_module()
+        if hasattr(zstd, "ZstdFile"):
+            return zstd.ZstdFile(raw, mode=mode[0])
+        if mode.startswith("r"):
+            return zstd.ZstdDecompressor().stream_reader(raw)
+        return zstd.ZstdCompressor().stream_writer(raw, closefd=False)
+    raise ValueError(f"Unsupported compression '{compression}'. Use one of: gzip, zstd")
+
+def open_text_output(file_path: str):
+    """
+    Open an output file for reading as text, decompressing .gz and .zst files.
+    """
+    if file_path.endswith(COMPRESSION_EXTENSIONS["gzip"]):
+        return gzip.open(file_path, "rt")
+    if file_path.endswith(COMPRESSION_EXTENSIONS["zstd"]):
+        return io.TextIOWrapper(open_compressed(open(file_path, "rb"), "zstd", mode="rb"))
+    return open(file_path, "r")
+
+def fsync_descriptors(fds: list):
+    """
+    Force the files of the descriptors (see BufferedFileWriter.flush_stream) to disk and close the descriptors.
+    """
+    for fd in fds:
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+class BufferedFileWriter:
+    """
+    Append lines to a file through an in-memory buffer.
+    The file is opened once and the buffer is written in batches, either when it holds flush_items lines
+    or when flush_secs seconds have passed since the last flush. Optionally, the output is compressed
+    and rotated to a new part once the file on disk reaches max_bytes.
+    """
+    def __init__(
+            self,
+            file_path: str,
+            append: bool = True,
+            compression: str = None,
+            max_bytes: int = 0,
+            flush_items: int = 1000,
+            flush_secs: float = 5,
+            logger: logging.Logger = None
+        ):
+        if compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError(f"Unsupported compression '{compression}'. Use one of: gzip, zstd")
+        self.logger = logger or logging.getLogger(__name__)
+        self.base_path = file_path
+        self.append = append
+        self.compression = compression
+        self.max_bytes = max_bytes      # 0 = no rotation
+        self.flush_items = flush_items
+        self.flush_secs = flush_secs
+
+        self.part = 0
+        self.lines_written = 0
+        self.files = []
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._raw = None
+        self._stream = None
+        self._open_part()
+
+    @property
+    def current_path(self) -> str:
+        root, ext = os.path.splitext(self.base_path)
+        suffix = f".{self.part}" if self.part else ""
+        return f"{root}{suffix}{ext}{COMPRESSION_EXTENSIONS[self.compression]}"
+
+    def _open_part(self):
+        directory = os.path.dirname(self.current_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._raw = open(self.current_path, "ab" if self.append else "wb")
+        self._stream = open_compressed(self._raw, self.compression)
+        self.files.append(self.current_path)
+
+    def _close_part(self, fsync: bool = True):
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.flush()
+        if fsync:
+            os.fsync(self._raw.fileno())
+        self._raw.close()
+
+    def write_line(self, line: str):
+        """
+        Buffer a single line (without the trailing new line) and flush if the batch is full or due.
+        """
+        self._buffer.append(line)
+        if len(self._buffer) >= self.flush_items or time.monotonic() - self._last_flush >= self.flush_secs:
+            self.flush()
+
+    def write_json(self, obj: dict):
+        """
+        Buffer an object as a single line of newline-delimited JSON.
+        """
+        self.write_line(json.dumps(obj))
+
+    def flush(self):
+        """
+        Write the buffered lines to the file and rotate it if it grew over max_bytes.
+        """
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        data = ("\n".join(self._buffer) + "\n").encode("utf-8")
+        self.lines_written += len(self._buffer)
+        self._buffer = []
+        self._stream.write(data)
+        self._raw.flush()
+        if self.max_bytes and self._raw.tell() >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        """
+        Close the current part and continue writing in a new one.
+        """
+        self._close_part()
+        self.part += 1
+        self.logger.info(f"[OUTPUT] Rotating {self.base_path}. Writing now to {self.current_path}")
+        self._open_part()
+
+    def flush_stream(self) -> int:
+        """
+        Flush the buffer and the compressor, so the file can be read up to the last line written.
+        :return: A duplicate of the file descriptor, to force the data to disk with fsync_descriptors (e.g. from a thread).
+        """
+        self.flush()
+        if self._stream is not self._raw:
+            self._stream.flush()
+        self._raw.flush()
+        return os.dup(self._raw.fileno())
+
+    def checkpoint(self):
+        """
+        Flush the buffer and force the data to disk.
+        """
+        fsync_descriptors([self.flush_stream()])
+
+    def close(self):
+        self.flush()
+        self._close_part()
@@ -0,0 +1,40 @@
+import json
+
+from subdomain_takeover.spiders.utils.aggregate import DomainAggregator
+
+def finding(page: int, parent_domain: str = 'www.site.com') -> dict:
+    return {
+        'script_domain_fld': 'example.net', 'hijackable_domain': 'cdn.example.net', 'hijackable': page == 3,
+        'type': 'JAVASCRIPT', 'parent_domain': parent_domain,
+        'parent_url': f"https://{parent_domain}/{page}", 'embedded_url': 'https://cdn.example.net/lib.js',
+    }
+
+def test_samples_every_link_with_the_same_probability(tmp_path):
+    kept = [0] * 100
+    for trial in range(400):
+        aggregator = DomainAggregator(str(tmp_path / f"domains{trial}.jsonl"), max_samples=10)
+        aggregator._random.seed(trial)
+        for page in range(100):
+            aggregator.add(finding(page))
+        (aggregate,) = aggregator.aggregates.values()
+        assert len(aggregate.samples) == len(set(aggregate.samples)) == 10
+        for parent_url, _ in aggregate.samples:
+            kept[int(parent_url.rsplit('/', 1)[1])] += 1
+        aggregator.writer.close()
+    # 40 times each on average: the first links are not kept more often than the last ones
+    assert 300 < sum(kept[:10]) < 500
+    assert 300 < sum(kept[-10:]) < 500
+
+def test_keeps_a_single_record_per_domain_when_closed(tmp_path):
+    file_path = tmp_path / 'domains.jsonl'
+    aggregator = DomainAggregator(str(file_path), max_samples=2)
+    for page in range(3):
+        aggregator.add(finding(page))
+        aggregator.flush()
+    aggregator.add(finding(3, parent_domain='blog.site.com'))
+    assert len(file_path.read_text().splitlines()) == 3
+    aggregator.close()
+
+    (record,) = [json.loads(line) for line in file_path.read_text().splitlines()]
+    assert (record['links'], record['parent_domains'], record['hijackable'], record['types']) == (4, 2, True, {'JAVASCRIPT': 4})
+    assert len(record['samples']) == 2
@@ -0,0 +1,88 @@
+import gzip
+import io
+import json
+
+from subdomain_takeover.items import LinkType
+from subdomain_takeover.spiders.utils import archives
+from subdomain_takeover.spiders.utils.archives import ArchiveIngester, _dechunk, _iter_har_entries, iter_warc_pages
+
+def har_entry(url: str, html: str) -> dict:
+    return {
+        'request': {'url': url},
+        'response': {'status': 200, 'headers': [{'name': 'Content-Type', 'value': 'text/html'}], 'content': {'mimeType': 'text/html', 'text': html}}
+    }
+
+def write_har(path, entries: list):
+    path.write_text(json.dumps({'log': {'version': '1.2', 'entries': entries}}))
+    return str(path)
+
+def test_every_archived_page_is_sent_once_with_its_sources(tmp_path):
+    archives = [
+        write_har(tmp_path / f"session{i}.har", [
+            har_entry(f"https://www.site{i}.com/{page}", f'<html><script src="https://cdn.site{i}.net/{page}.js"></script></html>')
+            for page in range(3)
+        ])
+        for i in range(2)
+    ]
+    ingester = ArchiveIngester(archives, workers=2, batch_size=2)
+    ingester.start()
+    pages = []
+    try:
+        while (batch := ingester.get()) is not None:
+            pages += batch
+    finally:
+        ingester.close()
+
+    assert sorted(url for url, _ in pages) == sorted(f"https://www.site{i}.com/{page}" for i in range(2) for page in range(3))
+    url, sources = next(page for page in pages if page[0] == 'https://www.site1.com/2')
+    link_type, attrib_name, elements = sources[0]
+    assert (link_type, attrib_name, [element.attrib['src'] for element in elements]) == (LinkType.JAVASCRIPT, 'src', ['https://cdn.site1.net/2.js'])
+    assert (ingester.pages, ingester.failed) == (6, 0)
+
+def test_har_entries_are_read_across_chunks(monkeypatch):
+    monkeypatch.setattr(archives, '_CHUNK_SIZE', 16)
+    entries = [har_entry(f"https://www.example.com/{page}", '<p>"entries": [</p>' * page) for page in range(5)]
+    har = json.dumps({'log': {'creator': {'comment': 'no \\"entries": [] here'}, 'entries': entries}}, indent=1)
+    assert list(_iter_har_entries(io.StringIO(har))) == entries
+    assert list(_iter_har_entries(io.StringIO('{"log": {"entries": []}}'))) == []
+    assert list(_iter_har_entries(io.StringIO('{"log": {}}'))) == []
+
+def test_dechunk_joins_the_chunks_and_ignores_their_extensions():
+    assert _dechunk(b'5\r\nhello\r\n7;ext=1\r\n, world\r\n0\r\n\r\n') == b'hello, world'
+    assert _dechunk(b'') == b''
+
+def warc_record(url: str, http_headers: bytes, body: bytes) -> bytes:
+    payload = b'HTTP/1.1 200 OK\r\n' + http_headers + b'\r\n' + body
+    return (
+        f"WARC/1.0\r\nWARC-Type: response\r\nWARC-Target-URI: <{url}>\r\n"
+        f"Content-Type: application/http; msgtype=response\r\nContent-Length: {len(payload)}\r\n\r\n"
+    ).encode() + payload + b'\r\n\r\n'
+
+def test_warc_pages_are_decoded_and_the_other_records_skipped(tmp_path):
+    html = b'<html><script src="https://cdn.example.net/lib.js"></script></html>'
+    compressed = gzip.compress(html)
+    chunked = b'%x\r\n%s\r\n0\r\n\r\n' % (len(compressed), compressed)
+    path = tmp_path / 'crawl.warc'
+    path.write_bytes(
+        warc_record('https://www.example.com/', b'Content-Type: text/html\r\nTransfer-Encoding: chunked\r\nContent-Encoding: gzip\r\n', chunked) +
+        warc_record('https://www.example.com/logo.png', b'Content-Type: image/png\r\n', b'\x89PNG') +
+        warc_record('https://www.example.com/big', b'Content-Type: text/html\r\n', b'<html>' + b' ' * 1000 + b'</html>')
+    )
+    skipped = [0]
+    pages = list(iter_warc_pages(str(path), max_page_bytes=500, skipped=skipped))
+    assert [(page.url, page.body) for page in pages] == [('https://www.example.com/', html)]
+    assert skipped == [2]
+
+def test_an_archive_given_twice_is_read_once(tmp_path):
+    archive = write_har(tmp_path / 'session.har', [har_entry('https://www.example.com/', '<html></html>')])
+    assert archives.expand_archives([archive, str(tmp_path), str(tmp_path / '.' / 'session.har')]) == [archive]
+
+    ingester = ArchiveIngester([archive, str(tmp_path)], workers=2)
+    ingester.start()
+    pages = []
+    try:
+        while (batch := ingester.get()) is not None:
+            pages += batch
+    finally:
+        ingester.close()
+    assert [url for url, _ in pages] == ['https://www.example.com/']
@@ -0,0 +1,85 @@
+import logging
+import os
+from types import SimpleNamespace
+
+import pytest
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from scrapy.settings import Settings
+from scrapy.utils.request import RequestFingerprinter
+
+from subdomain_takeover.spiders.utils.cache import DeduplicatedCacheStorage
+
+@pytest.fixture
+def spider():
+    return SimpleNamespace(name='takeover', crawler=SimpleNamespace(request_fingerprinter=RequestFingerprinter()), logger=logging.getLogger('test-cache'))
+
+def open_storage(tmp_path, spider, compression='gzip') -> DeduplicatedCacheStorage:
+    storage = DeduplicatedCacheStorage(Settings({'HTTPCACHE_DIR': str(tmp_path), 'HTTPCACHE_COMPRESSION': compression}))
+    storage.open_spider(spider)
+    return storage
+
+def store(storage, spider, url: str, body: bytes):
+    request = Request(url)
+    storage.store_response(spider, request, HtmlResponse(url, body=body, headers={'Content-Type': 'text/html'}))
+    return request
+
+def test_bodies_are_stored_once_and_read_with_their_own_compression(tmp_path, spider):
+    storage = open_storage(tmp_path, spider, 'gzip')
+    first = store(storage, spider, 'https://www.example.com/a', b'<html>parked</html>')
+    second = store(storage, spider, 'https://www.example.net/a', b'<html>parked</html>')
+    assert storage.index.execute('SELECT COUNT(*) FROM bodies').fetchone() == (1,)
+    storage.close_spider(spider)
+
+    storage = open_storage(tmp_path, spider, None)
+    third = store(storage, spider, 'https://www.example.org/', b'<html>other</html>')
+    assert storage.retrieve_response(spider, first).body == b'<html>parked</html>'
+    assert storage.retrieve_response(spider, second).body == b'<html>parked</html>'
+    assert storage.retrieve_response(spider, third).body == b'<html>other</html>'
+    storage.close_spider(spider)
+
+def test_an_unreadable_body_is_dropped_with_its_entries(tmp_path, spider):
+    storage = open_storage(tmp_path, spider)
+    first = store(storage, spider, 'https://www.example.com/a', b'<html>parked</html>')
+    second = store(storage, spider, 'https://www.example.net/a', b'<html>parked</html>')
+    (body_hash,) = storage.index.execute('SELECT hash FROM bodies').fetchone()
+    with open(storage._body_path(body_hash), 'wb') as f:
+        f.write(b'not gzip')
+
+    assert storage.retrieve_response(spider, first) is None
+    assert storage.retrieve_response(spider, second) is None
+    assert (storage.entries, storage.total_size) == (0, 0)
+
+    store(storage, spider, 'https://www.example.com/a', b'<html>parked</html>')
+    assert storage.retrieve_response(spider, first).body == b'<html>parked</html>'
+    storage.close_spider(spider)
+
+def add_orphans(storage) -> str:
+    orphan = os.path.join(storage.blobs_dir, 'ab', 'ab' + '0' * 62)
+    os.makedirs(os.path.dirname(orphan), exist_ok=True)
+    for path in (orphan, orphan + '.tmp'):
+        with open(path, 'wb') as f:
+            f.write(b'written before a crash')
+    return orphan
+
+def test_bodies_missing_from_the_index_are_removed_after_a_crash(tmp_path, spider):
+    storage = open_storage(tmp_path, spider)
+    request = store(storage, spider, 'https://www.example.com/', b'<html>kept</html>')
+    # The process dies without closing the storage
+    storage.index.commit()
+    storage.index.close()
+    orphan = add_orphans(storage)
+
+    storage = open_storage(tmp_path, spider)
+    assert not os.path.exists(orphan) and not os.path.exists(orphan + '.tmp')
+    assert storage.retrieve_response(spider, request).body == b'<html>kept</html>'
+    storage.close_spider(spider)
+
+def test_the_bodies_are_not_listed_after_a_clean_shutdown(tmp_path, spider):
+    storage = open_storage(tmp_path, spider)
+    storage.close_spider(spider)
+    orphan = add_orphans(storage)
+
+    storage = open_storage(tmp_path, spider)
+    assert os.path.exists(orphan)
+    storage.close_spider(spider)
@@ -0,0 +1,83 @@
+import sqlite3
+
+import pytest
+
+from subdomain_takeover.items import JsLink, LinkType
+from subdomain_takeover.spiders.utils.database import CHANGE_GONE, CHANGE_NEW, CHANGE_VERDICT, TakeoverDatabase, row_to_item
+
+def make_item(parent_url: str, embedded_url: str, fld: str, hijackable: bool) -> JsLink:
+    item = JsLink()
+    item['parent_url'] = parent_url
+    item['parent_domain'] = 'www.example.com'
+    item['hijackable_domain'] = fld
+    item['embedded_url'] = embedded_url
+    item['script_domain_fld'] = fld
+    item['hijackable'] = hijackable
+    item['cname_hijackable'] = False
+    item['type'] = LinkType.JAVASCRIPT
+    return item
+
+def run(db_file: str, items: list) -> int:
+    database = TakeoverDatabase({'DATABASE_FILE': db_file})
+    run_id = database.start_run()
+    for item in items:
+        database.save_item_to_database(item)
+    database.finish_run()
+    database.close()
+    return run_id
+
+def changes(db_file: str, since_run: int, gone: bool = False) -> dict:
+    database = TakeoverDatabase({'DATABASE_FILE': db_file}, read_only=True)
+    try:
+        return {row_to_item(row)['script_domain_fld']: row[8] for row in database.iter_changes(since_run, gone)}
+    finally:
+        database.close()
+
+def test_changes_report_new_findings_verdict_changes_and_gone_findings(tmp_path):
+    db_file = str(tmp_path / 'takeover.db')
+    first = run(db_file, [
+        make_item('https://www.example.com/', 'https://cdn.a.com/lib.js', 'a.com', False),
+        make_item('https://www.example.com/', 'https://cdn.b.com/lib.js', 'b.com', True),
+    ])
+    run(db_file, [
+        make_item('https://www.example.com/', 'https://cdn.a.com/lib.js', 'a.com', True),
+        make_item('https://www.example.com/', 'https://cdn.c.com/lib.js', 'c.com', False),
+    ])
+    assert changes(db_file, first) == {'a.com': CHANGE_VERDICT, 'c.com': CHANGE_NEW}
+    assert changes(db_file, first, gone=True) == {'a.com': CHANGE_VERDICT, 'c.com': CHANGE_NEW, 'b.com': CHANGE_GONE}
+
+    database = TakeoverDatabase({'DATABASE_FILE': db_file}, read_only=True)
+    assert [row_to_item(row)['hijackable'] for row in database.iter_parent_findings('www.example.com')] == [True, True, False]
+    database.close()
+
+def test_unchanged_findings_are_not_reported(tmp_path):
+    db_file = str(tmp_path / 'takeover.db')
+    items = [make_item('https://www.example.com/', 'https://cdn.a.com/lib.js', 'a.com', False)]
+    first = run(db_file, items)
+    run(db_file, items)
+    assert changes(db_file, first, gone=True) == {}
+
+def test_read_only_does_not_create_the_database(tmp_path):
+    db_file = tmp_path / 'missing.db'
+    with pytest.raises(FileNotFoundError):
+        TakeoverDatabase({'DATABASE_FILE': str(db_file)}, read_only=True)
+    assert not db_file.exists()
+
+def test_upgrades_the_databases_of_older_versions(tmp_path):
+    db_file = str(tmp_path / 'takeover.db')
+    connection = sqlite3.connect(db_file)
+    connection.execute('''
+        CREATE TABLE js_links (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, parent_url TEXT, parent_domain TEXT, hijackable_domain TEXT,
+            hijackable BOOLEAN, embedded_url TEXT, domain_embedding TEXT, cname_hijackable BOOLEAN,
+            hijackable_fld BOOLEAN, type INTEGER
+        )
+    ''')
+    connection.execute("INSERT INTO js_links (parent_url, embedded_url, hijackable, type) VALUES ('https://www.example.com/', 'https://cdn.a.com/lib.js', 0, 1)")
+    connection.commit()
+    connection.close()
+    with pytest.raises(ValueError):
+        TakeoverDatabase({'DATABASE_FILE': db_file}, read_only=True)
+
+    run(db_file, [make_item('https://www.example.com/', 'https://cdn.a.com/lib.js', 'a.com', True)])
+    assert changes(db_file, 0) == {'a.com': CHANGE_VERDICT}
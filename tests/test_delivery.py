@@ -0,0 +1,124 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from subdomain_takeover.spiders.utils.delivery import WebhookDeliveryQueue
+from subdomain_takeover.spiders.utils.discord import TakeoverDiscordBot
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        server = self.server
+        with server.lock:
+            server.posts.append((time.monotonic(), body))
+            status, headers, delay = server.responses.pop(0) if server.responses else server.default
+        time.sleep(delay)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+@pytest.fixture
+def webhook():
+    """
+    Local webhook answering with the scripted (status, headers, delay) of server.responses, then server.default.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _WebhookHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.posts = []
+    server.responses = []
+    server.default = (204, {}, 0)
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/webhook"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def make_queue(webhook, tmp_path, **kwargs) -> WebhookDeliveryQueue:
+    options = dict(batch_secs=0.05, max_retries=2, backoff_secs=0.01, timeout=2, spool_file=str(tmp_path / 'spool.jsonl'))
+    options.update(kwargs)
+    return WebhookDeliveryQueue(webhook.url, 'bot', **options)
+
+def read_spool(tmp_path) -> list:
+    with open(tmp_path / 'spool.jsonl') as f:
+        return [json.loads(line) for line in f]
+
+def test_batches_the_embeds_in_one_message(webhook, tmp_path):
+    delivery = make_queue(webhook, tmp_path, batch_secs=0.5)
+    for i in range(3):
+        delivery.put({'title': i})
+    delivery.close()
+    assert [body['embeds'] for _, body in webhook.posts] == [[{'title': 0}, {'title': 1}, {'title': 2}]]
+    assert delivery.delivered == 3
+
+def test_waits_for_retry_after_when_rate_limited(webhook, tmp_path):
+    webhook.responses = [(429, {'Retry-After': '0.3'}, 0)]
+    delivery = make_queue(webhook, tmp_path)
+    delivery.put({'title': 'takeover'})
+    delivery.close()
+    assert len(webhook.posts) == 2
+    assert webhook.posts[1][0] - webhook.posts[0][0] >= 0.3
+    assert delivery.delivered == 1
+    assert not (tmp_path / 'spool.jsonl').exists()
+
+def test_spools_and_resends_the_undelivered_messages(webhook, tmp_path):
+    webhook.default = (500, {}, 0)
+    delivery = make_queue(webhook, tmp_path, max_retries=1)
+    delivery.put({'title': 'takeover'})
+    delivery.close()
+    assert len(webhook.posts) == 2
+    assert read_spool(tmp_path) == [{'title': 'takeover'}]
+
+    webhook.default = (204, {}, 0)
+    delivery = make_queue(webhook, tmp_path)
+    delivery.start()
+    delivery.close()
+    assert webhook.posts[-1][1]['embeds'] == [{'title': 'takeover'}]
+    assert not (tmp_path / 'spool.jsonl').exists()
+
+def test_spooled_messages_are_kept_until_they_are_delivered_or_spooled_again(webhook, tmp_path):
+    (tmp_path / 'spool.jsonl').write_text(json.dumps({'title': 'spooled'}) + '\n')
+    webhook.default = (500, {}, 0.3)
+    delivery = make_queue(webhook, tmp_path, max_retries=0)
+    delivery.start()
+    # Still there if the process dies while sending them
+    assert read_spool(tmp_path) == [{'title': 'spooled'}]
+    delivery.put({'title': 'new'})
+    delivery.close()
+    assert sorted(embed['title'] for embed in read_spool(tmp_path)) == ['new', 'spooled']
+
+def test_close_timeout_spools_the_queue_without_duplicating_the_message_in_flight(webhook, tmp_path):
+    # The first message is delivered after the close timeout, the second one is still queued
+    webhook.responses = [(204, {}, 0.5)]
+    delivery = make_queue(webhook, tmp_path, batch_secs=0)
+    delivery.put({'title': 'in flight'})
+    time.sleep(0.1)
+    delivery.put({'title': 'queued'})
+    delivery.close(timeout=0.1)
+    assert [body['embeds'] for _, body in webhook.posts] == [[{'title': 'in flight'}]]
+    assert read_spool(tmp_path) == [{'title': 'queued'}]
+
+def test_delivers_again_after_a_close_timeout(webhook, tmp_path):
+    webhook.responses = [(204, {}, 0.5)]
+    delivery = make_queue(webhook, tmp_path, batch_secs=0)
+    delivery.put({'title': 'slow'})
+    time.sleep(0.1)
+    delivery.close(timeout=0.1)
+    delivery.put({'title': 'next run'})
+    delivery.close()
+    assert webhook.posts[-1][1]['embeds'] == [{'title': 'next run'}]
+
+def test_an_empty_webhook_disables_the_notifications():
+    discord = TakeoverDiscordBot(webhook_url='')
+    discord.notify_status('Started', 'seeds.txt', 0, 0, 0)
+    discord.notify_takeover('Takeover', {})
+    discord.close()
+    assert discord.queue is None
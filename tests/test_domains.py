@@ -0,0 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import tldextract
+
+from subdomain_takeover.spiders.utils import domains
+
+def test_the_extractor_is_built_once_by_concurrent_threads(tmp_path, monkeypatch):
+    built = []
+
+    class CountingExtract(tldextract.TLDExtract):
+        def __init__(self, *args, **kwargs):
+            built.append(1)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(tldextract, 'TLDExtract', CountingExtract)
+    domains.configure(cache_dir=str(tmp_path))
+    try:
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            flds = list(pool.map(domains.get_fld, [f"https://www.site{i}.co.uk/" for i in range(200)]))
+    finally:
+        domains.configure()
+    assert flds == [f"site{i}.co.uk" for i in range(200)]
+    assert len(built) == 1
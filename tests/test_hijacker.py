@@ -0,0 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.stubs import VerificationLog, start_dns
+from subdomain_takeover.spiders.utils.hijacker import DomainHijacker
+from subdomain_takeover.spiders.utils.metrics import metrics
+
+@pytest.fixture
+def dns():
+    server, resolver, port = start_dns(VerificationLog(), delay=0.01)
+    yield resolver, port
+    server.stop()
+
+def test_counts_the_dns_cache_hits_and_misses_of_concurrent_queries(dns):
+    resolver, port = dns
+    hijacker = DomainHijacker(dns_server='127.0.0.1', dns_port=port, dns_timeout=2, dns_cache_size=1000)
+    names = [f"www.benchsite{i % 50}.com" for i in range(1000)]
+    hits = metrics.counters.get('dns_cache_hits', 0)
+    misses = metrics.counters.get('dns_cache_misses', 0)
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(hijacker._query_dns, names))
+
+    # Every lookup sent to the server is a miss, and every other query a hit
+    assert metrics.counters['dns_cache_misses'] - misses == resolver.queries
+    assert metrics.counters['dns_cache_hits'] - hits == len(names) - resolver.queries
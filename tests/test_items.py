@@ -0,0 +1,28 @@
+import pickle
+
+from subdomain_takeover.items import Finding, JsLink, LinkType, item_to_dict
+
+def make_item(parent_url: str) -> JsLink:
+    item = JsLink()
+    item['parent_url'] = parent_url
+    item['parent_domain'] = 'www.example.com'
+    item['hijackable_domain'] = 'cdn.example.net'
+    item['script_domain_fld'] = ''.join(['example', '.net'])
+    item['embedded_url'] = 'https://cdn.example.net/lib.js'
+    item['hijackable'] = True
+    item['cname_hijackable'] = False
+    item['type'] = LinkType.IFRAME
+    return item
+
+def test_findings_convert_back_to_the_same_jslink():
+    item = make_item('https://www.example.com/')
+    finding = Finding.from_jslink(item)
+    assert (finding.flags, finding.link_type) == (Finding.HIJACKABLE, LinkType.IFRAME.value)
+    assert item_to_dict(finding.to_jslink()) == item_to_dict(item)
+    assert pickle.loads(pickle.dumps(finding)) == finding
+
+def test_the_strings_repeated_across_findings_are_stored_once():
+    first, second = (Finding.from_jslink(make_item(f"https://www.example.com/{page}")) for page in range(2))
+    assert first.script_domain_fld is second.script_domain_fld
+    assert first.embedded_url is second.embedded_url
+    assert first.parent_url is not second.parent_url
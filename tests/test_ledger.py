@@ -0,0 +1,32 @@
+from subdomain_takeover.spiders.utils.ledger import LEDGER_SEPARATOR, NotificationLedger, legacy_fld
+
+def finding(parent_domain: str, hijackable_domain: str, script_domain_fld: str) -> dict:
+    return {'parent_domain': parent_domain, 'hijackable_domain': hijackable_domain, 'script_domain_fld': script_domain_fld}
+
+def test_legacy_entries_take_the_fld_of_the_cname_pointer():
+    assert legacy_fld('cdn.example.net') == 'example.net'
+    assert legacy_fld('assets.example.com (x.gone-bucket.org)') == 'gone-bucket.org'
+
+def test_reads_the_entries_written_by_older_versions(tmp_path):
+    file_path = tmp_path / 'notifications.txt'
+    file_path.write_text('\n'.join([
+        LEDGER_SEPARATOR.join(['www.site.com', 'cdn.example.net']),
+        LEDGER_SEPARATOR.join(['www.site.com', 'assets.site.com (x.gone-bucket.org)']),
+        'truncated line',
+    ]) + '\n')
+
+    ledger = NotificationLedger(str(file_path), dedup_key='fld')
+    ledger.open()
+    assert len(ledger) == 2
+    assert finding('www.other.com', 'static.example.net', 'example.net') in ledger
+    assert finding('www.other.com', 'y.gone-bucket.org', 'gone-bucket.org') in ledger
+    ledger.add(finding('www.other.com', 'new.example.org', 'example.org'))
+    ledger.close()
+
+    ledger = NotificationLedger(str(file_path), dedup_key='domains')
+    ledger.open()
+    assert finding('www.site.com', 'cdn.example.net', 'example.net') in ledger
+    assert finding('www.other.com', 'new.example.org', 'example.org') in ledger
+    assert finding('www.other.com', 'cdn.example.net', 'example.net') not in ledger
+    ledger.close()
+    assert file_path.read_text().splitlines()[-1] == LEDGER_SEPARATOR.join(['www.other.com', 'new.example.org', 'example.org'])
@@ -0,0 +1,93 @@
+import logging
+import time
+from types import SimpleNamespace
+
+import scrapy
+import scrapy_user_agents.middlewares
+from scrapy import Request
+from scrapy.core.downloader import Slot
+from scrapy.exceptions import IgnoreRequest
+from scrapy.settings import Settings
+from scrapy.statscollectors import MemoryStatsCollector
+from twisted.internet.defer import Deferred
+
+from subdomain_takeover.middlewares import DomainDeadlineMiddleware, RandomUserAgentMiddleware, SeedOffsiteMiddleware
+
+def make_middleware() -> SeedOffsiteMiddleware:
+    return SeedOffsiteMiddleware(stats=None)
+
+def test_offsite_filter_allows_the_seed_domains_and_their_subdomains():
+    middleware = make_middleware()
+    spider = SimpleNamespace(allowed_domains={'www.example.com', 'example.org'})
+    middleware.spider_opened(spider)
+    follows = lambda url: middleware.should_follow(Request(url), spider)
+    assert follows('https://www.example.com/page')
+    assert follows('https://static.www.example.com:8443/lib.js')
+    assert follows('https://example.org/') and follows('https://cdn.example.org/')
+    assert not follows('https://example.com/')
+    assert not follows('https://www.example.com.evil.net/')
+    assert not follows('https://notexample.org/')
+
+def test_offsite_filter_sees_the_seeds_allowed_after_the_spider_opened():
+    middleware = make_middleware()
+    spider = SimpleNamespace(allowed_domains=set())
+    middleware.spider_opened(spider)
+    spider.allowed_domains.add('www.example.com')
+    assert middleware.should_follow(Request('https://www.example.com/'), spider)
+    assert not middleware.should_follow(Request('https://www.example.net/'), spider)
+
+def test_user_agents_are_picked_by_the_library_from_the_grouped_snapshot(tmp_path):
+    ua_file = tmp_path / 'uas.txt'
+    ua_file.write_text('\n'.join([
+        'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/44.0.2403.157 Safari/537.36',
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/60.0.3112.113 Safari/537.36',
+        'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/60.0.3112.90 Safari/537.36',
+        'Mozilla/5.0 (Windows NT 6.1; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/60.0.3112.90 Safari/537.36',
+    ]))
+    crawler = SimpleNamespace(settings=Settings({'RANDOM_UA_FILE': str(ua_file), 'SNAPSHOTS_DIR': str(tmp_path / 'data')}))
+    expected = scrapy_user_agents.middlewares.RandomUserAgentMiddleware(crawler).ua_picker.uas_list
+
+    # Grouped and saved on the first start, then read from the snapshot
+    assert RandomUserAgentMiddleware(crawler).ua_picker.uas_list == expected
+    assert (tmp_path / 'data' / 'user_agents.json').exists()
+    assert RandomUserAgentMiddleware(crawler).ua_picker.uas_list == expected
+
+def enqueue(slot: Slot, url: str) -> tuple:
+    """
+    Queue a request in the slot like Downloader._enqueue_request.
+    """
+    request = Request(url)
+    slot.active.add(request)
+    deferred = Deferred().addBoth(lambda result: slot.active.remove(request) or result)
+    results = []
+    deferred.addErrback(lambda failure: results.append(failure.value))
+    slot.queue.append((request, deferred))
+    return request, results
+
+def test_requests_of_expired_flds_are_removed_from_the_downloader_queues(tmp_path):
+    # The scan relies on the private queues of the downloader slots: check it again when upgrading Scrapy
+    assert scrapy.version_info[:2] == (2, 13)
+    slot = Slot(concurrency=1, delay=0, randomize_delay=False)
+    settings = Settings()
+    crawler = SimpleNamespace(settings=settings, engine=SimpleNamespace(downloader=SimpleNamespace(slots={'slot': slot})))
+    crawler.stats = MemoryStatsCollector(crawler)
+    spider = SimpleNamespace(logger=logging.getLogger(__name__), run_expired=False, trap_detector=None)
+    middleware = DomainDeadlineMiddleware(crawler, 10, 0, str(tmp_path / 'deferred_urls.txt'), 0)
+    middleware.spider_opened(spider)
+    middleware.fld_started = {'expired.com': time.monotonic() - 20, 'fresh.com': time.monotonic()}
+
+    queue = slot.queue
+    expired = [enqueue(slot, f"https://www.expired.com/{page}") for page in range(2)]
+    waiting = [enqueue(slot, 'https://www.fresh.com/'), enqueue(slot, 'https://www.unseen.org/')]
+    slot.queue.rotate(1)
+    middleware._defer_waiting_requests(spider)
+    middleware.spider_closed(spider, 'finished')
+
+    assert slot.queue is queue
+    assert [request for request, _ in slot.queue] == [waiting[1][0], waiting[0][0]]
+    assert slot.active == {request for request, _ in waiting}
+    assert all(isinstance(results[0], IgnoreRequest) for _, results in expired)
+    # Only queued: its budget does not start
+    assert 'unseen.org' not in middleware.fld_started
+    assert (tmp_path / 'deferred_urls.txt').read_text().split() == ['https://www.expired.com/0', 'https://www.expired.com/1']
+    assert crawler.stats.get_value('deadlines/requests_deferred') == 2
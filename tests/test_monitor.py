@@ -0,0 +1,46 @@
+import sqlite3
+
+from subdomain_takeover.spiders.utils.monitor import PageStateStore
+
+def urls(db_name: str) -> list:
+    store = PageStateStore(db_name)
+    try:
+        return list(store.iter_urls())
+    finally:
+        store.close()
+
+def test_drops_the_pages_not_checked_by_several_finished_runs(tmp_path):
+    db_name = str(tmp_path / 'monitor.db')
+    store = PageStateStore(db_name, max_missed_runs=2)
+    store.save_validators('https://www.example.com/', '"v1"', None)
+    store.save_validators('https://www.example.com/gone', '"v1"', None)
+    store.save_embedded_hosts('https://www.example.com/', {'cdn.example.net'})
+    assert store.close(finished=True) == 0
+
+    # The first page is revalidated by every run, the second one fails from now on
+    for expired in (0, 1):
+        store = PageStateStore(db_name, max_missed_runs=2)
+        store.not_modified('https://www.example.com/')
+        assert store.close(finished=True) == expired
+    assert urls(db_name) == ['https://www.example.com/']
+
+def test_runs_stopped_early_do_not_count(tmp_path):
+    db_name = str(tmp_path / 'monitor.db')
+    store = PageStateStore(db_name, max_missed_runs=1)
+    store.save_validators('https://www.example.com/', '"v1"', None)
+    store.close(finished=True)
+    store = PageStateStore(db_name, max_missed_runs=1)
+    assert store.close(finished=False) == 0
+    assert urls(db_name) == ['https://www.example.com/']
+
+def test_upgrades_the_state_of_older_versions(tmp_path):
+    db_name = str(tmp_path / 'monitor.db')
+    connection = sqlite3.connect(db_name)
+    connection.execute('CREATE TABLE pages (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, embedded_hosts TEXT, checked_at REAL, changed_at REAL)')
+    connection.execute("INSERT INTO pages (url, etag, checked_at) VALUES ('https://www.example.com/', '\"v1\"', 0)")
+    connection.commit()
+    connection.close()
+
+    store = PageStateStore(db_name, max_missed_runs=1)
+    assert store.validators('https://www.example.com/') == ('"v1"', None)
+    assert store.close(finished=True) == 1
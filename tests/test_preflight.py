@@ -0,0 +1,65 @@
+from dnslib import A, CNAME, DNSRecord, QTYPE, RCODE, RR
+
+from subdomain_takeover.spiders.utils.preflight import DEAD, LIVE, UNKNOWN, SeedPreflight
+
+def answer(host: str, rcode: int = RCODE.NOERROR, records: list = ()) -> DNSRecord:
+    reply = DNSRecord.question(host).reply()
+    reply.header.rcode = rcode
+    for rtype, rdata in records:
+        reply.add_answer(RR(host, rtype, rdata=rdata))
+    return reply
+
+class FakeHijacker:
+    """
+    Hijacker answering the DNS queries from a dict (host -> DNSRecord or exception).
+    """
+    def __init__(self, answers: dict):
+        self.answers = answers
+        self.queried = []
+
+    def _query_dns(self, host: str) -> DNSRecord:
+        self.queried.append(host)
+        result = self.answers[host]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def detect_cnames_hijack(self, parent_url: str, url: str, link_type) -> list:
+        return [{'embedded_url': url, 'cname_hijackable': False}]
+
+def check(answers: dict, urls: list) -> dict:
+    preflight = SeedPreflight(FakeHijacker(answers), concurrency=2)
+    try:
+        return {url: (status, reason, len(items)) for url, status, reason, items in preflight.check(urls)}
+    finally:
+        preflight.close()
+
+def test_only_nxdomain_and_no_address_are_dead():
+    answers = {
+        'live.example.com': answer('live.example.com', records=[(QTYPE.A, A('192.0.2.1'))]),
+        'gone.example.com': answer('gone.example.com', RCODE.NXDOMAIN),
+        'ipv6.example.com': answer('ipv6.example.com'),
+        'servfail.example.com': answer('servfail.example.com', RCODE.SERVFAIL),
+        'refused.example.com': answer('refused.example.com', RCODE.REFUSED),
+        'timeout.example.com': TimeoutError('timed out'),
+    }
+    results = check(answers, [f"https://{host}/" for host in answers])
+    assert results == {
+        'https://live.example.com/': (LIVE, None, 0),
+        'https://gone.example.com/': (DEAD, 'NXDOMAIN', 0),
+        'https://ipv6.example.com/': (DEAD, 'no address', 0),
+        'https://servfail.example.com/': (UNKNOWN, 'SERVFAIL', 0),
+        'https://refused.example.com/': (UNKNOWN, 'REFUSED', 0),
+        'https://timeout.example.com/': (UNKNOWN, 'TimeoutError: timed out', 0),
+    }
+
+def test_ip_addresses_are_live_without_a_query():
+    hijacker = FakeHijacker({})
+    preflight = SeedPreflight(hijacker)
+    assert preflight._check('http://192.0.2.1:8080/') == ('http://192.0.2.1:8080/', LIVE, None, [])
+    assert preflight._check('http://[2001:db8::1]/') == ('http://[2001:db8::1]/', LIVE, None, [])
+    assert hijacker.queried == []
+
+def test_cnames_are_checked_even_if_dead():
+    answers = {'dangling.example.com': answer('dangling.example.com', RCODE.NXDOMAIN, [(QTYPE.CNAME, CNAME('example.azureedge.net'))])}
+    assert check(answers, ['https://dangling.example.com/']) == {'https://dangling.example.com/': (DEAD, 'NXDOMAIN', 1)}
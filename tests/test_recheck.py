@@ -0,0 +1,88 @@
+import json
+
+from subdomain_takeover.items import JsLink, LinkType
+from subdomain_takeover.spiders.utils.database import TakeoverDatabase
+from subdomain_takeover.spiders.utils.recheck import DomainRechecker
+
+class FakeHijacker:
+    """
+    Hijacker answering from the given unregistered domains and dangling CNAMEs (host -> CNAME).
+    """
+    def __init__(self, unregistered: set, cnames: dict):
+        self.unregistered = unregistered
+        self.cnames = cnames
+
+    def is_unregistered(self, domain: str) -> bool:
+        return domain in self.unregistered
+
+    def detect_cnames_hijack(self, parent_url: str, url: str) -> list:
+        host = url.split('/')[2]
+        if host not in self.cnames:
+            return []
+        return [{'hijackable_domain': f"{host} ({self.cnames[host]})", 'cname_hijackable': True}]
+
+def write_findings(output_dir, embedded_urls: list):
+    """
+    Save the findings of a crawl: the safe domain list and the database of the findings.
+    """
+    database = TakeoverDatabase({'DATABASE_FILE': str(output_dir / 'takeover.db')})
+    database.start_run()
+    flds = []
+    for url in embedded_urls:
+        fld = '.'.join(url.split('/')[2].split('.')[-2:])
+        flds.append(fld)
+        item = JsLink(parent_url='https://www.example.com/', parent_domain='www.example.com', hijackable_domain=url.split('/')[2],
+                      embedded_url=url, script_domain_fld=fld, hijackable=False, cname_hijackable=False, type=LinkType.JAVASCRIPT)
+        database.save_item_to_database(item)
+    database.finish_run()
+    database.close()
+    (output_dir / 'safe_domains.txt').write_text(''.join(f"{fld}\n" for fld in dict.fromkeys(flds)))
+
+def make_rechecker(output_dir, hijacker, **kwargs) -> DomainRechecker:
+    database = TakeoverDatabase({'DATABASE_FILE': str(output_dir / 'takeover.db')}, read_only=True)
+    return DomainRechecker(hijacker, database=database, output_dir=str(output_dir), verdicts_file=str(output_dir / 'verdicts.jsonl'), **kwargs)
+
+def read_lines(file_path) -> list:
+    with open(file_path) as f:
+        return [line.strip() for line in f]
+
+def read_diff(rechecker) -> list:
+    with open(rechecker.diff_file) as f:
+        return [json.loads(line) for line in f]
+
+def test_registered_fld_with_a_dangling_host_stays_safe(tmp_path):
+    write_findings(tmp_path, ['https://static.example-cdn.com/lib.js', 'https://www.example-cdn.com/app.js'])
+    hijacker = FakeHijacker(set(), {'static.example-cdn.com': 'example-cdn.azureedge.net'})
+    rechecker = make_rechecker(tmp_path, hijacker)
+    changes = rechecker.run()
+
+    assert read_lines(tmp_path / 'safe_domains.txt') == ['example-cdn.com']
+    assert read_lines(tmp_path / 'hijackable_domains.txt') == []
+    assert [(c['domain'], c['change'], c['hijackable']) for c in changes] == [('example-cdn.com', 'cnames', False)]
+    assert read_diff(rechecker)[0]['cnames'] == ['static.example-cdn.com (example-cdn.azureedge.net)']
+
+def test_reports_the_orphaned_flds_and_the_fixed_cnames(tmp_path):
+    write_findings(tmp_path, ['https://static.example-cdn.com/lib.js', 'https://cdn.gone-cdn.com/lib.js'])
+    hijacker = FakeHijacker(set(), {'static.example-cdn.com': 'example-cdn.azureedge.net'})
+    rechecker = make_rechecker(tmp_path, hijacker)
+    rechecker.run()
+
+    # The domains with dangling CNAMEs are checked again even if their verdict is fresh
+    hijacker = FakeHijacker({'gone-cdn.com'}, {})
+    rechecker = make_rechecker(tmp_path, hijacker)
+    rechecker.load()
+    assert rechecker.due() == ['example-cdn.com']
+    rechecker = make_rechecker(tmp_path, hijacker, max_age_secs=0)
+    changes = rechecker.run()
+
+    assert sorted((c['domain'], c['change']) for c in changes) == [('example-cdn.com', 'cnames'), ('gone-cdn.com', 'orphaned')]
+    assert read_lines(tmp_path / 'safe_domains.txt') == ['example-cdn.com']
+    assert read_lines(tmp_path / 'hijackable_domains.txt') == ['gone-cdn.com']
+
+def test_keeps_the_last_verdict_of_each_domain(tmp_path):
+    write_findings(tmp_path, ['https://cdn.example-cdn.com/lib.js', 'https://cdn.gone-cdn.com/lib.js'])
+    for unregistered in (set(), {'gone-cdn.com'}, {'gone-cdn.com'}):
+        make_rechecker(tmp_path, FakeHijacker(unregistered, {}), max_age_secs=0).run()
+
+    verdicts = [json.loads(line) for line in read_lines(tmp_path / 'verdicts.jsonl')]
+    assert sorted((v['domain'], v['hijackable']) for v in verdicts) == [('example-cdn.com', False), ('gone-cdn.com', True)]
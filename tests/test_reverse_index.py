@@ -0,0 +1,25 @@
+from subdomain_takeover.spiders.utils.reverse_index import FLD_DOMAINS, ReverseIndex, decode_postings, encode_postings
+
+def test_postings_round_trip_as_delta_varints():
+    ids = [1, 2, 127, 128, 300, 16384, 2 ** 40]
+    data = encode_postings(ids)
+    assert decode_postings(data) == ids
+    # Differences under 128 take a single byte
+    assert encode_postings([5, 6, 7]) == bytes([5, 1, 1])
+    assert decode_postings(encode_postings([])) == []
+
+def test_finds_the_parents_of_a_fld_and_of_a_host_across_flushes(tmp_path):
+    index = ReverseIndex(str(tmp_path / 'reverse_index.db'), min_block_ids=2)
+    for flush in range(3):
+        for i in range(4):
+            index.add(f"https://www.site{flush}{i}.com/", f"www.site{flush}{i}.com", 'cdn.example.net', 'example.net')
+        index.add(f"https://blog.site{flush}.com/", f"blog.site{flush}.com", 'static.example.net', 'example.net')
+        index.flush()
+
+    parents = list(index.iter_parents('example.net'))
+    assert len(parents) == len(set(parents)) == 15
+    assert len(index.postings(FLD_DOMAINS, 'example.net')) == 15
+    assert sorted(index.iter_parents('static.example.net')) == ['blog.site0.com', 'blog.site1.com', 'blog.site2.com']
+    assert list(index.iter_parents('static.example.net', urls=True, limit=1)) == [('https://blog.site0.com/', 'blog.site0.com')]
+    assert list(index.iter_parents('unknown.org')) == []
+    index.close()
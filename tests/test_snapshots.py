@@ -0,0 +1,14 @@
+import logging
+
+from subdomain_takeover.spiders.utils.snapshots import PUBLIC_SUFFIX_LIST, RDAP_BOOTSTRAP, check_snapshots, write_snapshot
+
+def test_missing_snapshots_are_reported_at_startup(tmp_path, caplog):
+    with caplog.at_level(logging.WARNING):
+        assert check_snapshots(str(tmp_path)) == [str(tmp_path / PUBLIC_SUFFIX_LIST), str(tmp_path / RDAP_BOOTSTRAP)]
+    assert '--update-snapshots' in caplog.text
+
+    caplog.clear()
+    write_snapshot(str(tmp_path / PUBLIC_SUFFIX_LIST), 'com\n')
+    write_snapshot(str(tmp_path / RDAP_BOOTSTRAP), '{}')
+    assert check_snapshots(str(tmp_path)) == []
+    assert not caplog.text
@@ -0,0 +1,27 @@
+import pytest
+from scrapy.http import HtmlResponse
+from scrapy.settings import Settings
+
+from subdomain_takeover.spiders.takeover import TakeoverSpider
+
+@pytest.fixture
+def spider(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'output').mkdir()
+    (tmp_path / 'seeds.txt').write_text('https://www.example.com/\n')
+    settings = Settings()
+    settings.setmodule('subdomain_takeover.settings')
+    settings.set('DISCORD_WEBHOOK', None)
+    return TakeoverSpider(urls=str(tmp_path / 'seeds.txt'), scrapeops_key='key', settings=settings)
+
+def test_checks_the_host_of_the_pages_requested_through_scrapeops(spider):
+    checked = []
+    spider.hijacker.detect_cnames_hijack = lambda parent_url, link_url, link_type: checked.append((parent_url, link_url)) or []
+    for url in ('https://www.example.com/', 'https://www.example.com/about', 'https://blog.example.org/'):
+        response = HtmlResponse(url=spider.get_scrapeops_url(url), body=b'<html></html>', encoding='utf-8')
+        if spider._claim_parent_host(response):
+            spider._check_parent_host_cname_hijack(response)
+
+    assert spider.checked_hosts >= {'www.example.com', 'blog.example.org'}
+    assert 'proxy.scrapeops.io' not in spider.checked_hosts
+    assert checked == [('https://www.example.com/', 'https://www.example.com/'), ('https://blog.example.org/', 'https://blog.example.org/')]
@@ -0,0 +1,35 @@
+from urllib.parse import urlparse
+
+from subdomain_takeover.spiders.utils.traps import CrawlTrapDetector, url_pattern
+
+def test_url_pattern_replaces_numbers_and_identifiers_and_drops_the_query_values():
+    assert url_pattern(urlparse('https://www.Example.com/events/2024/05?sort=date&page=3')) == ('www.example.com', '/events/{n}/{n}', ('page', 'sort'))
+    assert url_pattern(urlparse('https://www.example.com/s/3f2a9c1e-77b0/cart')) == ('www.example.com', '/s/{id}/cart', ())
+    assert url_pattern(urlparse('https://www.example.com/about-us')) == ('www.example.com', '/about-us', ())
+
+def saturate(detector: CrawlTrapDetector, host: str):
+    # The first page yields a new reference, the next `patience` ones nothing new
+    for day in range(detector.patience + 1):
+        detector.observe(f"https://{host}/calendar/{day}", ['https://cdn.example.net/lib.js'])
+
+def test_saturates_the_patterns_without_new_references():
+    detector = CrawlTrapDetector(patience=3)
+    saturate(detector, 'www.example.com')
+    assert detector.is_trap('example.com', urlparse('https://www.example.com/calendar/99'))
+    assert not detector.is_trap('example.com', urlparse('https://www.example.com/about'))
+
+def test_forgets_the_state_of_a_fld():
+    detector = CrawlTrapDetector(patience=3)
+    saturate(detector, 'www.example.com')
+    detector.forget('example.com')
+    assert not detector.is_trap('example.com', urlparse('https://www.example.com/calendar/99'))
+    assert detector.patterns == {} and detector.references == {} and detector.saturated == {}
+
+def test_keeps_the_state_of_the_flds_observed_last():
+    detector = CrawlTrapDetector(patience=3, max_flds=2)
+    saturate(detector, 'www.a.com')
+    saturate(detector, 'www.b.com')
+    detector.observe('https://www.a.com/', [])
+    saturate(detector, 'www.c.com')
+    assert list(detector.patterns) == ['a.com', 'c.com']
+    assert set(detector.references) == set(detector.saturated) == {'a.com', 'c.com'}
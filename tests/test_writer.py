@@ -0,0 +1,28 @@
+import gzip
+import json
+import os
+
+from subdomain_takeover.spiders.utils.writer import BufferedFileWriter
+
+def test_rotates_the_file_once_it_reaches_max_bytes(tmp_path):
+    writer = BufferedFileWriter(str(tmp_path / 'links.jsonl'), max_bytes=100, flush_items=2)
+    for i in range(10):
+        writer.write_json({'i': i, 'url': 'https://www.example.com/'})
+    writer.close()
+    # Every line is 44 bytes: the parts are rotated after the second flush of two lines
+    assert writer.files == [str(tmp_path / name) for name in ('links.jsonl', 'links.1.jsonl', 'links.2.jsonl')]
+    assert [os.path.getsize(path) for path in writer.files] == [176, 176, 88]
+    lines = [json.loads(line) for path in writer.files for line in open(path)]
+    assert [line['i'] for line in lines] == list(range(10))
+
+def test_compressed_output_is_readable_after_flush_stream(tmp_path):
+    writer = BufferedFileWriter(str(tmp_path / 'links.jsonl'), compression='gzip')
+    writer.write_line('first')
+    writer.checkpoint()
+    # The stream is not finished yet, but every line written so far can be read
+    with gzip.open(writer.current_path, 'rt') as f:
+        assert f.read(6) == 'first\n'
+    writer.write_line('second')
+    writer.close()
+    with gzip.open(str(tmp_path / 'links.jsonl.gz'), 'rt') as f:
+        assert f.read().splitlines() == ['first', 'second']